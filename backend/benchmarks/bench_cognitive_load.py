@@ -0,0 +1,54 @@
+"""
+Benchmark of the cognitive load of the sliding windows of the eyetracker data handler, computed by
+compute_cognitive_load, and by the CognitiveLoad engine that reuses the wavelet coefficients of the
+windows they overlap.
+
+The pupil sizes are random, the windows move by a quarter of their length like the cognitive load handler.
+Prints the mean and the 99th percentile of the milliseconds a window takes with each, and checks that
+they compute the same cognitive load.
+
+Run from the backend folder:
+    python -m benchmarks.bench_cognitive_load --window-lengths 1000 10000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from crunch.eyetracker.measurements import (CognitiveLoad,
+                                            compute_cognitive_load)
+
+
+def measure(measurement_func, lpup, rpup, window_length, window_step):
+    """ The cognitive load of every window, and the seconds every window took """
+    loads, seconds = [], []
+    for start in range(0, len(lpup) - window_length + 1, window_step):
+        window = slice(start, start + window_length)
+        begin = time.perf_counter()
+        loads.append(measurement_func(lpup=lpup[window], rpup=rpup[window]))
+        seconds.append(time.perf_counter() - begin)
+    return np.array(loads), np.array(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--window-lengths", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--windows", type=int, default=400, help="windows measured for every window length")
+    args = parser.parse_args()
+
+    random = np.random.default_rng(0)
+    print(f"{'length':>7} {'function':>10} {'mean ms':>8} {'p99 ms':>8}")
+    for window_length in args.window_lengths:
+        window_step = window_length // 4
+        count = window_length + window_step * (args.windows - 1)
+        lpup, rpup = random.random(count) * 2 + 4, random.random(count) * 2 + 4
+        results = {}
+        for name, measurement_func in [("function", compute_cognitive_load), ("engine", CognitiveLoad())]:
+            results[name], seconds = measure(measurement_func, lpup, rpup, window_length, window_step)
+            print(f"{window_length:7d} {name:>10} {seconds.mean() * 1000:8.3f} "
+                  f"{np.percentile(seconds, 99) * 1000:8.3f}")
+        assert np.array_equal(results["function"], results["engine"])
+
+
+if __name__ == "__main__":
+    main()
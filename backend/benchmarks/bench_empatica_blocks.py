@@ -0,0 +1,83 @@
+"""
+Benchmark of the CPU the empatica pipeline uses with the high rate raw data, the blood volume pulse at 64 Hz
+and the accelerometer at 32 Hz, streamed from the E4 emulator at the rates of the wristband.
+
+The emulator runs in its own process, start_empatica runs the pipelines of the wristbands in this process,
+with every stream subscribed: the EDA measurements gated by the motion artifacts of the accelerometer,
+and the beat to beat intervals detected in the pulse. The pipeline parses the BVP and ACC samples in blocks,
+it is compared with a pipeline that parses them, and sends them to the handlers, one sample at a time.
+Prints the samples a second processed and the fraction of a core the process used, the CPU seconds over
+the wall clock seconds.
+
+Run from the backend folder:
+    python -m benchmarks.bench_empatica_blocks --devices 1 8
+"""
+import argparse
+import multiprocessing
+import time
+from functools import partial
+from unittest.mock import patch
+
+import numpy as np
+
+from benchmarks.bench_empatica_emulator import BenchmarkAPI, serve
+from crunch import offload
+from crunch.empatica import start_empatica
+from crunch.empatica.api import BLOCK_STREAMS
+from crunch.empatica.parser import STREAMS, StreamParser
+
+
+class SampleAPI(BenchmarkAPI):
+    """ Api that parses the samples of the high rate raw data one at a time, and sends them as blocks of one """
+
+    def __init__(self, device_id=None):
+        BenchmarkAPI.__init__(self, device_id)
+        dispatch = {tag: partial(self._receive_sample, name) for tag, name in STREAMS.items()
+                    if name not in BLOCK_STREAMS}
+        dispatch.update({tag: partial(self._receive_row, name) for tag, name in STREAMS.items()
+                         if name in BLOCK_STREAMS})
+        self.parser = StreamParser(dispatch, on_message=self._receive_message, buffer_size=4 * self.bufferSize)
+
+    def _receive_row(self, name, *row):
+        self._receive_block(name, np.array([row]))
+
+
+def run(api, devices, speed, duration):
+    ids = [f"{i:06X}" for i in range(devices)]
+    ports, stats, stop = multiprocessing.Queue(), multiprocessing.Queue(), multiprocessing.Event()
+    emulator = multiprocessing.Process(target=serve, args=(ids, speed, ports, stats, stop))
+    emulator.start()
+
+    api.port = ports.get()
+    api.duration = duration
+    BenchmarkAPI.instances = []
+    wall, cpu = time.perf_counter(), time.process_time()
+    start_empatica(api, device_ids=ids)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    apis = BenchmarkAPI.instances
+    stop.set()
+    stats.get()
+    emulator.join()
+    return sum(api.parser.samples for api in apis) / wall, cpu / wall, max(api.lag for api in apis)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 8], help="numbers of virtual wristbands")
+    parser.add_argument("--speeds", type=float, nargs="+", default=[1, 10],
+                        help="times faster than the wristband the recordings are streamed")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds every run streams")
+    args = parser.parse_args()
+
+    print(f"{'parsing':>8} {'devices':>7} {'speed':>6} {'samples/s':>10} {'cpu':>6} {'lag s':>6}")
+    with patch("crunch.util.write_csv", lambda *args, **kwargs: None):
+        for devices in args.devices:
+            for speed in args.speeds:
+                for name, api in [("samples", SampleAPI), ("blocks", BenchmarkAPI)]:
+                    processed, cpu, lag = run(api, devices, speed, args.duration)
+                    print(f"{name:>8} {devices:7d} {speed:6g} {processed:10.0f} {cpu:6.1%} {lag:6.2f}")
+    offload.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark of the maximum sample rate the empatica pipeline sustains, streamed from the E4 emulator.
+
+The emulator runs in its own process with devices virtual wristbands, start_empatica runs the pipelines of
+the wristbands in this process, like a group session, with one api per wristband on one event loop.
+For every number of wristbands the recordings are streamed faster and faster, and the pipeline keeps up
+when the device timestamps of the samples it receives, the wall clock time the emulator scheduled them,
+stay less than max_lag seconds behind.
+Prints the samples a second offered and processed, the lag at the end of the run, and the highest rate
+the pipeline sustained.
+
+Run from the backend folder:
+    python -m benchmarks.bench_empatica_emulator --devices 1 4 8
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+from unittest.mock import patch
+
+from crunch import offload
+from crunch.empatica import start_empatica
+from crunch.empatica.api import EmpaticaAPI
+from crunch.empatica.emulator import E4Emulator
+
+
+def serve(devices, speed, ports, stats, stop):
+    """ Emulator process, streams until stop is set """
+    async def emulate():
+        emulator = E4Emulator(devices, speed)
+        ports.put(await emulator.start())
+        while not stop.is_set():
+            await asyncio.sleep(0.1)
+        await emulator.stop()
+        stats.put(emulator.stats())
+
+    asyncio.new_event_loop().run_until_complete(emulate())
+
+
+class BenchmarkAPI(EmpaticaAPI):
+    """ Api that streams from the emulator for duration seconds, and then stores how far behind it is """
+    port = None
+    duration = None
+    instances = []
+
+    def __init__(self, device_id=None):
+        EmpaticaAPI.__init__(self, device_id)
+        self.serverPort = self.port
+        self.minBackoff = 0.1
+        self.lag = None
+        self.instances.append(self)
+
+    async def run(self):
+        asyncio.get_event_loop().call_later(self.duration, self.finish)
+        await EmpaticaAPI.run(self)
+
+    def finish(self):
+        now = time.time()
+        self.lag = now - max(self.timestamps.values(), default=now - self.duration)
+        self.stop()
+
+
+def run(devices, speed, duration):
+    ids = [f"{i:06X}" for i in range(devices)]
+    ports, stats, stop = multiprocessing.Queue(), multiprocessing.Queue(), multiprocessing.Event()
+    emulator = multiprocessing.Process(target=serve, args=(ids, speed, ports, stats, stop))
+    emulator.start()
+
+    BenchmarkAPI.port = ports.get()
+    BenchmarkAPI.duration = duration
+    BenchmarkAPI.instances = []
+    start_empatica(BenchmarkAPI, device_ids=ids)
+    apis = BenchmarkAPI.instances
+    stop.set()
+    sent = stats.get()["samples_sent"]
+    emulator.join()
+    return sent / duration, sum(api.parser.samples for api in apis) / duration, max(api.lag for api in apis)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 4, 8], help="numbers of virtual wristbands")
+    parser.add_argument("--speeds", type=float, nargs="+", default=[1, 10, 30, 100, 300, 1000],
+                        help="times faster than real time the recordings are streamed")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds every speed is streamed")
+    parser.add_argument("--max-lag", type=float, default=1.0, help="seconds behind the stream the pipeline may be")
+    args = parser.parse_args()
+
+    print(f"{'devices':>7} {'speed':>6} {'offered/s':>10} {'processed/s':>11} {'lag s':>7} {'keeps up':>8}")
+    with patch("crunch.util.write_csv", lambda *args, **kwargs: None):
+        for devices in args.devices:
+            sustained = 0
+            for speed in args.speeds:
+                offered, processed, lag = run(devices, speed, args.duration)
+                keeps_up = lag < args.max_lag
+                print(f"{devices:7d} {speed:6g} {offered:10.0f} {processed:11.0f} {lag:7.2f} {str(keeps_up):>8}")
+                if not keeps_up:
+                    break
+                sustained = processed
+            print(f"{devices} wristbands sustain {sustained:.0f} samples/s")
+    offload.shutdown()
+
+
+if __name__ == "__main__":
+    main()
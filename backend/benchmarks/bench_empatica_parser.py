@@ -0,0 +1,130 @@
+"""
+Benchmark of the parser of the Empatica stream, the parser that decoded and split every receive into
+strings, as before, against the StreamParser that parses the lines in its reusable buffer.
+
+The recordings of the wristband are interleaved into the lines the E4 streaming server sends, with decimal
+commas, and fed to the parsers in chunks of the size of a receive. Prints the samples and the values parsed
+a second, and the peak memory allocated while parsing a chunk, measured with tracemalloc in a separate pass.
+CPython does not count allocations, the peak of the memory traced by tracemalloc is the closest measure.
+
+The legacy parser only parses the first value of a sample, the StreamParser parses the device timestamp and
+every value, the three axes of the accelerometer too, so it parses more than twice the values.
+
+Run from the backend folder:
+    python -m benchmarks.bench_empatica_parser
+"""
+import argparse
+import csv
+import os
+import time
+import tracemalloc
+
+from crunch.empatica.parser import STREAMS, StreamParser
+
+MOCK_DATA = os.path.join(os.path.dirname(__file__), "..", "tests", "mock_data")
+
+# tag, recording, sampling rate in Hz, and number of values of the samples of every stream
+RECORDINGS = [(b"E4_Gsr", "EDA.csv", 4, 1), (b"E4_Temperature", "TEMP.csv", 4, 1), (b"E4_Hr", "HR.csv", 1, 1),
+              (b"E4_Ibi", "IBI.csv", 1, 1), (b"E4_Bvp", "BVP.csv", 64, 1), (b"E4_Acc", "ACC.csv", 32, 3)]
+
+
+def capture(repeats):
+    """ The lines of the streaming server for the recordings, ordered by their timestamps """
+    lines = []
+    for tag, file_name, rate, width in RECORDINGS:
+        with open(os.path.join(MOCK_DATA, file_name)) as file:
+            rows = [row for row in csv.reader(file)][2:]
+        for i, row in enumerate(rows):
+            values = " ".join(value.strip() for value in row[-width:]).replace(".", ",")
+            timestamp = f"{1600000000 + i / rate:.3f}".replace(".", ",")
+            lines.append((i / rate, tag + b" " + timestamp.encode() + b" " + values.encode() + b"\n"))
+    lines.sort(key=lambda line: line[0])
+    return b"".join(line for _, line in lines) * repeats
+
+
+class LegacyParser:
+    """ The parser of the api before the StreamParser, that also kept the lines split between receives """
+
+    def __init__(self):
+        self.samples = 0
+        self.values = 0
+        self.rest = ""
+
+    def feed(self, data):
+        response = self.rest + data.decode("utf-8")
+        samples = response.split("\n")
+        for i in range(len(samples) - 1):
+            name = samples[i].split()[0]
+            data = float(samples[i].split()[2].replace(',', '.'))
+            if name == "E4_Temperature":
+                self.send("TEMP", data)
+            elif name == "E4_Gsr":
+                self.send("EDA", data)
+            elif name == "E4_Hr":
+                self.send("HR", data)
+            elif name == "E4_Ibi":
+                self.send("IBI", data)
+            elif name == "E4_Bvp":
+                self.send("BVP", data)
+            elif name == "E4_Acc":
+                self.send("ACC", data)
+        self.rest = samples[-1]
+
+    def send(self, name, data):
+        self.samples += 1
+        self.values += 1
+
+
+class CountingParser(StreamParser):
+    def __init__(self, count=False):
+        StreamParser.__init__(self, {tag: self.count if count else self.skip for tag in STREAMS})
+        self.values = 0
+
+    def count(self, *sample):
+        self.values += len(sample)
+
+    def skip(self, *sample):
+        pass
+
+
+def run(parser, chunks):
+    start = time.perf_counter()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return time.perf_counter() - start
+
+
+def peak_memory(parser, chunks):
+    """ Average of the peak memory allocated while parsing a chunk, in bytes """
+    tracemalloc.start()
+    total = 0
+    for chunk in chunks:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        parser.feed(chunk)
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return total / len(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=20, help="times the recordings are streamed")
+    parser.add_argument("--chunk", type=int, default=4096, help="bytes received at a time")
+    args = parser.parse_args()
+
+    data = capture(args.repeats)
+    chunks = [data[i:i + args.chunk] for i in range(0, len(data), args.chunk)]
+    print(f"{len(data) / 1024:.0f} KiB in {len(chunks)} chunks of {args.chunk} bytes")
+    print(f"{'parser':>8} {'samples':>8} {'samples/s':>10} {'values/s':>10} {'peak bytes/chunk':>16}")
+    for name, parser_class, counting in (("legacy", LegacyParser, ()), ("stream", CountingParser, (True,))):
+        best = min(run(parser_class(), chunks) for _ in range(3))
+        counted = parser_class(*counting)
+        run(counted, chunks)
+        memory = peak_memory(parser_class(), chunks)
+        print(f"{name:>8} {counted.samples:8d} {counted.samples / best:10.0f} {counted.values / best:10.0f} "
+              f"{memory:16.0f}")
+
+
+if __name__ == "__main__":
+    main()
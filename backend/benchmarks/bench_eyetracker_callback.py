@@ -0,0 +1,100 @@
+"""
+Benchmark of the time the eyetracker callback takes, with the measurements of the eyetracker pipeline
+run inline on the callback thread, as before, or on the processing thread behind the gaze ring.
+
+A thread plays the eyetracker and calls the callback rate times a second for duration seconds, with the
+handlers of start_eyetracker subscribed. Prints the callback time percentiles, the longest callback, and
+the ring counters.
+
+Run from the backend folder:
+    python -m benchmarks.bench_eyetracker_callback
+"""
+import argparse
+import random
+import time
+from unittest.mock import patch
+
+import numpy as np
+
+from crunch.eyetracker import start_eyetracker
+from crunch.eyetracker.api import EyetrackerAPI
+
+
+class BenchmarkAPI(EyetrackerAPI):
+    """ Api with its own subscribers, the subscribers of EyetrackerAPI are shared by every instance """
+    instances = []
+
+    def __init__(self):
+        EyetrackerAPI.__init__(self)
+        self.subscribers = {"gaze": [], "fixation": []}
+        self.instances.append(self)
+
+
+class InlineAPI(BenchmarkAPI):
+    """ Processes every gaze sample on the callback thread, like the api before the gaze ring """
+
+    def connect(self):
+        pass
+
+    def gaze_data_callback(self, gaze_data):
+        EyetrackerAPI.gaze_data_callback(self, gaze_data)
+        self.process_pending()
+
+
+class RingAPI(BenchmarkAPI):
+    """ Processes the gaze samples on the processing thread """
+
+    def connect(self):
+        self.start_processing()
+
+
+def gaze_samples(count, rate):
+    """ Gaze samples of the eyes resting on a point, and jumping to a new point every half second """
+    samples = []
+    x, y = 0.5, 0.5
+    for i in range(count):
+        if i % (rate // 2) == 0:
+            x, y = random.random(), random.random()
+        samples.append({
+            'device_time_stamp': int(i * 1e6 / rate),
+            'left_gaze_point_on_display_area': (x + random.gauss(0, 0.001), y + random.gauss(0, 0.001)),
+            'right_gaze_point_on_display_area': (x + random.gauss(0, 0.001), y + random.gauss(0, 0.001)),
+            'left_pupil_diameter': random.uniform(3, 4),
+            'right_pupil_diameter': random.uniform(3, 4),
+        })
+    return samples
+
+
+def bench(api_class, samples, rate):
+    with patch("crunch.util.write_csv", lambda *args, **kwargs: None):
+        start_eyetracker(api_class)
+        api = BenchmarkAPI.instances[-1]
+        durations = []
+        start = time.perf_counter()
+        for i, sample in enumerate(samples):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            before = time.perf_counter()
+            api.gaze_data_callback(sample)
+            durations.append(time.perf_counter() - before)
+        api.stop_processing()
+    return np.array(durations) * 1e6, api.gaze_ring.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=int, default=120, help="gaze samples per second")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of gaze samples")
+    args = parser.parse_args()
+
+    samples = gaze_samples(int(args.rate * args.duration), args.rate)
+    print(f"{'processing':>10} {'callback us p50':>15} {'p99':>8} {'max':>9}   ring")
+    for label, api_class in (("inline", InlineAPI), ("thread", RingAPI)):
+        durations, stats = bench(api_class, samples, args.rate)
+        p50, p99 = np.percentile(durations, [50, 99])
+        print(f"{label:>10} {p50:15.1f} {p99:8.1f} {durations.max():9.1f}   {stats}")
+
+
+if __name__ == "__main__":
+    main()
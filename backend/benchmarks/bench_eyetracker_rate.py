@@ -0,0 +1,83 @@
+"""
+Benchmark of the eyetracker pipeline at the gaze output frequencies of the tobii eyetrackers, up to 1200 Hz,
+with the handlers of start_eyetracker subscribed and their windows scaled to the frequency.
+
+A thread plays the eyetracker and calls gaze_data_callback frequency times a second for duration seconds,
+the processing thread sends the gaze samples to the handlers. Prints the fraction of a core the process used,
+the CPU seconds over the wall clock seconds, the gaze samples dropped by the ring and its high watermark,
+and the windows the scheduler shed. The gaze samples a second the processing thread keeps up with, with the
+ring filled beforehand, are the headroom of the frequency.
+
+Run from the backend folder:
+    python -m benchmarks.bench_eyetracker_rate --rates 120 300 600 1200
+"""
+import argparse
+import time
+from unittest.mock import patch
+
+from benchmarks.bench_eyetracker_callback import BenchmarkAPI, gaze_samples
+from crunch.eyetracker import start_eyetracker
+from crunch.eyetracker.api import EyetrackerAPI
+from crunch.spsc import SpscRing
+
+
+class RateAPI(BenchmarkAPI):
+    """ Api that does not connect, the gaze samples are played by the benchmark """
+
+    def connect(self):
+        pass
+
+
+def shed_windows(api):
+    return sum(sum(counts.values()) for counts in api.scheduler.stats()["shed"].values())
+
+
+def paced(rate, samples):
+    """ The cpu fraction, ring counters and shed windows of the gaze samples played at the rate """
+    start_eyetracker(RateAPI)
+    api = BenchmarkAPI.instances[-1]
+    shed = shed_windows(api)
+    api.start_processing()
+    wall, cpu = time.perf_counter(), time.process_time()
+    for i, sample in enumerate(samples):
+        delay = wall + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        api.gaze_data_callback(sample)
+    api.stop_processing()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return cpu / wall, api.gaze_ring.stats(), shed_windows(api) - shed
+
+
+def flooded(samples):
+    """ The gaze samples a second the processing thread sends to the handlers, from a full ring """
+    start_eyetracker(RateAPI)
+    api = BenchmarkAPI.instances[-1]
+    api.gaze_ring = SpscRing(len(samples), 8)
+    for sample in samples:
+        api.gaze_data_callback(sample)
+    start = time.perf_counter()
+    api.process_pending()
+    return len(samples) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rates", type=int, nargs="+", default=[120, 300, 600, 1200],
+                        help="gaze output frequencies")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of gaze samples")
+    args = parser.parse_args()
+
+    print(f"{'Hz':>5} {'cpu':>6} {'dropped':>8} {'watermark':>9} {'shed':>5} {'max samples/s':>14} {'headroom':>8}")
+    with patch("crunch.util.write_csv", lambda *args, **kwargs: None):
+        for rate in args.rates:
+            samples = gaze_samples(int(rate * args.duration), rate)
+            with patch.object(EyetrackerAPI, "frequency", float(rate)):
+                cpu, stats, shed = paced(rate, samples)
+                throughput = flooded(samples)
+            print(f"{rate:5d} {cpu:6.1%} {stats['dropped']:8d} {stats['high_watermark']:9d} {shed:5d} "
+                  f"{throughput:14.0f} {throughput / rate:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
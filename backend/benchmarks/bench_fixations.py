@@ -0,0 +1,75 @@
+"""
+Benchmark of the fixation detection of recorded gaze, inserted gaze sample by gaze sample in the detectors
+of the eyetracker api, by velocity (ivt) or by dispersion (idt), or detected in one go from the arrays of
+the recording with detect_fixations, by velocity.
+
+The recording is synthetic: the eyes rest on a random point of the screen for 100 to 600 milliseconds,
+with noise, and blink for 100 to 300 milliseconds every few seconds. Prints the seconds and the gaze
+samples a second of each, the best of repeats runs, and checks that the velocity detections detect the
+same fixations.
+
+Run from the backend folder:
+    python -m benchmarks.bench_fixations --minutes 60
+"""
+import argparse
+import time
+
+import numpy as np
+
+from crunch.eyetracker.fixation import (DispersionFixationdata,
+                                        GazedataToFixationdata,
+                                        detect_fixations)
+
+
+def recording(minutes, rate, seed=0):
+    """ The left and right fx and fy, and the device timestamps in microseconds, of a synthetic recording """
+    random = np.random.default_rng(seed)
+    count = int(minutes * 60 * rate)
+    durations = random.integers(int(0.1 * rate), int(0.6 * rate), count // int(0.1 * rate) + 1)
+    targets = np.repeat(random.random((len(durations), 2)), durations, axis=0)[:count]
+    left = targets + random.normal(0, 0.001, targets.shape)
+    right = targets + random.normal(0, 0.001, targets.shape)
+    for start in random.integers(0, count, int(minutes * 20)):
+        left[start:start + random.integers(int(0.1 * rate), int(0.3 * rate))] = np.nan
+        right[start:start + random.integers(int(0.1 * rate), int(0.3 * rate))] = np.nan
+    timestamps = np.arange(count) * 1e6 / rate
+    return left[:, 0], left[:, 1], right[:, 0], right[:, 1], timestamps
+
+
+def streamed(gaze, detector):
+    fixations = []
+    for sample in zip(*[column.tolist() for column in gaze]):
+        fixation = detector.insert_new_gaze_data(*sample)
+        if fixation is not None:
+            fixations.append(fixation)
+    return fixations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=60.0, help="minutes of gaze in the recording")
+    parser.add_argument("--rate", type=int, default=120, help="gaze samples a second")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    gaze = recording(args.minutes, args.rate)
+    print(f"{len(gaze[0])} gaze samples, {args.minutes:g} minutes at {args.rate} Hz")
+    results = {}
+    detections = [("ivt", lambda gaze: streamed(gaze, GazedataToFixationdata())),
+                  ("idt", lambda gaze: streamed(gaze, DispersionFixationdata())),
+                  ("batch", lambda gaze: detect_fixations(*gaze))]
+    for name, detect in detections:
+        seconds = float("inf")
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            results[name] = detect(gaze)
+            seconds = min(seconds, time.perf_counter() - start)
+        print(f"{name:>8}: {seconds:8.3f} sec, {len(gaze[0]) / seconds:12.0f} gaze samples/s, "
+              f"{len(results[name])} fixations")
+    assert len(results["batch"]) == len(results["ivt"])
+    assert np.allclose([list(fixation.values()) for fixation in results["batch"]],
+                       [list(fixation.values()) for fixation in results["ivt"]])
+
+
+if __name__ == "__main__":
+    main()
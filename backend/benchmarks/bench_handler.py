@@ -0,0 +1,102 @@
+"""
+Benchmark of the data handler storage, the NumPy ring buffers against the deques they replaced.
+
+For a number, a dictionary and a skeleton data point, the benchmark measures the memory kept by a
+full window, the time to store a data point, and the time to hand a window to the measurement
+function: list(deque) before, a view of the ring buffer now.
+
+Run from the backend folder:
+    python -m benchmarks.bench_handler
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from collections import deque
+
+from crunch.ringbuffer import RingBuffer
+
+# window lengths as configured in the device main.py files
+CASES = {
+    "eda (number)": (121, lambda: random.random()),
+    "gaze (dictionary)": (1000, lambda: {"lpup": random.uniform(3, 4), "rpup": random.uniform(3, 4)}),
+    "body (25 joints)": (20, lambda: [(random.uniform(0, 1920), random.uniform(0, 1080)) for _ in range(25)]),
+}
+
+
+class DequeStorage:
+    """ The storage of the handlers before the ring buffers """
+
+    def __init__(self, window_length, keys):
+        self.queues = {key: deque(maxlen=window_length) for key in keys}
+
+    def append(self, datapoint):
+        if None in self.queues:
+            self.queues[None].append(datapoint)
+        else:
+            for key, value in datapoint.items():
+                self.queues[key].append(value)
+
+    def window(self):
+        return {key: list(queue) for key, queue in self.queues.items()}
+
+
+class RingStorage:
+    """ The storage of the handlers with the ring buffers """
+
+    def __init__(self, window_length, keys):
+        self.buffers = {key: RingBuffer(window_length) for key in keys}
+
+    def append(self, datapoint):
+        if None in self.buffers:
+            self.buffers[None].append(datapoint)
+        else:
+            for key, value in datapoint.items():
+                self.buffers[key].append(value)
+
+    def window(self):
+        return {key: buffer.view() for key, buffer in self.buffers.items()}
+
+
+def bench(storage_class, window_length, make_datapoint, repeats):
+    first = make_datapoint()
+    keys = list(first) if isinstance(first, dict) else [None]
+    datapoints = [make_datapoint() for _ in range(window_length * 4)]
+
+    # memory kept by a full window, the data points are created as the apis create them
+    tracemalloc.start()
+    storage = storage_class(window_length, keys)
+    for _ in range(window_length):
+        storage.append(make_datapoint())
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for datapoint in datapoints:
+            storage.append(datapoint)
+    append_time = (time.perf_counter() - start) / (repeats * len(datapoints))
+
+    start = time.perf_counter()
+    for _ in range(repeats * 10):
+        storage.window()
+    window_time = (time.perf_counter() - start) / (repeats * 10)
+    return memory, append_time, window_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'data point':>18} {'window':>6} {'storage':>7} {'memory KiB':>10} "
+          f"{'store us/point':>14} {'window us':>9}")
+    for name, (window_length, make_datapoint) in CASES.items():
+        for label, storage_class in (("deque", DequeStorage), ("ring", RingStorage)):
+            memory, append_time, window_time = bench(storage_class, window_length, make_datapoint, args.repeats)
+            print(f"{name:>18} {window_length:6d} {label:>7} {memory / 1024:10.1f} "
+                  f"{append_time * 1e6:14.2f} {window_time * 1e6:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark of the offloaded measurements, measured inline in the device process or in the process pool.
+
+The slow measurements, fatigue on the skeleton recording and entertainment and engagement on the wristband
+recording, are replayed through their data handlers. Prints the time the device process spends on a data
+point, which is the time the sensor stream is held up, and the time until every measurement is published.
+
+Run from the backend folder:
+    python -m benchmarks.bench_offload --workers 1 2 4 8
+"""
+import argparse
+import time
+from unittest.mock import patch
+
+import numpy as np
+
+from benchmarks.replay import EmpaticaReplayAPI, SkeletonReplayAPI
+from crunch import offload
+from crunch.empatica.handler import DataHandler as EmpaticaDataHandler
+from crunch.empatica.measurements import (compute_engagement,
+                                          compute_entertainment)
+from crunch.skeleton.handler import DataHandler as SkeletonDataHandler
+from crunch.skeleton.measurements import fatigue
+
+
+class TimedReplay:
+    """ Mixin of the replay apis that times every data point sent to the handlers """
+
+    def __init__(self):
+        super().__init__()
+        self.durations = []
+
+    def send(self, name, data_point):
+        start = time.perf_counter()
+        super().send(name, data_point)
+        self.durations.append(time.perf_counter() - start)
+
+
+class SkeletonReplay(TimedReplay, SkeletonReplayAPI):
+    pass
+
+
+class EmpaticaReplay(TimedReplay, EmpaticaReplayAPI):
+    pass
+
+
+def replay(offloaded, repeats):
+    """ Replay the recordings through the slow measurements, return the data point times and the total time """
+    skeleton, empatica = SkeletonReplay(), EmpaticaReplay()
+    skeleton.repeats = empatica.repeats = repeats
+    skeleton.add_subscriber(SkeletonDataHandler(measurement_func=fatigue, window_length=2, window_step=2,
+                                                baseline_length=100, offload=offloaded), "body")
+    empatica.add_subscriber(EmpaticaDataHandler(measurement_func=compute_engagement, window_length=121,
+                                                window_step=40, baseline_length=161, offload=offloaded), "EDA")
+    empatica.add_subscriber(EmpaticaDataHandler(measurement_func=compute_entertainment, window_length=20,
+                                                window_step=10, baseline_length=30, offload=offloaded), "HR")
+    start = time.perf_counter()
+    with patch("crunch.util.write_csv", lambda *args, **kwargs: None):
+        skeleton.connect()
+        empatica.connect()
+    return np.array(skeleton.durations + empatica.durations) * 1000, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeats", type=int, default=2, help="times the recordings are replayed")
+    args = parser.parse_args()
+
+    print(f"{'processing':>12} {'data point ms p50':>17} {'p99':>7} {'max':>7} {'total s':>8}")
+    durations, total = replay(False, args.repeats)
+    p50, p99 = np.percentile(durations, [50, 99])
+    print(f"{'inline':>12} {p50:17.3f} {p99:7.2f} {durations.max():7.2f} {total:8.2f}")
+    for workers in args.workers:
+        # start the workers before timing
+        offload.start(workers).submit(time.sleep, 0).result()
+        durations, total = replay(True, args.repeats)
+        offload.shutdown()
+        p50, p99 = np.percentile(durations, [50, 99])
+        print(f"{f'{workers} workers':>12} {p50:17.3f} {p99:7.2f} {durations.max():7.2f} {total:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark of the scheduler on an overloaded eyetracker process, with and without load shedding.
+
+A thread plays the eyetracker at rate gaze samples a second, the processing thread runs the cognitive load
+handler and a few LOW priority handlers that keep the processor busy for cost milliseconds a window, more
+than the process can keep up with. Prints the latency from the arrival of the last gaze sample of a window
+until its measurement is published, and the windows the scheduler shed.
+
+Run from the backend folder:
+    python -m benchmarks.bench_scheduler --cost 20
+"""
+import argparse
+import time
+from unittest.mock import patch
+
+import numpy as np
+
+from crunch import scheduler
+from crunch.eyetracker.api import EyetrackerAPI
+from crunch.eyetracker.handler import DataHandler
+from crunch.eyetracker.measurements import compute_cognitive_load
+
+
+class BenchmarkAPI(EyetrackerAPI):
+    """ Api with its own subscribers, the subscribers of EyetrackerAPI are shared by every instance """
+
+    def __init__(self):
+        EyetrackerAPI.__init__(self)
+        self.subscribers = {"gaze": [], "fixation": []}
+
+
+def busy(cost):
+    """ A measurement keeping the processor busy for cost seconds """
+    def measurement(lpup, rpup):
+        end = time.perf_counter() + cost
+        while time.perf_counter() < end:
+            pass
+        return 1.0
+    return measurement
+
+
+def run(schedule, args):
+    shedding = scheduler.Scheduler(budget=args.budget, max_load=0.9, max_stride=8, report_interval=float("inf"))
+    if not schedule:
+        shedding = scheduler.Scheduler(budget=float("inf"), max_load=float("inf"), report_interval=float("inf"))
+    scheduler.install(shedding)
+    api = BenchmarkAPI()
+    api.add_subscriber(DataHandler(measurement_func=compute_cognitive_load, measurement_path="cognitive_load.csv",
+                                   subscribed_to=["lpup", "rpup"], window_length=1000, window_step=250,
+                                   calculate_baseline=False), "gaze")
+    for i in range(args.handlers):
+        api.add_subscriber(DataHandler(measurement_func=busy(args.cost / 1000), measurement_path=f"busy_{i}.csv",
+                                       subscribed_to=["lpup", "rpup"], window_length=24, window_step=6,
+                                       calculate_baseline=False, priority=scheduler.LOW), "gaze")
+
+    latencies = {}
+
+    def publish(path, row, **kwargs):
+        latencies.setdefault(path, []).append(shedding.clock() - shedding.arrival)
+
+    rng = np.random.default_rng(0)
+    with patch("crunch.util.publish", publish):
+        api.start_processing()
+        start = time.perf_counter()
+        for i in range(int(args.rate * args.duration)):
+            delay = start + i / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            api.gaze_data_callback({'device_time_stamp': int(i * 1e6 / args.rate),
+                                    'left_gaze_point_on_display_area': (0.5, 0.5),
+                                    'right_gaze_point_on_display_area': (0.5, 0.5),
+                                    'left_pupil_diameter': rng.uniform(3, 4),
+                                    'right_pupil_diameter': rng.uniform(3, 4)})
+        api.stop_processing()
+
+    for path in ["cognitive_load.csv", "busy_0.csv"]:
+        values = np.array(latencies.get(path, [np.nan])) * 1000
+        p50, p99 = np.percentile(values, [50, 99])
+        print(f"{'on' if schedule else 'off':>9} {path:>18} {len(latencies.get(path, [])):9d} "
+              f"{p50:12.1f} {p99:9.1f} {values.max():9.1f}")
+    return shedding.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=int, default=120, help="gaze samples per second")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of gaze samples")
+    parser.add_argument("--handlers", type=int, default=3, help="number of busy LOW priority handlers")
+    parser.add_argument("--cost", type=float, default=20, help="milliseconds a busy handler takes per window")
+    parser.add_argument("--budget", type=float, default=0.25, help="latency budget in seconds")
+    args = parser.parse_args()
+
+    print(f"{'shedding':>9} {'measurement':>18} {'published':>9} {'latency ms p50':>12} {'p99':>9} {'max':>9}")
+    run(False, args)
+    stats = run(True, args)
+    print("shed:", stats["shed"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark of the streaming measurements against the measurement functions they replace.
+
+For every measurement with a stream, and growing window lengths, the data handler stores the
+recorded samples in tests/mock_data with a window step of one, and takes a measurement of every
+window, once from the stream and once by calling the measurement function on the window.
+Prints the time per window of both, and the largest difference of the measurements, relative to their largest value.
+
+Run from the backend folder:
+    python -m benchmarks.bench_streaming
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from crunch.empatica.measurements import compute_arousal, compute_stress
+from crunch.handler import DataHandler
+from crunch.skeleton.measurements import amount_of_motion, stability_of_motion
+
+MOCK_DATA = "tests/mock_data/"
+
+
+def empatica_samples(name):
+    return pd.read_csv(MOCK_DATA + name + ".csv")[name].to_numpy(dtype=float)
+
+
+def skeleton_samples():
+    rows = pd.read_csv(MOCK_DATA + "skeleton.csv", header=None).values
+    values = [[float(value.strip().strip("[]()")) for value in row] for row in rows]
+    return np.array(values).reshape(len(values), -1, 2)
+
+
+# the window lengths configured in the device main.py files come first
+CASES = [
+    ("arousal", compute_arousal, lambda: empatica_samples("EDA"), [121, 1000, 10000]),
+    ("stress", compute_stress, lambda: empatica_samples("TEMP"), [6, 1000, 10000]),
+    ("amount of motion", amount_of_motion, skeleton_samples, [20, 200, 1000]),
+    ("stability of motion", stability_of_motion, skeleton_samples, [20, 200, 1000]),
+]
+
+
+def bench(measurement_func, samples, window_length, windows, use_streaming):
+    """ Seconds per window, and the measurements of the last windows """
+    handler = DataHandler(measurement_func=measurement_func, window_length=window_length,
+                          window_step=1, use_streaming=use_streaming)
+    # the recording is replayed in a loop to fill large windows
+    samples = np.resize(samples, (window_length + windows,) + samples.shape[1:])
+    for sample in samples[:window_length]:
+        handler.append(sample)
+    measurements = []
+    start = time.perf_counter()
+    for sample in samples[window_length:]:
+        handler.append(sample)
+        if handler.window_ready():
+            measurements.append(handler.measure())
+    return (time.perf_counter() - start) / windows, np.array(measurements)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--windows", type=int, default=300, help="measurements taken for every case")
+    args = parser.parse_args()
+
+    print(f"{'measurement':>19} {'window':>6} {'function us':>11} {'stream us':>9} {'speedup':>7} {'max rel diff':>12}")
+    for name, measurement_func, load, window_lengths in CASES:
+        samples = load()
+        for window_length in window_lengths:
+            batch_time, batch = bench(measurement_func, samples, window_length, args.windows, False)
+            stream_time, streamed = bench(measurement_func, samples, window_length, args.windows, True)
+            # relative to the scale of the measurements, a slope close to zero has no meaningful relative error
+            difference = np.max(np.abs(streamed - batch)) / np.max(np.abs(batch))
+            print(f"{name:>19} {window_length:6d} {batch_time * 1e6:11.1f} {stream_time * 1e6:9.1f} "
+                  f"{batch_time / stream_time:6.1f}x {difference:12.1e}")
+
+
+if __name__ == "__main__":
+    main()
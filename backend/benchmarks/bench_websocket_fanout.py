@@ -0,0 +1,136 @@
+"""
+Load test of the websocket broadcast hub.
+
+A server process publishes measurements at a fixed rate through the BroadcastHub, and hundreds
+of local clients, spread over a few client processes, report the delivery latency of every
+message they receive. A number of slow clients can be added, to check that they do not hold
+back the others.
+
+Run from the backend folder:
+    python -m benchmarks.bench_websocket_fanout --clients 300 --rate 50 --slow 5
+    python -m benchmarks.bench_websocket_fanout --encoding binary --tick 0.05
+"""
+import argparse
+import asyncio
+import functools
+import json
+import time
+from multiprocessing import Event, Process, Queue
+
+import numpy as np
+import websockets
+
+from crunch.websocket.encoding import (ENCODINGS, create_encoder,
+                                       decode_binary_frame)
+from crunch.websocket.hub import POLICIES, BroadcastHub
+from crunch.websocket.websocket import handler
+
+MEASUREMENTS = ["arousal", "engagement", "stress", "cognitive_load", "fatigue"]
+
+
+def serve(port, rate, duration, buffer_size, policy, encoding, tick, ready, start_publishing):
+    """ Server process, publishes rate messages per second for duration seconds once start_publishing is set """
+    async def publish(hub):
+        ready.set()
+        while not start_publishing.is_set():
+            await asyncio.sleep(0.1)
+        start = time.time()
+        sent = 0
+        while time.time() - start < duration:
+            hub.publish(MEASUREMENTS[sent % len(MEASUREMENTS)], time.time(), time.time())
+            sent += 1
+            await asyncio.sleep(max(start + sent / rate - time.time(), 0))
+        await asyncio.sleep(2)
+        hub.publish("done", time.time(), sent)
+        await asyncio.sleep(2)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    hub = BroadcastHub(buffer_size=buffer_size, policy=policy, encoder=create_encoder(encoding))
+    server = loop.run_until_complete(websockets.serve(functools.partial(handler, hub=hub, tick=tick),
+                                                      "127.0.0.1", port))
+    loop.run_until_complete(publish(hub))
+    server.close()
+
+
+def run_clients(port, count, slow, connected, results):
+    """ Client process, connects count clients, of which slow sleep 50 ms per message """
+    async def client(is_slow):
+        latencies = []
+        async with websockets.connect(f"ws://127.0.0.1:{port}/", max_queue=None) as websocket:
+            connected.put(True)
+            async for frame in websocket:
+                received = time.time()
+                messages = json.loads(frame) if isinstance(frame, str) else decode_binary_frame(frame)
+                for message in messages:
+                    if message["name"] == "done":
+                        return is_slow, latencies, message["value"]
+                    latencies.append(received - message["value"])
+                if is_slow:
+                    await asyncio.sleep(0.05)
+        return is_slow, latencies, None
+
+    async def main():
+        return await asyncio.gather(*[client(i < slow) for i in range(count)], return_exceptions=True)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    for result in loop.run_until_complete(main()):
+        results.put(result if not isinstance(result, BaseException) else (None, [], None))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--slow", type=int, default=5, help="number of clients reading slower than the rate")
+    parser.add_argument("--rate", type=float, default=50, help="messages published per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of publishing")
+    parser.add_argument("--client-processes", type=int, default=4)
+    parser.add_argument("--buffer-size", type=int, default=256)
+    parser.add_argument("--policy", choices=POLICIES, default="drop_oldest")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="json")
+    parser.add_argument("--tick", type=float, default=0.1, help="seconds between the frames sent to a client")
+    parser.add_argument("--port", type=int, default=8890)
+    args = parser.parse_args()
+
+    ready, start_publishing = Event(), Event()
+    server = Process(target=serve, args=(args.port, args.rate, args.duration, args.buffer_size, args.policy,
+                                         args.encoding, args.tick, ready, start_publishing))
+    server.start()
+    ready.wait()
+
+    connected, results = Queue(), Queue()
+    clients = []
+    per_process = [args.clients // args.client_processes + (i < args.clients % args.client_processes)
+                   for i in range(args.client_processes)]
+    slow_per_process = [args.slow // args.client_processes + (i < args.slow % args.client_processes)
+                        for i in range(args.client_processes)]
+    for count, slow in zip(per_process, slow_per_process):
+        process = Process(target=run_clients, args=(args.port, count, slow, connected, results))
+        process.start()
+        clients.append(process)
+    for _ in range(args.clients):
+        connected.get()
+    start_publishing.set()
+
+    outcomes = [results.get() for _ in range(args.clients)]
+    for process in clients + [server]:
+        process.join()
+
+    sent = max((outcome[2] or 0) for outcome in outcomes)
+    for label, is_slow in (("normal", False), ("slow", True)):
+        group = [outcome for outcome in outcomes if outcome[0] is is_slow]
+        if not group:
+            continue
+        latencies = np.concatenate([outcome[1] for outcome in group if outcome[1]] or [[np.nan]]) * 1000
+        delivered = sum(len(outcome[1]) for outcome in group) / (len(group) * sent) if sent else 0
+        p50, p95, p99 = np.nanpercentile(latencies, [50, 95, 99])
+        print(f"{label:>6} clients: {len(group):4d}  delivered {delivered:6.1%}  latency ms "
+              f"p50 {p50:7.2f}  p95 {p95:7.2f}  p99 {p99:7.2f}  max {np.nanmax(latencies):7.2f}")
+    failed = sum(outcome[0] is None for outcome in outcomes)
+    if failed:
+        print(f"{failed} clients failed to connect")
+
+
+if __name__ == "__main__":
+    main()
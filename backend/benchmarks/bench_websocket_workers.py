@@ -0,0 +1,104 @@
+"""
+Load test of the websocket workers, with a growing number of workers.
+
+For every worker count a server process starts the workers and publishes measurements at a fixed
+rate through the aggregator, and local clients, spread over a few client processes, connect to
+the shared port and report the delivery latency of every measurement they receive. Prints the
+measurements delivered per second over all clients, and the latency percentiles.
+
+Needs SO_REUSEPORT, so it does not run on Windows. Run from the backend folder:
+    python -m benchmarks.bench_websocket_workers --workers 1 2 4 --clients 300 --rate 500
+"""
+import argparse
+import asyncio
+import time
+from multiprocessing import Event, Process, Queue
+
+import numpy as np
+
+from benchmarks.bench_websocket_fanout import MEASUREMENTS, run_clients
+from crunch.websocket.encoding import ENCODINGS
+from crunch.websocket.websocket import serve_worker
+from crunch.websocket.workers import Aggregator, start_workers
+
+# seconds the workers get to start listening
+STARTUP_TIME = 2
+
+
+def serve(workers, port, rate, duration, settings, tick, ready, start_publishing):
+    """ Server process, publishes rate measurements per second for duration seconds once start_publishing is set """
+    async def publish(hub):
+        await asyncio.sleep(STARTUP_TIME)
+        ready.set()
+        while not start_publishing.is_set():
+            await asyncio.sleep(0.1)
+        start = time.time()
+        sent = 0
+        while time.time() - start < duration:
+            # publish the measurements that are due in one go, like the bus reader does
+            while sent < (time.time() - start) * rate:
+                hub.publish(MEASUREMENTS[sent % len(MEASUREMENTS)], time.time(), time.time())
+                sent += 1
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(2)
+        hub.publish("done", time.time(), sent)
+        await asyncio.sleep(2)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    connections = start_workers(workers, serve_worker, ("127.0.0.1", port, tick, None, settings))
+    aggregator = Aggregator(connections)
+    loop.run_until_complete(publish(aggregator))
+    aggregator.close()
+
+
+def run(args, workers):
+    settings = {"buffer_size": args.buffer_size, "policy": "drop_oldest", "encoding": args.encoding,
+                "history_seconds": 300}
+    ready, start_publishing = Event(), Event()
+    server = Process(target=serve, args=(workers, args.port, args.rate, args.duration, settings, args.tick,
+                                         ready, start_publishing))
+    server.start()
+    ready.wait()
+
+    connected, results = Queue(), Queue()
+    clients = []
+    for i in range(args.client_processes):
+        count = args.clients // args.client_processes + (i < args.clients % args.client_processes)
+        process = Process(target=run_clients, args=(args.port, count, 0, connected, results))
+        process.start()
+        clients.append(process)
+    for _ in range(args.clients):
+        connected.get()
+    start_publishing.set()
+
+    outcomes = [results.get() for _ in range(args.clients)]
+    for process in clients + [server]:
+        process.join()
+
+    latencies = np.concatenate([outcome[1] for outcome in outcomes if outcome[1]] or [[np.nan]]) * 1000
+    delivered = sum(len(outcome[1]) for outcome in outcomes)
+    sent = max((outcome[2] or 0) for outcome in outcomes)
+    p50, p99 = np.nanpercentile(latencies, [50, 99])
+    print(f"workers {workers:2d}  delivered {delivered / args.duration:10.0f} measurements/s "
+          f"({delivered / (sent * args.clients) if sent else 0:6.1%})  latency ms p50 {p50:7.2f}  p99 {p99:7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=500, help="measurements published per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of publishing")
+    parser.add_argument("--client-processes", type=int, default=4)
+    parser.add_argument("--buffer-size", type=int, default=256)
+    parser.add_argument("--encoding", choices=ENCODINGS, default="json")
+    parser.add_argument("--tick", type=float, default=0.1, help="seconds between the frames sent to a client")
+    parser.add_argument("--port", type=int, default=8891)
+    args = parser.parse_args()
+    for workers in args.workers:
+        run(args, workers)
+
+
+if __name__ == "__main__":
+    main()
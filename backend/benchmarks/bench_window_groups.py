@@ -0,0 +1,92 @@
+"""
+Benchmark of the window groups, handlers with identical windows sharing one ring buffer.
+
+The three device pipelines are replayed with and without grouping. Prints the ring buffer memory of the
+pipelines, the time to store a data point and hand the window to every handler of the groups, measured
+with a measurement function that does nothing, and the time to replay the pipelines with the real
+measurement functions.
+
+Run from the backend folder:
+    python -m benchmarks.bench_window_groups
+"""
+import argparse
+import time
+from unittest.mock import patch
+
+from benchmarks.replay import (EmpaticaReplayAPI, EyetrackerReplayAPI,
+                               SkeletonReplayAPI)
+from crunch.empatica import start_empatica
+from crunch.eyetracker import start_eyetracker
+from crunch.handler import WindowGroup
+from crunch.skeleton import start_skeleton
+
+PIPELINES = [("empatica", start_empatica, EmpaticaReplayAPI),
+             ("eyetracker", start_eyetracker, EyetrackerReplayAPI),
+             ("skeleton", start_skeleton, SkeletonReplayAPI)]
+
+
+def handlers(subscriber):
+    return subscriber.handlers if isinstance(subscriber, WindowGroup) else [subscriber]
+
+
+def replay(start_func, api_class, grouped, cheap):
+    """ Replay a pipeline, return its api and the seconds it took """
+    apis = []
+
+    class Replay(api_class):
+        def __init__(self, *args):
+            super().__init__(*args)
+            apis.append(self)
+
+        def connect(self):
+            if cheap:
+                for subscriber in (s for subscribers in self.subscribers.values() for s in subscribers):
+                    for handler in handlers(subscriber):
+                        handler.measurement_func = nothing
+                        handler.offload = False
+                        handler.streams = []
+                        handler.stream = None
+            self.start = time.perf_counter()
+            super().connect()
+            self.elapsed = time.perf_counter() - self.start
+
+    with patch("crunch.util.write_csv", lambda *args, **kwargs: None), \
+            patch.object(WindowGroup, "accepts", WindowGroup.accepts if grouped else lambda self, handler: False):
+        start_func(Replay)
+    return apis[0]
+
+
+def nothing(*args, **kwargs):
+    return 1.0
+
+
+def ring_memory(api):
+    """ Bytes of the ring buffers of the handlers of an api, shared buffers are counted once """
+    buffers = {}
+    for subscribers in api.subscribers.values():
+        for subscriber in subscribers:
+            for handler in handlers(subscriber):
+                for buffer in handler.buffers.values():
+                    buffers[id(buffer)] = buffer.data.nbytes if buffer.data is not None else 0
+    return sum(buffers.values())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5, help="times the recordings are replayed")
+    args = parser.parse_args()
+
+    print(f"{'pipeline':>10} {'grouping':>8} {'groups':>6} {'ring KiB':>8} {'dispatch ms':>11} {'replay s':>8}")
+    for name, start_func, api_class in PIPELINES:
+        api_class.repeats = args.repeats
+        for grouped in (False, True):
+            cheap = min((replay(start_func, api_class, grouped, cheap=True) for _ in range(3)),
+                        key=lambda api: api.elapsed)
+            real = replay(start_func, api_class, grouped, cheap=False)
+            groups = sum(isinstance(s, WindowGroup) for subscribers in real.subscribers.values() for s in subscribers)
+            print(f"{name:>10} {'on' if grouped else 'off':>8} {groups:6d} {ring_memory(real) / 1024:8.1f} "
+                  f"{cheap.elapsed * 1000:11.1f} {real.elapsed:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
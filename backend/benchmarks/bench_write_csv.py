@@ -0,0 +1,86 @@
+"""
+Benchmark of util.write_csv, before and after the persistent buffered writer.
+
+The rows written by the empatica, eyetracker and skeleton pipelines are captured by replaying
+the mock recordings, and then written again by the old and the new write path.
+
+Run from the backend folder:
+    python -m benchmarks.bench_write_csv
+"""
+import argparse
+import csv
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from benchmarks.replay import (EmpaticaReplayAPI, EyetrackerReplayAPI,
+                               SkeletonReplayAPI)
+from crunch.empatica import start_empatica
+from crunch.eyetracker import start_eyetracker
+from crunch.skeleton import start_skeleton
+from crunch.writer import CsvWriter
+
+
+def legacy_write_csv(path, row, header_features=[]):
+    """ util.write_csv before the buffered writer, checks the folder and opens the file for every row """
+    if path is not None:
+        if not os.path.exists("crunch/output"):
+            os.makedirs("crunch/output")
+
+        file_exists = os.path.isfile("crunch/output/" + path)
+        with open("crunch/output/" + path, "a", newline="") as csvfile:
+            writer = csv.writer(csvfile, delimiter=",")
+            if not file_exists:
+                header = ['time', 'value']
+                writer.writerow(header + header_features)
+            writer.writerow([time.time()] + row)
+
+
+def capture_rows():
+    """ Run the three pipelines on the mock recordings, and capture every row they write """
+    rows = []
+
+    def capture(path, row, header_features=[], timestamp=None):
+        rows.append((path, row, header_features))
+
+    with patch("crunch.util.write_csv", capture):
+        start_empatica(EmpaticaReplayAPI)
+        start_eyetracker(EyetrackerReplayAPI)
+        start_skeleton(SkeletonReplayAPI)
+    return rows
+
+
+def bench(write, rows, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for path, row, header_features in rows:
+            write(path, row, header_features)
+    return len(rows) * repeats / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=50, help="how many times the captured rows are written")
+    args = parser.parse_args()
+
+    rows = capture_rows()
+    print(f"captured {len(rows)} rows from {len({path for path, _, _ in rows})} measurements")
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            legacy = bench(legacy_write_csv, rows, args.repeats)
+            writer = CsvWriter("crunch/buffered", flush_interval=1.0, batch_size=100)
+            buffered = bench(writer.write, rows, args.repeats)
+            writer.close()
+        finally:
+            os.chdir(cwd)
+
+    print(f"legacy write_csv:   {legacy:12.0f} rows/s")
+    print(f"buffered CsvWriter: {buffered:12.0f} rows/s ({buffered / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Replays the recordings in tests/mock_data through the device pipelines, so the benchmarks
+can run the real handlers and measurements without any devices connected.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from crunch.handler import subscribe
+
+MOCK_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../tests/mock_data")
+
+
+def read_mock_data(file_name, **kwargs):
+    return pd.read_csv(os.path.join(MOCK_DATA, file_name), **kwargs)
+
+
+class ReplayAPI:
+    """ Base class of the replay apis, stores the subscribers per instance """
+    raw_data = []
+
+    def __init__(self):
+        self.subscribers = {name: [] for name in self.raw_data}
+
+    def add_subscriber(self, data_handler, requested_data):
+        assert requested_data in self.subscribers
+        subscribe(self.subscribers[requested_data], data_handler)
+
+    def send(self, name, data_point):
+        for handler in self.subscribers[name]:
+            handler.add_data_point(data_point)
+
+    def finish(self):
+        """ The recording ended, wait for the measurements of the offloaded windows """
+        for handlers in self.subscribers.values():
+            for handler in handlers:
+                if hasattr(handler, "collect"):
+                    handler.collect(wait=True)
+
+
+class EmpaticaReplayAPI(ReplayAPI):
+    """
+    Replays the EDA, IBI, TEMP and HR recordings, repeats times, interleaved at their sample rates,
+    and the BVP and ACC recordings in blocks of a quarter second
+    """
+    raw_data = ["EDA", "IBI", "TEMP", "HR", "BVP", "ACC"]
+    repeats = 1
+
+    def __init__(self, device_id=None):
+        ReplayAPI.__init__(self)
+        self.deviceID = device_id
+
+    def connect(self):
+        eda = read_mock_data("EDA.csv")["EDA"].tolist()
+        temp = read_mock_data("TEMP.csv")["TEMP"].tolist()
+        hr = read_mock_data("HR.csv")["HR"].tolist()
+        ibi = read_mock_data("IBI.csv")["IBI"].tolist()
+        bvp = read_mock_data("BVP.csv", skiprows=2, header=None).to_numpy(dtype=float)
+        acc = read_mock_data("ACC.csv", skiprows=2, header=None).to_numpy(dtype=float)
+        # the device timestamp of a data point is its time in the recording
+        bvp = np.column_stack((np.arange(len(bvp)) / 64, bvp))
+        acc = np.column_stack((np.arange(len(acc)) / 32, acc))
+        for repeat in range(self.repeats):
+            # EDA and TEMP are sampled at 4 Hz, HR at 1 Hz, and IBI once per heart beat, BVP at 64 Hz and ACC at 32 Hz
+            offset = np.array([repeat * len(eda) / 4, 0, 0, 0])
+            for i in range(len(eda)):
+                self.send_block("BVP", bvp[i * 16:(i + 1) * 16] + offset[:2])
+                self.send_block("ACC", acc[i * 8:(i + 1) * 8] + offset)
+                self.send("EDA", eda[i])
+                if i < len(temp):
+                    self.send("TEMP", temp[i])
+                if i % 4 == 0 and i // 4 < len(hr):
+                    self.send("HR", hr[i // 4])
+                    self.send("IBI", ibi[i // 4])
+        self.finish()
+
+    def send_block(self, name, block):
+        if len(block):
+            for handler in self.subscribers[name]:
+                handler.add_data_block(block)
+
+
+class EyetrackerReplayAPI(ReplayAPI):
+    """ Replays the fixation and pupil recordings, with 20 gaze points per fixation """
+    raw_data = ["fixation", "gaze"]
+    frequency = 120
+    repeats = 1
+
+    def connect(self):
+        data = read_mock_data("eyetracker.csv")
+        fixations = data[["initTime", "endTime", "fx", "fy"]].to_dict("records")
+        gaze = data[["lpup", "rpup"]].to_dict("records")
+        for _ in range(self.repeats):
+            for fixation, gaze_point in zip(fixations[1:], gaze[1:]):
+                self.send("fixation", fixation)
+                for _ in range(20):
+                    self.send("gaze", gaze_point)
+        self.finish()
+
+
+class SkeletonReplayAPI(ReplayAPI):
+    """ Replays the openpose recording, one frame of 25 joints at a time """
+    raw_data = ["body"]
+    repeats = 1
+
+    def connect(self):
+        frames = []
+        for row in read_mock_data("skeleton.csv", header=None).values.tolist():
+            frames.append([(float(row[j].strip().strip("[]()")), float(row[j + 1].strip().strip("[]()")))
+                           for j in range(0, len(row) - 1, 2)])
+        for _ in range(self.repeats):
+            for frame in frames:
+                self.send("body", frame)
+        self.finish()
@@ -0,0 +1,78 @@
+import multiprocessing
+import queue
+
+_bus = None
+_write_csv = True
+
+
+class MeasurementBus:
+    """
+    In-memory transport for measurement results, shared between the device processes
+    and the websocket process. It is created by start_processes and handed to every
+    process it starts, the device processes publish to it and the websocket reads from it.
+    """
+
+    def __init__(self, maxsize=0):
+        """
+        :param maxsize: maximum number of unread measurements, 0 means unbounded
+        :type maxsize: int
+        """
+        self.queue = multiprocessing.Queue(maxsize)
+
+    def publish(self, name, timestamp, value):
+        """
+        Put a measurement on the bus, the measurement is dropped if the bus is full
+        so that a device process is never blocked by a slow reader
+
+        :param name: name of the measurement, i.e arousal
+        :type name: str
+        :param timestamp: unix time of the measurement
+        :type timestamp: float
+        :param value: the measurement value
+        :type value: float or str
+        :return: True if the measurement was put on the bus
+        :rtype: bool
+        """
+        try:
+            self.queue.put_nowait((name, timestamp, value))
+            return True
+        except queue.Full:
+            return False
+
+    def get(self, timeout=None):
+        """
+        Read the next measurement from the bus
+
+        :param timeout: seconds to wait for a measurement, None waits forever
+        :type timeout: float
+        :return: (name, timestamp, value), or None if the timeout ran out
+        :rtype: tuple
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+def install(bus, write_csv=True):
+    """
+    Install the bus that measurements in this process are published to
+
+    :param bus: the bus shared with the websocket process
+    :type bus: MeasurementBus
+    :param write_csv: also write measurements to their csv file
+    :type write_csv: bool
+    """
+    global _bus, _write_csv
+    _bus = bus
+    _write_csv = write_csv
+
+
+def current():
+    """ The bus installed in this process, or None if measurements only go to csv """
+    return _bus
+
+
+def write_csv_enabled():
+    """ Whether measurements should be written to csv files in this process """
+    return _bus is None or _write_csv
@@ -1,24 +1,64 @@
 from multiprocessing import Process
 
+import crunch.util as util
+from crunch import bus, offload, store
 from crunch.emotion import start_emotion
 from crunch.empatica import start_empatica
 from crunch.eyetracker import start_eyetracker
 from crunch.skeleton import start_skeleton
 from crunch.websocket import start_websocket
 
+# the device processes, the wristbands, the eyetracker, and the skeleton or the emotions
+DEVICES = 3
+
+
+def start_device(start_func, measurement_bus, write_csv, session_path=None, devices=1):
+    """
+    Entry point of a device process, installs the measurement bus and session store before starting the device
+
+    :param start_func: the function starting the device control flow, i.e start_empatica
+    :type start_func: () -> None
+    :param measurement_bus: the bus shared with the websocket
+    :type measurement_bus: bus.MeasurementBus
+    :param write_csv: also write measurements to csv files
+    :type write_csv: bool
+    :param session_path: the session directory measurements are stored in, None disables the store
+    :type session_path: str
+    :param devices: number of device processes, the cores are split between their process pools
+    :type devices: int
+    """
+    bus.install(measurement_bus, write_csv)
+    offload.configure(devices)
+    if session_path is not None:
+        store.install(store.SessionWriter(session_path, chunk_size=int(util.config("output", "chunk_size"))))
+    try:
+        start_func()
+    finally:
+        # the process is stopped with ctrl+c, make sure the buffered csv rows reach the disk
+        util.close_csv()
+        store.close()
+        offload.shutdown(wait=False)
+
 
 def start_processes(mobile):
-    p1 = Process(target=start_empatica)
+    measurement_bus = bus.MeasurementBus(int(util.config("output", "bus_size")))
+    write_csv = util.config("output", "write_csv") == "True"
+    session_path = None
+    if util.config("output", "write_store") == "True":
+        session_path = store.new_session_path(util.config("output", "store_directory"))
+        print("Storing the session in", session_path)
+
+    p1 = Process(target=start_device, args=(start_empatica, measurement_bus, write_csv, session_path, DEVICES))
     p1.start()
 
-    p2 = Process(target=start_eyetracker)
+    p2 = Process(target=start_device, args=(start_eyetracker, measurement_bus, write_csv, session_path, DEVICES))
     p2.start()
 
     if mobile:
-        p3 = Process(target=start_skeleton)
+        p3 = Process(target=start_device, args=(start_skeleton, measurement_bus, write_csv, session_path, DEVICES))
         p3.start()
     else:
-        p3 = Process(target=start_emotion)
+        p3 = Process(target=start_device, args=(start_emotion, measurement_bus, write_csv, session_path, DEVICES))
         p3.start()
 
-    start_websocket()
+    start_websocket(measurement_bus)
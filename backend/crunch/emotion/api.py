@@ -7,7 +7,7 @@ def start_emotion():
     """
     This function reads a frame from the webcam,
     finds the emotion from the PyEmotion package
-    And writes it to it's csv file
+    And publishes it as a measurement
     """
     import cv2 as cv
     import PyEmotion
@@ -19,6 +19,6 @@ def start_emotion():
     while True:
         _, frame = cap.read()
         _, emotion = er.predict_emotion(frame)
-        util.write_csv("emotion.csv", [emotion])
+        util.publish("emotion.csv", [emotion])
         # only find emotion once every second
         time.sleep(1)
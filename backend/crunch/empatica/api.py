@@ -1,8 +1,47 @@
-import socket
-import time
+import asyncio
+import traceback
+from functools import partial
 
 import crunch.util as util
+from crunch import scheduler
 from crunch.empatica.handler import DataHandler  # noqa
+from crunch.empatica.parser import STREAMS, StreamParser
+from crunch.handler import subscribe
+
+# the stream the streaming server sends a raw data in, the heart rate is sent with the inter beat intervals
+SUBSCRIPTIONS = {"EDA": "gsr", "TEMP": "tmp", "IBI": "ibi", "HR": "ibi", "BVP": "bvp", "ACC": "acc"}
+
+# the high rate raw data, sent to their subscribers in blocks of the data points received at once
+BLOCK_STREAMS = {"BVP", "ACC"}
+
+
+class DeviceError(Exception):
+    """ The streaming server refused a command, or lost the connection to the wristband """
+
+
+def configured_devices():
+    """ The ids of the wristbands in the config, a group session has several, separated by commas """
+    return [device_id.strip() for device_id in util.config('empatica', 'deviceid').split(",") if device_id.strip()]
+
+
+def connect_devices(apis):
+    """
+    Stream from several wristbands in this process, every api streams its wristband on its own connection,
+    on one event loop. An api that fails does not stop the others.
+
+    :type apis: list of EmpaticaAPI
+    """
+    async def run():
+        results = await asyncio.gather(*[api.run() for api in apis], return_exceptions=True)
+        for api, result in zip(apis, results):
+            if isinstance(result, Exception):
+                print(f"{api.deviceID}: stopped streaming, {type(result).__name__}: {result}")
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
 
 
 class EmpaticaAPI:
@@ -10,16 +49,55 @@ class EmpaticaAPI:
     EmpaticaAPI is responsible for connecting to and receiving data from the
     empatica E4 wristband, and then the API sends the data to all subscribed
     handlers. The class communicates with a streaming server to get the data
+
+    An api streams one wristband, the streaming server connects one wristband per connection, and its
+    sample lines do not tell the wristband apart. Group sessions have an api per wristband, see connect_devices.
+
+    The subscribers of the high rate raw data, BVP at 64 Hz and ACC at 32 Hz, receive the data points in blocks,
+    with add_data_block, as arrays with a row per data point of the device timestamp followed by the values.
+    Only the raw data that has subscribers is streamed.
+
+    The connection is a session of an asyncio reconnect loop. When the session ends, because the server or
+    the wristband is lost, a new session is started after a backoff that doubles with every failed session,
+    up to max_backoff. The handlers stay subscribed, so they keep their windows across sessions.
+    A session that ends with an unexpected error, like a bug in a handler, is also followed by a new session.
+
+    The scheduler is told when the bytes a sample was parsed from were received, and how many samples of the
+    same stream were received after it, so the stale windows are coalesced when the handlers fall behind.
     """
     serverAddress = util.config('empatica', 'address')
     serverPort = int(util.config('empatica', 'port'))
     bufferSize = int(util.config('empatica', 'buffersize'))
-    deviceID = util.config('empatica', 'deviceid')
+    timeout = float(util.config('empatica', 'timeout'))
+    minBackoff = float(util.config('empatica', 'min_backoff'))
+    maxBackoff = float(util.config('empatica', 'max_backoff'))
 
-    socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    connected = False
-
-    subscribers = {"EDA": [], "IBI": [], "TEMP": [], "HR": []}
+    def __init__(self, device_id=None):
+        """
+        :param device_id: id of the wristband, defaults to the first wristband in the config
+        :type device_id: str
+        """
+        self.deviceID = device_id or configured_devices()[0]
+        self.subscribers = {"EDA": [], "IBI": [], "TEMP": [], "HR": [], "BVP": [], "ACC": []}
+        # device timestamp of the latest sample of every stream
+        self.timestamps = {}
+        dispatch = {tag: partial(self._receive_sample, name) for tag, name in STREAMS.items()
+                    if name not in BLOCK_STREAMS}
+        blocks = {tag: partial(self._receive_block, name) for tag, name in STREAMS.items() if name in BLOCK_STREAMS}
+        self.scheduler = scheduler.current()
+        # when the bytes being parsed were received, on the clock of the scheduler
+        self.arrival = None
+        self.parser = StreamParser(dispatch, on_message=self._receive_message, buffer_size=4 * self.bufferSize,
+                                   blocks=blocks)
+        self.replies = None
+        self.writer = None
+        # why the wristband was lost, the status messages of the server are not replies to commands
+        self.lost = None
+        self.streaming = False
+        self.stopped = False
+        # set by stop, wakes up the reconnect loop while it backs off
+        self.stopping = None
+        self.sessions = 0
 
     def add_subscriber(self, data_handler, requested_data):
         """
@@ -31,97 +109,142 @@ class EmpaticaAPI:
         :type requested_data: str
         """
         assert requested_data in self.subscribers.keys()
-        self.subscribers[requested_data].append(data_handler)
+        subscribe(self.subscribers[requested_data], data_handler)
 
     def connect(self):
-        """ Connect to the empatica wristband """
-        self.socket.settimeout(3)
-        self._connect_socket()
-        self._subscribe_to_socket()
-        self._stream()
-
-    def _connect_socket(self):
-        """ Create the socket connection and connect the device to the socket """
-        if not self.connected:
-            self.socket.connect((self.serverAddress, self.serverPort))
-            self.connected = True
+        """ Connect to the empatica wristband, and stream its data until stop is called """
+        connect_devices([self])
 
-        self.socket.send("device_list\r\n".encode())
-        response = self.socket.recv(self.bufferSize)
+    def stop(self):
+        """ End the reconnect loop, and the session that is streaming """
+        self.stopped = True
+        if self.stopping is not None:
+            self.stopping.set()
+        if self.writer is not None:
+            self.writer.close()
 
-        if self.deviceID not in response.decode("utf-8"):
-            print("Device not available, reconnecting in 10 sec...")
-            time.sleep(10)
-            return self.connect()
-
-        self.socket.send(("device_connect " + self.deviceID + "\r\n").encode())
-        self.socket.recv(self.bufferSize)
+    async def run(self):
+        """ Stream sessions until stop is called, backing off exponentially while the sessions fail """
+        self.stopping = asyncio.Event()
+        backoff = self.minBackoff
+        while not self.stopped:
+            self.sessions += 1
+            self.streaming = False
+            try:
+                await self._session()
+            except (OSError, EOFError, asyncio.TimeoutError, DeviceError) as error:
+                if self.stopped:
+                    break
+                if self.streaming:
+                    # the session streamed, the wristband is likely back soon
+                    backoff = self.minBackoff
+                print(f"{self.deviceID}: {type(error).__name__}: {error}, reconnecting in {backoff:g} sec...")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if self.stopped:
+                    break
+                print(f"{self.deviceID}: unexpected error in the session, reconnecting in {backoff:g} sec...")
+                traceback.print_exc()
+            try:
+                await asyncio.wait_for(self.stopping.wait(), backoff)
+            except asyncio.TimeoutError:
+                backoff = min(backoff * 2, self.maxBackoff)
 
-        self.socket.send("pause ON\r\n".encode())
-        self.socket.recv(self.bufferSize)
+    async def command(self, command):
+        """
+        Send a command to the streaming server, and wait for its reply
 
-    def _subscribe_to_socket(self):
-        """ Subscribe to the data on the socket connection """
-        self.socket.send(("device_subscribe " + 'gsr' + " ON\r\n").encode())
-        self.socket.recv(self.bufferSize)
+        :param command: the command, like "device_subscribe gsr ON"
+        :type command: str
+        :return: the reply, like b"R device_subscribe gsr OK"
+        :rtype: bytes
+        """
+        self.writer.write(command.encode() + b"\r\n")
+        name = command.split()[0].encode()
+        while True:
+            reply = await asyncio.wait_for(self.replies.get(), self.timeout)
+            if isinstance(reply, Exception):
+                raise reply
+            fields = reply.split()
+            # a reply to an earlier command that timed out is skipped
+            if len(fields) > 1 and fields[0] == b"R" and fields[1] == name:
+                break
+        if b"ERR" in fields:
+            raise DeviceError(reply.decode("utf-8", "replace"))
+        return reply
 
-        self.socket.send(("device_subscribe " + 'tmp' + " ON\r\n").encode())
-        self.socket.recv(self.bufferSize)
+    async def _session(self):
+        """ Connect to the streaming server and the wristband, subscribe to the raw data and stream it """
+        reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.serverAddress, self.serverPort), self.timeout)
+        self.replies = asyncio.Queue()
+        self.lost = None
+        self.parser.reset()
+        receiving = asyncio.ensure_future(self._receive(reader))
+        try:
+            devices = await self.command("device_list")
+            if self.deviceID.encode() not in devices:
+                raise DeviceError("Device not available")
+            await self.command("device_connect " + self.deviceID)
+            await self.command("pause ON")
+            subscriptions = {SUBSCRIPTIONS[name] for name, handlers in self.subscribers.items() if handlers}
+            for subscription in sorted(subscriptions):
+                await self.command("device_subscribe " + subscription + " ON")
+            await self.command("pause OFF")
+            self.streaming = True
+            await receiving
+        finally:
+            receiving.cancel()
+            await asyncio.wait([receiving])
+            if not receiving.cancelled():
+                # the error the session ended with is raised instead
+                receiving.exception()
+            self.writer.close()
+            self.writer = None
 
-        self.socket.send(("device_subscribe " + 'ibi' + " ON\r\n").encode())
-        self.socket.recv(self.bufferSize)
+    async def _receive(self, reader):
+        """ Receive from the streaming server, until the connection or the wristband is lost """
+        try:
+            while True:
+                data = await asyncio.wait_for(reader.read(self.bufferSize), self.timeout)
+                if not data:
+                    raise EOFError("The streaming server closed the connection")
+                self._feed(data)
+                if self.lost is not None:
+                    raise DeviceError(self.lost)
+        except Exception as error:
+            # wake up a command waiting for its reply
+            self.replies.put_nowait(error)
+            raise
 
-        """
-        UNUSED DATA POINTS
-        self.socket.send(("device_subscribe " + 'bvp' + " ON\r\n").encode())
-        self.socket.recv(self.bufferSize)
+    def _feed(self, data):
+        """ Parse the received bytes, and send their samples to the handlers """
+        self.arrival = self.scheduler.clock()
+        self.parser.feed(data)
 
-        self.socket.send(("device_subscribe " + 'acc' + " ON\r\n").encode())
-        self.socket.recv(self.bufferSize)
-        """
+    def _receive_message(self, message):
+        """ Route a line that is not a sample, a reply to a command or a status message of the server """
+        if b"connection lost to device" in message:
+            self.lost = "Lost connection to device"
+        elif b"turned off via button" in message:
+            self.lost = "The wristband was turned off"
+        else:
+            self.replies.put_nowait(message)
 
-        self.socket.send("pause OFF\r\n".encode())
-        self.socket.recv(self.bufferSize)
+    def _receive_sample(self, name, timestamp, data):
+        """ Store the device timestamp of a parsed sample, and send the sample to the handlers """
+        self.timestamps[name] = timestamp
+        self.scheduler.arrived(self.arrival, self.parser.backlog)
+        self._send_data_to_subscriber(name, data)
 
-    def _stream(self):
-        """ Continuously receive data from the socket connection """
-        while True:
-            try:
-                response = self.socket.recv(self.bufferSize).decode("utf-8")
-                if "connection lost to device" in response:
-                    print("Lost connection to device, reconnecting in 10 sec...")
-                    time.sleep(10)
-                    return self.connect()
-                if "turned off via button" in response:
-                    print("The wristband was turned off, reconnecting in 10 sec...")
-                    time.sleep(10)
-                    return self.connect()
-
-                samples = response.split("\n")
-                for i in range(len(samples) - 1):
-                    name = samples[i].split()[0]
-                    data = float(samples[i].split()[2].replace(',', '.'))
-                    if name == "E4_Temperature":
-                        self._send_data_to_subscriber("TEMP", data)
-                    elif name == "E4_Gsr":
-                        self._send_data_to_subscriber("EDA", data)
-                    elif name == "E4_Hr":
-                        self._send_data_to_subscriber("HR", data)
-                    elif name == "E4_Ibi":
-                        self._send_data_to_subscriber("IBI", data)
-
-                    """
-                    UNUSED DATA POINTS
-                    if name == "E4_Bvp":
-                        self.send_data_to_subscriber("BVP", data)
-                    if name == "E4_Acc":
-                        self.send_data_to_subscriber("ACC", data)
-                    """
-
-            except socket.timeout:
-                print("Socket timeout, reconnecting in 10 sec...")
-                time.sleep(10)
-                return self.connect()
+    def _receive_block(self, name, block):
+        """ Store the device timestamp of the last sample of a block, and send the block to the handlers """
+        self.timestamps[name] = block[-1, 0]
+        # the beat detector sends the intervals it detects in the block on to its handlers
+        self.scheduler.arrived(self.arrival)
+        for handler in self.subscribers[name]:
+            handler.add_data_block(block)
 
     def _send_data_to_subscriber(self, name, data):
         """
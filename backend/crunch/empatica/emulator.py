@@ -0,0 +1,255 @@
+"""
+Emulator of the E4 streaming server, for testing the empatica pipeline without a wristband.
+
+Speaks the commands EmpaticaAPI sends, device_list, device_connect, device_subscribe and pause, and streams
+the recordings in tests/mock_data to every connected client, on a loop, speed times faster than real time.
+Every virtual device streams the same recording, and can be connected by one client at a time.
+Disconnects are injected every disconnect_interval seconds, by ending the session with the status line
+of the server when it loses the wristband, or by closing the connection.
+
+The device timestamp of a sample is the wall clock time it is scheduled to be sent, so a client can tell
+how far behind the stream it is by comparing the timestamps with its own clock.
+
+Run from the backend folder, with the port in the [empatica] section of setup.cfg:
+    python -m crunch.empatica.emulator --devices C13A64 --speed 10
+"""
+import argparse
+import asyncio
+import csv
+import os
+import time
+
+import crunch.util as util
+from crunch.empatica.api import configured_devices
+
+MOCK_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../tests/mock_data")
+
+# tag of the sample lines, the subscription that streams them, the recording, its sampling rate in Hz and
+# its number of header rows, a rate of None means the first column is the time of the sample, like the
+# inter beat intervals
+RECORDINGS = [
+    ("E4_Gsr", "gsr", "EDA.csv", 4, 1),
+    ("E4_Temperature", "tmp", "TEMP.csv", 4, 1),
+    ("E4_Bvp", "bvp", "BVP.csv", 64, 2),
+    ("E4_Acc", "acc", "ACC.csv", 32, 2),
+    ("E4_Ibi", "ibi", "IBI.csv", None, 1),
+    ("E4_Hr", "ibi", "HR.csv", 1, 1),
+]
+
+
+class Recording:
+    """ The samples of the recordings, ordered by their time from the start of the recording """
+
+    def __init__(self, directory=MOCK_DATA):
+        """
+        :param directory: folder of the recordings, in the format of the E4 session exports
+        :type directory: str
+        """
+        samples = []
+        for tag, subscription, file_name, rate, header_rows in RECORDINGS:
+            with open(os.path.join(directory, file_name)) as file:
+                rows = [[value.strip() for value in row] for row in csv.reader(file) if row][header_rows:]
+            for i, row in enumerate(rows):
+                if rate is None:
+                    samples.append((float(row[0]), tag, subscription, " ".join(row[1:])))
+                else:
+                    samples.append((i / rate, tag, subscription, " ".join(row)))
+        samples.sort(key=lambda sample: sample[0])
+        self.offsets = [sample[0] for sample in samples]
+        self.samples = [sample[1:] for sample in samples]
+        # the recording is looped, with the length of its longest stream plus one sample of the slowest rate
+        self.duration = self.offsets[-1] + 1.0
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class E4Emulator:
+    """ The streaming server, with virtual devices streaming the recording """
+
+    def __init__(self, devices=("C13A64",), speed=1.0, disconnect_interval=None, disconnect_mode="lost",
+                 recording=None, tick=0.01, decimal_comma=False):
+        """
+        :param devices: ids of the virtual devices
+        :type devices: list of str
+        :param speed: how many times faster than real time the recording is streamed, 1 to 1000
+        :type speed: float
+        :param disconnect_interval: seconds a session streams before it is disconnected, None never disconnects
+        :type disconnect_interval: float
+        :param disconnect_mode: "lost" sends the status line of a lost wristband, "close" closes the connection
+        :type disconnect_mode: str
+        :param recording: the recording the devices stream, defaults to the recordings in tests/mock_data
+        :type recording: Recording
+        :param tick: seconds between the writes of the samples that are due
+        :type tick: float
+        :param decimal_comma: send decimal commas, like the server does in some locales
+        :type decimal_comma: bool
+        """
+        assert 1 <= speed <= 1000, "The speed must be from 1 to 1000 times real time"
+        assert disconnect_mode in ("lost", "close")
+        self.devices = list(devices)
+        self.speed = speed
+        self.disconnect_interval = disconnect_interval
+        self.disconnect_mode = disconnect_mode
+        self.recording = recording or Recording()
+        self.tick = tick
+        self.decimal_comma = decimal_comma
+        self.connected = {}
+        # the writer of every open session, and a future that is done when the session has ended
+        self.open_sessions = {}
+        self.server = None
+        self.sessions = 0
+        self.disconnects = 0
+        self.samples_sent = 0
+        # the most seconds the samples were sent late, when a client or the emulator can not keep up
+        self.max_lag = 0.0
+
+    async def start(self, host="127.0.0.1", port=0):
+        """ Start listening, returns the port, a free port is picked when port is 0 """
+        self.server = await asyncio.start_server(self.serve, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """ Stop listening, and end the open sessions """
+        if self.server is not None:
+            self.server.close()
+        for writer in self.open_sessions:
+            writer.close()
+        if self.open_sessions:
+            await asyncio.wait(list(self.open_sessions.values()))
+
+    def stats(self):
+        return {"sessions": self.sessions, "disconnects": self.disconnects, "samples_sent": self.samples_sent,
+                "max_lag": round(self.max_lag, 3)}
+
+    async def serve(self, reader, writer):
+        """ A client session, replies to its commands and streams the subscribed recordings """
+        self.sessions += 1
+        session = {"device": None, "subscriptions": set(), "paused": True, "writer": writer}
+        self.open_sessions[writer] = asyncio.get_event_loop().create_future()
+        streaming = asyncio.ensure_future(self._stream(session))
+        try:
+            while not streaming.done():
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(self._reply(session, line.decode("utf-8", "replace").split()).encode() + b"\n")
+        except ConnectionError:
+            pass
+        finally:
+            streaming.cancel()
+            await asyncio.wait([streaming])
+            if self.connected.get(session["device"]) is session:
+                del self.connected[session["device"]]
+            writer.close()
+            self.open_sessions.pop(writer).set_result(None)
+
+    def _reply(self, session, command):
+        if not command:
+            return "R ERR empty command"
+        name, arguments = command[0], command[1:]
+        if name == "device_list":
+            available = [device for device in self.devices if device not in self.connected]
+            return f"R device_list {len(available)}" + "".join(f" | {device} Empatica_E4" for device in available)
+        if name == "device_connect":
+            if not arguments or arguments[0] not in self.devices or arguments[0] in self.connected:
+                return "R device_connect ERR The device requested for connection is not available."
+            session["device"] = arguments[0]
+            self.connected[arguments[0]] = session
+            return "R device_connect OK"
+        if name == "device_disconnect":
+            self.connected.pop(session["device"], None)
+            session["device"] = None
+            return "R device_disconnect OK"
+        if name == "device_subscribe" and len(arguments) == 2:
+            if session["device"] is None:
+                return f"R device_subscribe {arguments[0]} ERR You are not connected to any device"
+            if arguments[1] == "ON":
+                session["subscriptions"].add(arguments[0])
+            else:
+                session["subscriptions"].discard(arguments[0])
+            return f"R device_subscribe {arguments[0]} OK"
+        if name == "pause" and arguments in (["ON"], ["OFF"]):
+            session["paused"] = arguments[0] == "ON"
+            return f"R pause {arguments[0]}"
+        return f"R {name} ERR unknown command"
+
+    async def _stream(self, session):
+        """ Write the samples that are due every tick, once the session is connected and not paused """
+        recording, writer = self.recording, session["writer"]
+        start = None
+        position = 0
+        while True:
+            await asyncio.sleep(self.tick)
+            if session["paused"] or session["device"] is None:
+                continue
+            now = time.time()
+            if start is None:
+                start = now
+            if self.disconnect_interval is not None and now - start >= self.disconnect_interval:
+                await self._disconnect(session)
+                return
+
+            # seconds into the looped recording
+            elapsed = (now - start) * self.speed
+            lines = []
+            first_due = None
+            while True:
+                loop, index = divmod(position, len(recording))
+                offset = loop * recording.duration + recording.offsets[index]
+                if offset > elapsed:
+                    break
+                if first_due is None:
+                    first_due = offset
+                tag, subscription, values = recording.samples[index]
+                if subscription in session["subscriptions"]:
+                    lines.append(f"{tag} {start + offset / self.speed:.6f} {values}\n")
+                position += 1
+            if not lines:
+                continue
+            self.max_lag = max(self.max_lag, now - start - first_due / self.speed - self.tick)
+            data = "".join(lines)
+            if self.decimal_comma:
+                data = data.replace(".", ",")
+            writer.write(data.encode())
+            self.samples_sent += len(lines)
+            # a client that can not keep up slows the stream down, which shows as lag
+            await writer.drain()
+
+    async def _disconnect(self, session):
+        self.disconnects += 1
+        if self.disconnect_mode == "lost":
+            session["writer"].write(f"R connection lost to device {session['device']}\n".encode())
+            await session["writer"].drain()
+        self.connected.pop(session["device"], None)
+        session["device"] = None
+        session["writer"].close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate the E4 streaming server with virtual devices")
+    parser.add_argument("--devices", nargs="+", default=configured_devices(),
+                        help="ids of the virtual devices")
+    parser.add_argument("--port", type=int, default=int(util.config("empatica", "port")))
+    parser.add_argument("--speed", type=float, default=1.0, help="times faster than real time, 1 to 1000")
+    parser.add_argument("--disconnect-interval", type=float, default=None,
+                        help="seconds a session streams before it is disconnected")
+    parser.add_argument("--disconnect-mode", choices=["lost", "close"], default="lost")
+    parser.add_argument("--decimal-comma", action="store_true")
+    args = parser.parse_args()
+
+    emulator = E4Emulator(args.devices, args.speed, args.disconnect_interval, args.disconnect_mode,
+                          decimal_comma=args.decimal_comma)
+    loop = asyncio.get_event_loop()
+    port = loop.run_until_complete(emulator.start(util.config("empatica", "address"), args.port))
+    print(f"Emulating the E4 streaming server on port {port} with the devices {', '.join(args.devices)}")
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        print(emulator.stats())
+    finally:
+        loop.run_until_complete(emulator.stop())
+
+
+if __name__ == "__main__":
+    main()
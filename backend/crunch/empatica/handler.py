@@ -1,11 +1,12 @@
-from collections import deque
-
 import numpy as np
 
 import crunch.util as util
+from crunch import handler, scheduler
+from crunch.empatica.measurements import beats, motion
+from crunch.ringbuffer import RingBuffer
 
 
-class DataHandler:
+class DataHandler(handler.BaseDataHandler):
     """
     Class that subscribes to a specific raw data stream,
     handles storing the data,
@@ -14,10 +15,11 @@ class DataHandler:
     """
     def __init__(self, measurement_func=None, measurement_path=None,
                  window_length=None, window_step=None,
-                 baseline_length=None, header_features=[]):
+                 baseline_length=None, header_features=[], offload=False,
+                 priority=scheduler.NORMAL, budget=None, gate=None):
         """
         :param measurement_func: the function we call to compute measurements from the raw data
-        :type measurement_func: (list) -> any
+        :type measurement_func: (np.ndarray) -> any
         :param measurement_path: path to the output csv file
         :type measurement_path: str
         :param window_length: length of the window, i.e number of data points for the function
@@ -27,48 +29,183 @@ class DataHandler:
         :type window_step: int
         :param baseline_length: Amount of data points required to calculate baseline
         :type baseline_length: int
+        :param offload: measure the windows in the process pool, for slow measurement functions
+        :type offload: bool
+        :param priority: scheduler.HIGH windows are never shed, scheduler.LOW windows are shed first
+        :type priority: int
+        :param budget: seconds a window may wait before it is stale, None uses the budget of the scheduler
+        :type budget: float
+        :param gate: called with the handler when a window is ready, the window is only measured if it returns True
+        :type gate: (handler.BaseDataHandler) -> bool
         """
-        assert window_length and window_step and measurement_func and baseline_length, \
-            "Need to supply the required parameters"
-
-        self.data_queue = deque(maxlen=window_length)
-        self.data_counter = 0
-        self.window_step = window_step
-        self.window_length = window_length
-        self.measurement_func = measurement_func
-        self.measurement_path = measurement_path
+        assert baseline_length, "Need to supply the required parameters"
+        handler.BaseDataHandler.__init__(self,
+                                         measurement_func=measurement_func,
+                                         measurement_path=measurement_path,
+                                         window_length=window_length,
+                                         window_step=window_step,
+                                         sample_shape=(),
+                                         offload=offload,
+                                         priority=priority,
+                                         budget=budget,
+                                         gate=gate)
         self.baseline_length = baseline_length
         self.baseline = None
         self.header_features = header_features
         self._handle_datapoint = self._calculate_baseline
 
-    def add_data_point(self, datapoint):
-        """ Receive a new data point, and call appropriate measurement function when we have enough points """
-        self.data_queue.append(datapoint)
-        self.data_counter += 1
+    def process_data_point(self):
+        """ Call appropriate measurement function when we have enough points """
+        self.collect()
         self._handle_datapoint()
 
     def _calculate_baseline(self):
         """ Calculates a baseline if we have received enough data points """
-        if self.data_counter % self.window_step == 0 and len(self.data_queue) == self.window_length:
-            measurement = util.to_list(self.measurement_func(list(self.data_queue)))
-            if self.baseline is None:
-                self.baseline = [[feature] for feature in measurement]
-            else:
-                for baseline_feature, feature in zip(self.baseline, measurement):
-                    baseline_feature.append(feature)
+        if self.window_ready():
+            self.submit(self._add_to_baseline)
         if self.data_counter >= self.baseline_length:
-            self.baseline = [abs(sum(feature)) / len(feature) for feature in self.baseline]
             self._handle_datapoint = self._calculate_measurement
+            self.defer(self._finish_baseline)
+
+    def _add_to_baseline(self, measurement):
+        """ Store the features of a measurement for the baseline """
+        measurement = util.to_list(measurement)
+        if self.baseline is None:
+            self.baseline = [[feature] for feature in measurement]
+        else:
+            for baseline_feature, feature in zip(self.baseline, measurement):
+                baseline_feature.append(feature)
+
+    def _finish_baseline(self):
+        """ The baseline of every feature is the average of the absolute values """
+        if self.baseline is None:
+            # the gate held back every window, the baseline is calculated from the next windows
+            self.baseline_length = self.data_counter + self.window_step
+            self._handle_datapoint = self._calculate_baseline
+            return
+        self.baseline = [abs(sum(feature)) / len(feature) for feature in self.baseline]
 
     def _calculate_measurement(self):
         """ Calculates a measurement and writes to csv if we have received enough data points """
-        if self.data_counter % self.window_step == 0 and len(self.data_queue) == self.window_length:
-            measurement = util.to_list(self.measurement_func(list(self.data_queue)))
-            normalized_measurement = np.dot(measurement, np.reciprocal(self.baseline)) / len(self.baseline)
-            if len(measurement) == 1:
-                util.write_csv(self.measurement_path, [normalized_measurement])
-            else:
-                util.write_csv(self.measurement_path,
-                               [normalized_measurement, *measurement],
-                               header_features=self.header_features)
+        if self.window_ready():
+            self.submit(self._publish_measurement)
+
+    def _publish_measurement(self, measurement):
+        """ Publish the measurement normalized by the baseline, and its features """
+        measurement = util.to_list(measurement)
+        normalized_measurement = np.dot(measurement, np.reciprocal(self.baseline)) / len(self.baseline)
+        if len(measurement) == 1:
+            util.publish(self.measurement_path, [normalized_measurement])
+        else:
+            util.publish(self.measurement_path,
+                         [normalized_measurement, *measurement],
+                         header_features=self.header_features)
+
+
+class BeatDetector:
+    """
+    Subscribes to the blocks of the blood volume pulse, and detects the heart beats in the last window_seconds
+    of the pulse every step_seconds. The intervals between the beats are published, and sent to the
+    handlers subscribed to the detector, like the inter beat intervals of the wristband
+    """
+
+    def __init__(self, measurement_path=None, fq=beats.FQ, window_seconds=8.0, step_seconds=0.5, margin_seconds=0.25):
+        """
+        :param measurement_path: path to the output csv file of the intervals
+        :type measurement_path: str
+        :param fq: frequency of the blood volume pulse
+        :type fq: int
+        :param window_seconds: seconds of pulse the beats are detected in
+        :type window_seconds: float
+        :param step_seconds: seconds between the detections
+        :type step_seconds: float
+        :param margin_seconds: a peak this close to the end of the window may still rise, it is left for the next
+        :type margin_seconds: float
+        """
+        self.measurement_path = measurement_path
+        self.fq = fq
+        # the device timestamp and the pulse of every data point
+        self.buffer = RingBuffer(int(window_seconds * fq), shape=(2,))
+        self.step = max(int(step_seconds * fq), 1)
+        self.margin = int(margin_seconds * fq)
+        self.next_detection = self.step
+        self.last_beat = None
+        self.subscribers = []
+
+    def add_subscriber(self, data_handler):
+        """ Send the beat to beat intervals to a data handler """
+        handler.subscribe(self.subscribers, data_handler)
+
+    def add_data_block(self, block):
+        """ Receive a block of data points, a row per data point with the device timestamp and the pulse """
+        self.buffer.extend(block[:, :2])
+        if self.buffer.count < self.next_detection:
+            return
+        self.next_detection = self.buffer.count + self.step
+        window = self.buffer.view()
+        peaks = beats.detect_beats(window[:, 1], self.fq)
+        for time in window[peaks[peaks < len(window) - self.margin], 0]:
+            if self.last_beat is not None and time - self.last_beat < beats.REFRACTORY:
+                # detected in an earlier window
+                continue
+            if self.last_beat is not None and time - self.last_beat <= beats.LONGEST_INTERVAL:
+                self._send_interval(float(time - self.last_beat))
+            self.last_beat = time
+
+    def _send_interval(self, interval):
+        util.publish(self.measurement_path, [round(interval, 6)])
+        for subscriber in self.subscribers:
+            subscriber.add_data_point(interval)
+
+
+class MotionArtifacts:
+    """
+    Subscribes to the blocks of the accelerometer, and flags the data points recorded while the wristband moves.
+    The other signals of the wristband have motion artifacts then, the gate of the detector holds back the
+    windows of their data handlers that overlap the motion
+    """
+
+    def __init__(self, fq=motion.FQ, threshold=motion.THRESHOLD, horizon_seconds=60.0):
+        """
+        :param fq: frequency of the accelerometer
+        :type fq: int
+        :param threshold: average change of the acceleration per data point in g, above which the wristband moves
+        :type threshold: float
+        :param horizon_seconds: seconds the flags are kept, at least the longest window of a gated handler
+        :type horizon_seconds: float
+        """
+        self.fq = fq
+        self.threshold = threshold
+        # the device timestamp of every data point, and whether it was recorded during motion
+        self.flags = RingBuffer(int(horizon_seconds * fq), shape=(2,))
+        # the last second of data points, the motion of the next data points is averaged over them
+        self.window = max(int(motion.WINDOW * fq), 1)
+        self.tail = np.zeros((0, 4))
+
+    def add_data_block(self, block):
+        """ Receive a block of data points, a row per data point with the device timestamp and x, y and z """
+        block = np.concatenate((self.tail, block[:, :4]))
+        flags = motion.detect_motion(block[:, 1:], self.fq, self.threshold)
+        if len(flags):
+            self.flags.extend(np.column_stack((block[-len(flags):, 0], flags)))
+        self.tail = block[-self.window:]
+
+    def moving(self, seconds):
+        """ Whether the wristband moved in the last seconds of the accelerometer """
+        flags = self.flags.view()
+        if not len(flags):
+            return False
+        recent = flags[:, 0] >= flags[-1, 0] - seconds
+        return bool(flags[recent, 1].any())
+
+    def gate(self, fq):
+        """
+        A gate for the data handlers of a signal, that holds back the windows recorded during motion
+
+        :param fq: frequency of the signal of the handlers
+        :type fq: int
+        :rtype: (handler.BaseDataHandler) -> bool
+        """
+        def gate(data_handler):
+            return not self.moving((data_handler.window_length - 1) / fq)
+        return gate
@@ -1,5 +1,7 @@
-from crunch.empatica.api import EmpaticaAPI
-from crunch.empatica.handler import DataHandler
+from crunch import scheduler
+from crunch.empatica.api import (EmpaticaAPI, configured_devices,
+                                 connect_devices)
+from crunch.empatica.handler import BeatDetector, DataHandler, MotionArtifacts
 from crunch.empatica.measurements import (compute_arousal,
                                           compute_emotional_regulation,
                                           compute_engagement,
@@ -7,38 +9,73 @@ from crunch.empatica.measurements import (compute_arousal,
                                           compute_stress)
 
 
-def start_empatica(api=EmpaticaAPI):
+def start_empatica(api=EmpaticaAPI, device_ids=None):
     """
-    start the empatica process control flow.
+    start the empatica process control flow, for every wristband in the process.
+
+    :param api: the api class, instantiated with the id of every wristband
+    :param device_ids: ids of the wristbands, defaults to the wristbands in the config
+    :type device_ids: list of str
+    """
+    device_ids = device_ids or configured_devices()
+    apis = []
+    for device_id in device_ids:
+        # in a group session every wristband has its own handlers, and its measurements are named after it
+        namespace = device_id + "_" if len(device_ids) > 1 else ""
+        apis.append(add_handlers(api(device_id), namespace))
+
+    # start up the apis
+    if len(apis) == 1:
+        apis[0].connect()
+    else:
+        connect_devices(apis)
+
+
+def add_handlers(api, namespace=""):
     """
-    # Instantiate the api
-    api = api()
+    Subscribe the data handlers of the measurements to the api of a wristband
+
+    :param namespace: prefix of the measurement paths of the wristband
+    :type namespace: str
+    :return: the api
+    """
+    # Instantiate the motion artifact detector, the EDA windows recorded while the wristband moves are not measured
+    motion_artifacts = MotionArtifacts()
+    api.add_subscriber(motion_artifacts, "ACC")
+    eda_gate = motion_artifacts.gate(fq=4)
+
+    # Instantiate the beat detector, that publishes the beat to beat intervals of the blood volume pulse
+    beat_detector = BeatDetector(measurement_path=namespace + "beat_to_beat.csv")
+    api.add_subscriber(beat_detector, "BVP")
 
     # Instantiate the arousal data handler and subscribe to the api
     arousal_handler = DataHandler(
         measurement_func=compute_arousal,
-        measurement_path="arousal.csv",
+        measurement_path=namespace + "arousal.csv",
         window_length=121,
         window_step=40,
-        baseline_length=161
+        baseline_length=161,
+        gate=eda_gate
     )
     api.add_subscriber(arousal_handler, "EDA")
 
     # Instantiate the engagement data handler and subscribe to the api
     engagement_handler = DataHandler(
         measurement_func=compute_engagement,
-        measurement_path="engagement.csv",
+        measurement_path=namespace + "engagement.csv",
         window_length=121,
         window_step=40,
         baseline_length=161,
-        header_features=["amplitude", "nr of peaks", "area under curve of tonic signal"]
+        header_features=["amplitude", "nr of peaks", "area under curve of tonic signal"],
+        offload=True,
+        gate=eda_gate
     )
     api.add_subscriber(engagement_handler, "EDA")
 
     # Instantiate the emotional regulation data handler and subscribe to the api
     emreg_handler = DataHandler(
         measurement_func=compute_emotional_regulation,
-        measurement_path="emotional_regulation.csv",
+        measurement_path=namespace + "emotional_regulation.csv",
         window_length=12,
         window_step=12,
         baseline_length=36,
@@ -49,24 +86,24 @@ def start_empatica(api=EmpaticaAPI):
     # Instantiate the entertainment data handler and subscribe to the api
     entertainment_handler = DataHandler(
         measurement_func=compute_entertainment,
-        measurement_path="entertainment.csv",
+        measurement_path=namespace + "entertainment.csv",
         window_length=20,
         window_step=10,
         baseline_length=30,
         header_features=["mean", "var", "max", "min", "diff", "correlation",
-                         "auto-correlation", "approximate entropy", "fluctuations"]
+                         "auto-correlation", "approximate entropy", "fluctuations"],
+        offload=True,
+        priority=scheduler.LOW
     )
     api.add_subscriber(entertainment_handler, "HR")
 
     # Instantiate the stress data handler and subscribe to the api
     stress_handler = DataHandler(
         measurement_func=compute_stress,
-        measurement_path="stress.csv",
+        measurement_path=namespace + "stress.csv",
         window_length=10,
         window_step=10,
         baseline_length=30
     )
     api.add_subscriber(stress_handler, "TEMP")
-
-    # start up the api
-    api.connect()
+    return api
@@ -1,7 +1,9 @@
 # flake8: noqa
 from crunch.empatica.measurements.arousal import compute_arousal
+from crunch.empatica.measurements.beats import detect_beats
 from crunch.empatica.measurements.emotional_regulation import \
     compute_emotional_regulation
 from crunch.empatica.measurements.engagement import compute_engagement
 from crunch.empatica.measurements.entertainment import compute_entertainment
+from crunch.empatica.measurements.motion import detect_motion
 from crunch.empatica.measurements.stress import compute_stress
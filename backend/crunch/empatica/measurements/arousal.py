@@ -1,3 +1,17 @@
+from crunch.streaming import PairwiseStream, streaming
+
+
+class ArousalStream(PairwiseStream):
+    """ Streaming compute_arousal, the sum of the positive changes between subsequent data points """
+
+    def term(self, previous, sample):
+        return sample - previous if sample > previous else 0.0
+
+    def value(self):
+        return float(self.total)
+
+
+@streaming(ArousalStream)
 def compute_arousal(eda):
     """
     calculating arousal based on EDA positive change [1]
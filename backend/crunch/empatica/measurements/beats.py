@@ -0,0 +1,41 @@
+import numpy as np
+
+""" Constants """
+FQ = 64  # frequency of the blood volume pulse, 64 data points per second
+SMOOTHING = 0.1  # seconds of the moving average that smooths the pulse
+REFRACTORY = 0.33  # shortest time between two beats in seconds, a heart rate of 180 beats per minute
+LONGEST_INTERVAL = 2.0  # longest time between two beats in seconds, a heart rate of 30 beats per minute
+THRESHOLD = 0.5  # standard deviations above the mean of the window a systolic peak rises at least
+
+
+def detect_beats(bvp, fq=FQ):
+    """
+    Find the heart beats in a window of the blood volume pulse, as the systolic peaks of the smoothed pulse.
+    Vectorized, the peaks closer than the refractory period are thinned out in a few passes over the peaks
+
+    :param bvp: the blood volume pulse
+    :type bvp: np.ndarray
+    :param fq: frequency of the blood volume pulse
+    :type fq: int
+    :return: indices of the beats in the window
+    :rtype: np.ndarray of int
+    """
+    bvp = np.asarray(bvp, dtype=np.float64)
+    if len(bvp) < 3:
+        return np.empty(0, dtype=np.intp)
+    width = max(int(SMOOTHING * fq), 1)
+    smooth = np.convolve(bvp, np.ones(width) / width, mode="same")
+    threshold = smooth.mean() + THRESHOLD * smooth.std()
+
+    middle = smooth[1:-1]
+    peaks = np.flatnonzero((middle > smooth[:-2]) & (middle >= smooth[2:]) & (middle > threshold)) + 1
+
+    # of two peaks closer than the refractory period the lower one is not a beat
+    distance = REFRACTORY * fq
+    while len(peaks) > 1:
+        close = np.flatnonzero(np.diff(peaks) < distance)
+        if not len(close):
+            break
+        lower = np.where(smooth[peaks[close]] < smooth[peaks[close + 1]], close, close + 1)
+        peaks = np.delete(peaks, np.unique(lower))
+    return peaks
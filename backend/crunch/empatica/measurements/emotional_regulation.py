@@ -5,11 +5,10 @@ def compute_percentage_of_ibi_that_differ(ibi):
     """
     Helper for emotional regulation
     :param ibi: list of ibi values
-    :type ibi: list of float
+    :type ibi: list of float or np.ndarray
     :return: percentage of ibi successive ibi values that differs by more than 50ms
     :rtype: float
     """
-    assert type(ibi) == list
     assert len(ibi) > 2
     differs_more = 0
     differs_less = 0
@@ -26,11 +25,10 @@ def compute_rmssd(ibi):
     Helper for emotional regulation
     One way to measure heart rate variability.
     :param ibi: list of ibi values
-    :type ibi: list of float
+    :type ibi: list of float or np.ndarray
     :return: root mean square of successive differences
     :rtype: float
     """
-    assert list == type(ibi)
     assert len(ibi) > 2
     total = 0
     for i in range(1, len(ibi)):
@@ -43,7 +41,7 @@ def compute_normal_ibi(ibi):
     Helper for emotional regulation
     Removes IBI values that are below the 10th percentile and above the 90th percentile.
     :param ibi: list of ibi values
-    :type ibi: list of float
+    :type ibi: list of float or np.ndarray
     :return: a list of ibi values where the 10th and 90th percentile are removed
     :rtype: list of float
     """
@@ -57,7 +55,7 @@ def compute_emotional_regulation(ibi):
     """
     Computes emotional regulation based on a list of IBI values
     :param ibi: list of ibi values
-    :type ibi: list of float
+    :type ibi: list of float or np.ndarray
     :return: a measure of emotional regulation
     :rtype: float, float, float
     """
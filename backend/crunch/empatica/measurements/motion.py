@@ -0,0 +1,32 @@
+import numpy as np
+
+""" Constants """
+FQ = 32  # frequency of the accelerometer, 32 data points per second
+SCALE = 64  # accelerometer units per g
+WINDOW = 1.0  # seconds the change of the acceleration is averaged over
+THRESHOLD = 0.05  # average change of the acceleration per data point, in g, above which the wristband moves
+
+
+def detect_motion(acc, fq=FQ, threshold=THRESHOLD):
+    """
+    Flag the accelerometer data points recorded while the wristband moves, when the average change of
+    the magnitude of the acceleration over the last second is above the threshold. The data points
+    recorded during motion have motion artifacts in the other signals of the wristband, like the EDA
+
+    :param acc: the x, y and z acceleration, a row per data point
+    :type acc: np.ndarray
+    :param fq: frequency of the accelerometer
+    :type fq: int
+    :param threshold: average change of the acceleration per data point in g
+    :type threshold: float
+    :return: a flag for every data point after the first second, the earlier data points have no full second
+    :rtype: np.ndarray of bool
+    """
+    window = max(int(WINDOW * fq), 1)
+    acc = np.asarray(acc, dtype=np.float64).reshape(-1, 3)
+    if len(acc) <= window:
+        return np.zeros(0, dtype=bool)
+    change = np.abs(np.diff(np.sqrt(np.einsum("ij,ij->i", acc, acc)))) / SCALE
+    # the average over the window ending at every data point, from the running sum of the changes
+    running = np.concatenate(([0.0], np.cumsum(change)))
+    return (running[window:] - running[:-window]) / window > threshold
@@ -1,12 +1,61 @@
+import math
+
 import numpy as np
 
+from crunch.streaming import streaming
+
+# seconds between temperature data points
+INTERVAL = 0.25
+
+
+class StressStream:
+    """
+    Streaming compute_stress. The least squares slope of the window is computed from the sum of the
+    temperatures and the sum of the temperatures weighted by their index in the window, which are
+    updated as temperatures enter and leave. Temperatures are offset by the first temperature, the
+    slope does not change, and the sums stay small.
+    """
+
+    def __init__(self):
+        self.offset = None
+        self.count = 0
+        self.sum = 0.0
+        self.weighted_sum = 0.0
+
+    def push(self, temperature):
+        if self.offset is None:
+            self.offset = temperature
+        temperature -= self.offset
+        self.weighted_sum += self.count * temperature
+        self.sum += temperature
+        self.count += 1
+
+    def evict(self, temperature, successor):
+        # the evicted temperature has index 0, and the index of every other temperature decreases by one
+        self.sum -= temperature - self.offset
+        self.count -= 1
+        self.weighted_sum -= self.sum
+
+    def value(self):
+        n = self.count
+        index_sum = n * (n - 1) / 2
+        index_square_sum = (n - 1) * n * (2 * n - 1) / 6
+        slope = (n * self.weighted_sum - index_sum * self.sum) / (n * index_square_sum - index_sum ** 2)
+        return float(-slope / INTERVAL)
+
+    def resync(self, window):
+        self.count = len(window)
+        self.sum = math.fsum(temperature - self.offset for temperature in window)
+        self.weighted_sum = math.fsum(i * (temperature - self.offset) for i, temperature in enumerate(window))
+
 
+@streaming(StressStream)
 def compute_stress(temps_list):
     """
     Predicts acute stress based on GSR temperature
     :param temps_list: list of temperatures
     :return: returns the overall change in temperature in the list
     """
-    slope = np.polyfit([0.25 * i for i in range(len(temps_list))], temps_list, 1)[0]
+    slope = np.polyfit([INTERVAL * i for i in range(len(temps_list))], temps_list, 1)[0]
     negative_slope = np.negative(slope)
     return float(negative_slope)
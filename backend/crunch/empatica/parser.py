@@ -0,0 +1,213 @@
+"""
+Parser of the lines the E4 streaming server sends, like
+
+    E4_Gsr 1600000000.1234 0.213
+    E4_Acc 1600000000.1234 51 -2 -10
+    R device_subscribe gsr OK
+
+A sample line has the stream tag, the device timestamp in unix seconds and the values of the sample,
+depending on the locale of the server with decimal commas.
+"""
+import re
+import warnings
+
+import numpy as np
+
+# the streams of the wristband, by the tag of their sample lines
+STREAMS = {
+    b"E4_Gsr": "EDA",
+    b"E4_Temperature": "TEMP",
+    b"E4_Hr": "HR",
+    b"E4_Ibi": "IBI",
+    b"E4_Bvp": "BVP",
+    b"E4_Acc": "ACC",
+}
+
+# the fields of the sample lines of every stream, the tag, the device timestamp and the values
+FIELDS = {tag: 5 if name == "ACC" else 3 for tag, name in STREAMS.items()}
+
+DECIMAL_COMMA = bytes.maketrans(b",", b".")
+
+
+class StreamParser:
+    """
+    Parses the lines received from the streaming server in a reusable buffer, without decoding them to strings.
+    A line split between two receives is kept at the start of the buffer until the rest arrives.
+    Decimal commas are replaced by dots in every line, the responses to commands included.
+
+    Sample lines are dispatched through a table of callbacks keyed on the stream tag, other lines,
+    like the responses to commands, are passed to on_message. The sample lines of the streams of the wristband
+    without the number of fields of their stream are counted as malformed and skipped.
+
+    The samples of the high rate streams, like the blood volume pulse, are parsed in blocks instead: the lines
+    of a block stream received at once are cut out with a regular expression, and parsed by NumPy in one go.
+
+    While a sample is dispatched, backlog is the number of samples of its stream parsed after it in the same
+    bytes, the samples still waiting to be dispatched.
+    """
+
+    def __init__(self, dispatch, on_message=None, buffer_size=65536, blocks=None):
+        """
+        :param dispatch: callback per stream tag, called with the device timestamp and the values of a sample
+        :type dispatch: dict of bytes to (float, float, ...) -> None
+        :param on_message: called with the other lines, without the line end
+        :type on_message: (bytes) -> None
+        :param buffer_size: the longest line that can be parsed, and the most bytes received at a time
+        :type buffer_size: int
+        :param blocks: callback per block stream tag, called with an array of the samples received at once,
+        a row per sample with the device timestamp followed by the values
+        :type blocks: dict of bytes to (np.ndarray) -> None
+        """
+        self.dispatch = dispatch
+        self.on_message = on_message
+        self.blocks = blocks or {}
+        self.block_patterns = {tag: re.compile(rb"^" + re.escape(tag) + rb" ([^\n]*)", re.MULTILINE)
+                               for tag in self.blocks}
+        self.block_lines = re.compile(rb"^(?:" + rb"|".join(map(re.escape, self.blocks)) + rb") [^\n]*\n?",
+                                      re.MULTILINE) if self.blocks else None
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        # number of bytes in the buffer, the start of a line that has not been completed yet
+        self.length = 0
+        # whether the rest of a dropped line is still arriving
+        self.skipping = False
+        self.samples = 0
+        self.backlog = 0
+        self.malformed = 0
+        self.dropped_bytes = 0
+
+    def receive(self, sock):
+        """
+        Receive from a socket straight into the buffer, and parse the completed lines
+
+        :type sock: socket.socket
+        :return: number of bytes received, 0 when the connection is closed
+        :rtype: int
+        """
+        if self.length == len(self.buffer):
+            self._drop_line()
+        received = sock.recv_into(self.view[self.length:])
+        if received:
+            self._parse(received)
+        return received
+
+    def feed(self, data):
+        """ Parse received bytes """
+        data = memoryview(data)
+        while len(data):
+            if self.length == len(self.buffer):
+                self._drop_line()
+            count = min(len(self.buffer) - self.length, len(data))
+            self.view[self.length:self.length + count] = data[:count]
+            data = data[count:]
+            self._parse(count)
+
+    def reset(self):
+        """ Forget the incomplete line, i.e after a reconnect """
+        self.length = 0
+        self.skipping = False
+
+    def _drop_line(self):
+        """ The buffer is full without a line end, the line is too long to parse """
+        self.dropped_bytes += self.length
+        self.length = 0
+        self.skipping = True
+
+    def _parse(self, received):
+        buffer, view = self.buffer, self.view
+        new = self.length
+        end = new + received
+        last = buffer.rfind(b"\n", new, end)
+        start = 0
+        if self.skipping:
+            start = buffer.find(b"\n", new, end) + 1
+            if not start:
+                self.dropped_bytes += end
+                self.length = 0
+                return
+            self.dropped_bytes += start
+            self.skipping = False
+        if last < start:
+            self.length = end - start
+            return
+
+        # the completed lines are split in one go, parsing them byte by byte in python is far slower
+        lines = bytes(view[start:last])
+        # keep the incomplete line at the start of the buffer, before the callbacks see the completed lines
+        self.length = end - last - 1
+        if self.length:
+            buffer[:self.length] = view[last + 1:end]
+        if b"," in lines:
+            lines = lines.translate(DECIMAL_COMMA)
+        if self.blocks:
+            lines = self._parse_blocks(lines)
+        get_callback = self.dispatch.get
+        get_count = FIELDS.get
+        # the sample lines of every stream still to be dispatched
+        remaining = {tag: lines.count(tag) for tag in self.dispatch}
+        for fields in map(bytes.split, lines.split(b"\n")):
+            if not fields:
+                continue
+            callback = get_callback(fields[0])
+            if callback is None:
+                if self.on_message is not None:
+                    self.on_message(b" ".join(fields))
+                continue
+            remaining[fields[0]] -= 1
+            count = get_count(fields[0], len(fields))
+            try:
+                if len(fields) != count:
+                    raise ValueError("sample with the wrong number of values")
+                if count == 3:
+                    sample = float(fields[1]), float(fields[2])
+                elif len(fields) > 1:
+                    # a sample of the accelerometer, or without values, like a press of the button of the wristband
+                    sample = [float(field) for field in fields[1:]]
+                else:
+                    raise ValueError("sample without a timestamp")
+            except ValueError:
+                self.malformed += 1
+                continue
+            self.samples += 1
+            self.backlog = remaining[fields[0]]
+            callback(*sample)
+
+    def _parse_blocks(self, lines):
+        """ Dispatch the samples of the block streams in lines, returns the other lines """
+        found = False
+        for tag, callback in self.blocks.items():
+            if tag not in lines:
+                continue
+            found = True
+            samples = self.block_patterns[tag].findall(lines)
+            width = FIELDS[tag] - 1 if tag in FIELDS else len(samples[0].split())
+            try:
+                # a sample with a value too many and one with a value too few would parse to the right length
+                if {sample.count(b" ") for sample in samples} != {width - 1}:
+                    raise ValueError("the samples do not have the same number of values")
+                with warnings.catch_warnings():
+                    # older NumPy versions warn, and stop, at the first value that is not a number
+                    warnings.simplefilter("error", DeprecationWarning)
+                    block = np.fromstring(b" ".join(samples), sep=" ")
+                if len(block) != width * len(samples):
+                    raise ValueError("the samples do not have the same number of values")
+                block = block.reshape(len(samples), width)
+            except (ValueError, DeprecationWarning):
+                block = self._parse_block_lines(samples, width)
+            self.samples += len(block)
+            callback(block)
+        return self.block_lines.sub(b"", lines) if found else lines
+
+    def _parse_block_lines(self, samples, width):
+        """ Parse the samples of a block one by one, skipping the malformed samples """
+        rows = []
+        for sample in samples:
+            try:
+                row = [float(field) for field in sample.split()]
+            except ValueError:
+                row = None
+            if row is None or len(row) != width:
+                self.malformed += 1
+            else:
+                rows.append(row)
+        return np.array(rows, dtype=np.float64).reshape(len(rows), width)
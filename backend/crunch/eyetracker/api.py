@@ -1,109 +1,12 @@
+import threading
 import time
 from math import isnan
 
-
-class GazedataToFixationdata:
-    """
-    Class that takes in gaze data points from the EyetrackerAPI, preprocesses the gaze points,
-     and computes fixation_data.
-
-     The class attribute velocity_threshold is very important and determines how sensitive
-     the class is to eyemovement. The higher the value is, the more gaze points will be
-     classified as part of a fixation. The value 0.05 was set based on 10 minutes of
-     experimentation, but should probably be adjusted.
-
-    RealAPI calls insert_new_gaze_data, the rest is helper functions.
-    For more information on gaze data and fixation data, see:
-    https://www.tobiipro.com/learn-and-support/learn/eye-tracking-essentials/types-of-eye-movements/
-    """
-    list_of_gaze_data_points_in_a_fixation = []
-    last_gaze_data_point = None
-    last_velocity_was_fixation = None
-
-    screen_proportions = (1920, 1080)
-    velocity_threshold = 0.05
-    first_time_stamp = None
-
-    def insert_new_gaze_data(self, left_eye_fx, left_eye_fy, right_eye_fx, right_eye_fy, timestamp):
-        """
-        Called from RealAPI. Preprocesses the gaze data and classifies the gaze point
-        as part of a saccade or a part of a fixation by checking if  velocity is
-        above or below the threshold.
-        The condition for returning a fixation point is that:
-            1. At least the 2 previous gaze points had low velocity (part of a fixation)
-            2. The current gaze point has high velocity (part of a saccade)
-
-        All parameters are float, but can be nan.
-        return: fixation point or None
-        """
-        fixation_point = None
-        fx = self.preprocess_eyetracker_gazepoint(left_eye_fx, right_eye_fx, is_fx=True) * self.screen_proportions[0]
-        fy = self.preprocess_eyetracker_gazepoint(left_eye_fy, right_eye_fy, is_fx=False) * self.screen_proportions[1]
-
-        if self.last_gaze_data_point is not None:
-            velocity = self.velocity(fx, fy, timestamp, self.last_gaze_data_point['fx'],
-                                     self.last_gaze_data_point['fy'],
-                                     self.last_gaze_data_point['timestamp'])
-
-            # Check if this is a saccade
-            if velocity > self.velocity_threshold:
-                # check if last
-                if self.last_velocity_was_fixation and len(self.list_of_gaze_data_points_in_a_fixation) > 2:
-                    fixation_point = self.end_fixation()
-                self.last_velocity_was_fixation = False
-
-            # If not a saccade, this is a fixation
-            else:
-                self.last_velocity_was_fixation = True
-                self.list_of_gaze_data_points_in_a_fixation.append({"fx": fx, "fy": fy, "timestamp": timestamp})
-
-        self.last_gaze_data_point = {"fx": fx, "fy": fy, "timestamp": timestamp}
-        if self.first_time_stamp is None:
-            self.first_time_stamp = timestamp
-
-        return fixation_point
-
-    def end_fixation(self):
-        """Ends the fixation by setting initTime, endTime, fx and fy"""
-        number_of_gazepoints = len(self.list_of_gaze_data_points_in_a_fixation)
-
-        initTime = (self.list_of_gaze_data_points_in_a_fixation[0]["timestamp"] - self.first_time_stamp) / 1000
-        endTime = (self.list_of_gaze_data_points_in_a_fixation[-1]["timestamp"] - self.first_time_stamp) / 1000
-        fx = sum(gazepoint['fx'] for gazepoint in self.list_of_gaze_data_points_in_a_fixation) / number_of_gazepoints
-        fy = sum(gazepoint['fy'] for gazepoint in self.list_of_gaze_data_points_in_a_fixation) / number_of_gazepoints
-        fixation_point = {"initTime": initTime, "endTime": endTime, "fx": fx, "fy": fy}
-        self.list_of_gaze_data_points_in_a_fixation = []
-
-        return fixation_point
-
-    def distance(self, fx1, fy1, fx2, fy2):
-        """returns euclidean distance"""
-        return ((fx1 - fx2) ** 2 + (fy1 - fy2) ** 2) ** 0.5
-
-    def velocity(self, fx1, fy1, timestamp1, fx2, fy2, timestamp2):
-        """Velocity measures how fast the eyes move from gazepoint 1 to gazepoint 2. euclidean distance/time"""
-        return self.distance(fx1, fy1, fx2, fy2) / (abs(timestamp2 - timestamp1))
-
-    def preprocess_eyetracker_gazepoint(self, left_eye_fx_or_fy, right_eye_fx_or_fy, is_fx=True):
-        """
-        Takes in either a left and a right fx value, or a left and a right fy value
-
-        :return fx or fy: average of the left and right eye coordinate
-        :type fx or fy: float
-        """
-        if isnan(left_eye_fx_or_fy) and isnan(right_eye_fx_or_fy):
-            if is_fx and self.last_gaze_data_point is not None:
-                return self.last_gaze_data_point["fx"]
-            elif not is_fx and self.last_gaze_data_point is not None:
-                return self.last_gaze_data_point["fy"]
-            else:
-                return 0
-
-        elif isnan(left_eye_fx_or_fy):
-            left_eye_fx_or_fy = right_eye_fx_or_fy
-        elif isnan(right_eye_fx_or_fy):
-            right_eye_fx_or_fy = left_eye_fx_or_fy
-        return (left_eye_fx_or_fy + right_eye_fx_or_fy) / 2
+from crunch import scheduler, util
+from crunch.eyetracker.fixation import GazedataToFixationdata  # noqa
+from crunch.eyetracker.fixation import FIXATION_DETECTORS
+from crunch.handler import subscribe
+from crunch.spsc import SpscRing
 
 
 class EyetrackerAPI:
@@ -111,15 +14,39 @@ class EyetrackerAPI:
     Responsible for connecting to and receiving gaze data from the eyetracker,
     and then the API sends the data to all handlers that are subscribed.
 
+    The eyetracker calls gaze_data_callback on its own thread frequency times a second, up to 1200, the callback
+    only pushes the gaze sample to a lock-free ring. A processing thread drains the ring in blocks,
+    so slow measurements delay the processing thread instead of the samples of the eyetracker.
+
     The API cleans pupil data (gaze data) which is sent to gaze subscribers.
-    The API sends gaze data to GazedataToFixationdata which irregularly returns
-    fixation data that is sent to fixation subscribers.
+    The API sends gaze data to a fixation detector which irregularly returns
+    fixation data that is sent to fixation subscribers. The detector is GazedataToFixationdata,
+    by the velocity of the gaze, or DispersionFixationdata, by the dispersion of the gaze points.
     """
     subscribers = {"gaze": [], "fixation": []}
     last_valid_pupil_data = (0.5, 0.5)
 
-    def __init__(self):
-        self.gaze_to_fixation = GazedataToFixationdata()
+    frequency = float(util.config("eyetracker", "frequency"))
+    ring_capacity = int(util.config("eyetracker", "ring_capacity"))
+    block_size = int(util.config("eyetracker", "block_size"))
+    poll_interval = float(util.config("eyetracker", "poll_interval"))
+    fixation_detector = util.config("eyetracker", "fixation_detector")
+
+    def __init__(self, fixation_detector=None, frequency=None):
+        """
+        :param fixation_detector: "ivt" detects the fixations by velocity, "idt" by dispersion,
+        defaults to the fixation detector in the config
+        :type fixation_detector: str
+        :param frequency: gaze samples a second the eyetracker is set to, defaults to the frequency in the config
+        :type frequency: float
+        """
+        self.frequency = float(frequency or self.frequency)
+        self.gaze_to_fixation = FIXATION_DETECTORS[fixation_detector or self.fixation_detector]()
+        # left fx, left fy, right fx, right fy, timestamp, left pupil, right pupil, and the arrival time
+        self.gaze_ring = SpscRing(self.ring_capacity, 8)
+        self.scheduler = scheduler.current()
+        self.stopped = threading.Event()
+        self.processing_thread = None
 
     def connect(self):
         """ Connect the eyetracker to the callback function """
@@ -129,20 +56,93 @@ class EyetrackerAPI:
             print("No eyetracker was found")
         else:
             my_eyetracker = tr.find_all_eyetrackers()[0]
+            if not self.set_gaze_output_frequency(my_eyetracker):
+                return
+            self.start_processing()
             my_eyetracker.subscribe_to(tr.EYETRACKER_GAZE_DATA, self.gaze_data_callback, as_dictionary=True)
             #  For some reason we get crashes if this time.sleep is removed
             while True:
                 time.sleep(15)
             # my_eyetracker.unsubscribe_from(tr.EYETRACKER_GAZE_DATA, self.gaze_data_callback)
 
+    def set_gaze_output_frequency(self, eyetracker):
+        """
+        Set the eyetracker to the frequency of the api, the windows of the handlers are scaled to it
+
+        :param eyetracker: the eyetracker of tobii_research
+        :return: False if the eyetracker does not support the frequency
+        :rtype: bool
+        """
+        frequencies = eyetracker.get_all_gaze_output_frequencies()
+        supported = [frequency for frequency in frequencies if abs(frequency - self.frequency) < 1]
+        if not supported:
+            print(f"The eyetracker does not support {self.frequency:g} Hz, set the frequency in setup.cfg to one of",
+                  ", ".join(f"{frequency:g}" for frequency in frequencies))
+            return False
+        eyetracker.set_gaze_output_frequency(supported[0])
+        return True
+
     def gaze_data_callback(self, gaze_data):
-        """Callback function that the eyetracker device calls 120 times a second. Inserts data to EyetrackerAPI"""
+        """Callback function that the eyetracker device calls frequency times a second. Queues the gaze sample"""
         left_eye_fx, left_eye_fy = gaze_data['left_gaze_point_on_display_area']
         right_eye_fx, right_eye_fy = gaze_data['right_gaze_point_on_display_area']
-        timestamp = gaze_data['device_time_stamp']
-        lpup = gaze_data['left_pupil_diameter']
-        rpup = gaze_data['right_pupil_diameter']
+        self.gaze_ring.push((left_eye_fx, left_eye_fy, right_eye_fx, right_eye_fy,
+                             gaze_data['device_time_stamp'],
+                             gaze_data['left_pupil_diameter'], gaze_data['right_pupil_diameter'],
+                             self.scheduler.clock()))
+
+    def start_processing(self):
+        """ Start the thread that sends the queued gaze samples to the handlers """
+        self.stopped.clear()
+        self.processing_thread = threading.Thread(target=self.process_samples, daemon=True)
+        self.processing_thread.start()
+
+    def stop_processing(self):
+        """ Stop the processing thread, after it has processed the queued gaze samples """
+        self.stopped.set()
+        if self.processing_thread is not None:
+            self.processing_thread.join()
+            self.processing_thread = None
+
+    def process_samples(self):
+        """ Processing thread, drains the ring until stopped and reports dropped gaze samples """
+        reported_drops = 0
+        while not self.stopped.is_set():
+            if not self.process_pending():
+                self.stopped.wait(self.poll_interval)
+            if self.gaze_ring.dropped != reported_drops:
+                reported_drops = self.gaze_ring.dropped
+                print("Eyetracker dropped gaze samples, the processing thread is behind:", self.gaze_ring.stats())
+        self.process_pending()
+
+    def process_pending(self):
+        """
+        Send the gaze samples queued in the ring to the handlers
+
+        :return: number of gaze samples processed
+        :rtype: int
+        """
+        processed = 0
+        block = self.gaze_ring.pop_block(self.block_size)
+        while len(block):
+            for i, sample in enumerate(block.tolist()):
+                # the samples after this one in the block and in the ring are its backlog
+                self.process_gaze_sample(*sample[:7], arrival=sample[7],
+                                         backlog=len(block) - i - 1 + len(self.gaze_ring))
+            processed += len(block)
+            block = self.gaze_ring.pop_block(self.block_size)
+        return processed
+
+    def process_gaze_sample(self, left_eye_fx, left_eye_fy, right_eye_fx, right_eye_fy, timestamp, lpup, rpup,
+                            arrival=None, backlog=0):
+        """
+        Compute the fixation and pupil data of a gaze sample, and send them to the handlers
 
+        :param arrival: when the gaze sample arrived, on the clock of the scheduler
+        :type arrival: float
+        :param backlog: number of gaze samples queued behind this one
+        :type backlog: int
+        """
         # handle fixation data
         fixation_point = self.gaze_to_fixation.insert_new_gaze_data(left_eye_fx,
                                                                     left_eye_fy,
@@ -150,9 +150,12 @@ class EyetrackerAPI:
                                                                     right_eye_fy,
                                                                     timestamp)
         if fixation_point is not None:
+            # the number of fixations in the queued gaze samples is unknown
+            self.scheduler.arrived(arrival, backlog=0)
             self.send_data_to_handlers("fixation", fixation_point)
 
         # handle gaze data
+        self.scheduler.arrived(arrival, backlog)
         gaze_point = self.preprocess_eyetracker_pupils(lpup, rpup)
         self.send_data_to_handlers("gaze", gaze_point)
 
@@ -183,4 +186,4 @@ class EyetrackerAPI:
         :param requested_data: name of the requested data
         :type requested_data: str
         """
-        self.subscribers[requested_data].append(handler)
+        subscribe(self.subscribers[requested_data], handler)
@@ -1,11 +1,9 @@
-from collections import deque
-
-from crunch import util
+from crunch import handler, scheduler, util
 
 from .measurements.information_processing_index import compute_ipi_thresholds
 
 
-class DataHandler:
+class DataHandler(handler.DataHandler):
     """
     Class that subscribes to a specific raw data stream,
     handles storing the data,
@@ -26,12 +24,16 @@ class DataHandler:
                  window_length=None,
                  window_step=None,
                  baseline_length=None,
-                 calculate_baseline=True):
+                 calculate_baseline=True,
+                 priority=scheduler.NORMAL,
+                 budget=None):
         """
         :param measurement_func: the function we call to compute measurements from the raw data
-        :type measurement_func: (list) -> float
+        :type measurement_func: (np.ndarray) -> float
         :param measurement_path: path to the output csv file
         :type measurement_path: str
+        :param subscribed_to: the keys of the data points, every key is a keyword argument of measurement_func
+        :type subscribed_to: list of str
         :param window_length: length of the window, i.e number of data points for the function
         :type window_length: int
         :param window_step: how many steps for a new window, i.e for 6 steps,
@@ -41,62 +43,23 @@ class DataHandler:
         :type baseline_length: int
         :param calculate_baseline: Should baseline be calculated? Skip if False
         :type calculate_baseline: bool
+        :param priority: scheduler.HIGH windows are never shed, scheduler.LOW windows are shed first
+        :type priority: int
+        :param budget: seconds a window may wait before it is stale, None uses the budget of the scheduler
+        :type budget: float
         """
-        assert window_length and window_step and measurement_func and subscribed_to, \
-            "Need to supply the required parameters"
-
-        self.data_queues = {key: deque(maxlen=window_length) for key in subscribed_to}
-        self.data_counter = 0
-        self.window_step = window_step
-        self.window_length = window_length
-        self.measurement_func = measurement_func
-        self.measurement_path = measurement_path
-        self.subscribed_to = subscribed_to
-
-        self.phase_func = self.baseline_phase if calculate_baseline else self.csv_phase
-        self.calculate_baseline = calculate_baseline
-        self.baseline = 0
-        self.list_of_baseline_values = []
-        self.baseline_length = baseline_length
-
-    def add_data_point(self, datapoint):
-        """
-        This is the only function in Datahandler that is called from the API. It appends the
-        values in datapoint and checks if we have enough data points to calculate to call
-         phase_func. In the beginning, phase_func is set to baseline_phase.
-
-        :param datapoint: A fixation data point
-        :type datapoint: dictionary of floats
-        """
-        self.data_counter += 1
-        for key, value in datapoint.items():
-            self.data_queues[key].append(value)
-        if (self.data_counter % self.window_step == 0
-                and all(len(queue) == self.window_length for _, queue in self.data_queues.items())):
-            self.phase_func()
-
-    def baseline_phase(self):
-        """
-        Appends a value to be used for calculating the baseline, then checks if we have enough data points
-        to transition to next phase.
-        """
-        measurement = self.measurement_func(**{key: list(queue) for key, queue in self.data_queues.items()})
-        self.list_of_baseline_values.append(measurement)
-        if len(self.list_of_baseline_values) >= self.baseline_length:
-            self.transition_to_csv_phase()
-
-    def transition_to_csv_phase(self):
-        """Compute baseline and set phase_func to csv_phase"""
-        self.baseline = float(sum(self.list_of_baseline_values) / len(self.list_of_baseline_values))
-        self.phase_func = self.csv_phase
-        assert 0 <= self.baseline < float('inf') and type(self.baseline) == float
-
-    def csv_phase(self):
-        """Calculate measurement and write the ratio relative to baseline to csv file"""
-        measurement = self.measurement_func(**{key: list(queue) for key, queue in self.data_queues.items()})
-        if self.calculate_baseline:
-            measurement = round(measurement / self.baseline, 6)
-        util.write_csv(self.measurement_path, [measurement])
+        assert subscribed_to, "Need to supply the required parameters"
+        handler.DataHandler.__init__(self,
+                                     measurement_func=measurement_func,
+                                     measurement_path=measurement_path,
+                                     window_length=window_length,
+                                     window_step=window_step,
+                                     baseline_length=baseline_length,
+                                     calculate_baseline=calculate_baseline,
+                                     subscribed_to=subscribed_to,
+                                     sample_shape=(),
+                                     priority=priority,
+                                     budget=budget)
 
 
 class ThresholdDataHandler(DataHandler):
@@ -105,6 +68,8 @@ class ThresholdDataHandler(DataHandler):
     compute the first measurement value. This makes a specialized handler necessary.
     IpiHandler inherits from DataHandler as the baseline_phase and csv_phase are very similar
     """
+    # the data points of the threshold phase are not stored in the ring buffers
+    groupable = False
 
     def __init__(self,
                  measurement_func,
@@ -180,14 +145,9 @@ class ThresholdDataHandler(DataHandler):
         :param datapoint: A fixation data point
         :type datapoint: dictionary of floats
         """
-        for key, value in datapoint.items():
-            self.data_queues[key].append(value)
-        self.data_counter += 1
-        if self.data_counter % self.window_step == 0 and len(self.data_queues["initTime"]) == self.window_length:
-            argument_dictionary = {key: list(queue) for key, queue in self.data_queues.items()}
-            argument_dictionary["short_threshold"] = self.short_threshold
-            argument_dictionary["long_threshold"] = self.long_threshold
-            measurement = self.measurement_func(**argument_dictionary)
+        self.append(datapoint)
+        if self.window_ready():
+            measurement = self.measure(short_threshold=self.short_threshold, long_threshold=self.long_threshold)
             self.list_of_baseline_values.append(measurement)
             if len(self.list_of_baseline_values) >= self.baseline_length:
                 self.transition_to_csv_phase()
@@ -206,14 +166,9 @@ class ThresholdDataHandler(DataHandler):
         :param datapoint: A fixation data point
         :type datapoint: dictionary of floats
         """
-        for key, value in datapoint.items():
-            self.data_queues[key].append(value)
-        self.data_counter += 1
-        if self.data_counter % self.window_step == 0 and len(self.data_queues["initTime"]) == self.window_length:
-            argument_dictionary = {key: list(queue) for key, queue in self.data_queues.items()}
-            argument_dictionary["short_threshold"] = self.short_threshold
-            argument_dictionary["long_threshold"] = self.long_threshold
-            measurement = self.measurement_func(**argument_dictionary)
+        self.append(datapoint)
+        if self.window_ready():
+            measurement = self.measure(short_threshold=self.short_threshold, long_threshold=self.long_threshold)
             if self.calculate_baseline:
                 measurement = round(measurement / self.baseline, 6)
-            util.write_csv(self.measurement_path, [measurement])
+            util.publish(self.measurement_path, [measurement])
@@ -1,8 +1,8 @@
+from crunch import scheduler
 from crunch.eyetracker.api import EyetrackerAPI
 from crunch.eyetracker.handler import DataHandler, ThresholdDataHandler
-from crunch.eyetracker.measurements import (compute_anticipation,
-                                            compute_cognitive_load,
-                                            compute_ipi,
+from crunch.eyetracker.measurements import (CognitiveLoad,
+                                            compute_anticipation, compute_ipi,
                                             compute_perceived_difficulty)
 
 
@@ -11,6 +11,8 @@ def start_eyetracker(api=EyetrackerAPI):
 
     # Instantiate the api
     api = api()
+    # the cognitive load of about 8 seconds of pupil sizes every 2 seconds, 1000 every 250 at 120 Hz
+    pupil_window_length = round(1000 / 120 * api.frequency)
 
     # Instantiate the information processing index data handler and subscribe to the api
     ipi_handler = ThresholdDataHandler(
@@ -42,17 +44,18 @@ def start_eyetracker(api=EyetrackerAPI):
         subscribed_to=["initTime", "endTime", "fx", "fy"],
         window_length=10,
         window_step=10,
-        calculate_baseline=False
+        calculate_baseline=False,
+        priority=scheduler.LOW
     )
     api.add_subscriber(anticipation_handler, "fixation")
 
     # Instantiate the cognital load data handler and subscribe to the api
     cognitive_load_handler = DataHandler(
-        measurement_func=compute_cognitive_load,
+        measurement_func=CognitiveLoad(fq=api.frequency),
         measurement_path="cognitive_load.csv",
         subscribed_to=["lpup", "rpup"],
-        window_length=1000,
-        window_step=250,
+        window_length=pupil_window_length,
+        window_step=pupil_window_length // 4,
         baseline_length=5
     )
     api.add_subscriber(cognitive_load_handler, "gaze")
@@ -1,7 +1,7 @@
 # flake8: noqa
 from crunch.eyetracker.measurements.anticipation import compute_anticipation
-from crunch.eyetracker.measurements.cognitive_load import \
-    compute_cognitive_load
+from crunch.eyetracker.measurements.cognitive_load import (
+    CognitiveLoad, compute_cognitive_load)
 from crunch.eyetracker.measurements.information_processing_index import \
     compute_information_processing_index as compute_ipi
 from crunch.eyetracker.measurements.information_processing_index import \
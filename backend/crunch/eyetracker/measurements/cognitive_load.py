@@ -4,7 +4,7 @@ import numpy as np
 import pywt
 
 
-def compute_cognitive_load(lpup, rpup):
+def compute_cognitive_load(lpup, rpup, fq=120):
     """
     Computes the cognitive load based on the size of the pupils in a time window
     The modmax and lhipa algorithm are taken directly from this paper: https://doi.org/10.1145/3313831.3376394
@@ -13,11 +13,13 @@ def compute_cognitive_load(lpup, rpup):
     :type lpup: list of int
     :param rpup: values for right pupil size
     :type rpup: list of int
+    :param fq: frequency of the pupil sizes
+    :type fq: float
     :return: Measure of cognitive load
     :rtype: float
     """
     assert len(lpup) == len(rpup)
-    signal_dur = len(lpup) / 120
+    signal_dur = len(lpup) / fq
     average_pupil_values = [(lp + rp) / 2 for lp, rp in zip(lpup, rpup)]
 
     return lhipa(average_pupil_values, signal_dur)
@@ -94,3 +96,194 @@ def lhipa(d, signal_dur):
             ctr += 1
     LHIPA = float(ctr) / tt
     return LHIPA
+
+
+class CognitiveLoad:
+    """
+    Cognitive load engine, computes the cognitive load of compute_cognitive_load for the sliding windows
+    of a data handler, with the wavelet filters cached, and lhipa and modmax vectorized.
+
+    The windows of the handler overlap, by 750 of 1000 pupil sizes. The wavelet coefficients are computed
+    undecimated (a trous) on the stream of pupil sizes, so every pupil size is convolved once, and the
+    coefficients of a window are read from the stream, whatever the step of the windows. Only the coefficients
+    of the window that the periodized transform wraps around the ends of the window are computed from the window.
+    """
+
+    def __init__(self, fq=120, wavelet="sym16"):
+        """
+        :param fq: frequency of the pupil sizes
+        :type fq: float
+        :param wavelet: the wavelet of lhipa
+        :type wavelet: str
+        """
+        self.fq = fq
+        self.wavelet = pywt.Wavelet(wavelet)
+        self.dec_lo = np.array(self.wavelet.dec_lo)
+        self.dec_hi = np.array(self.wavelet.dec_hi)
+        # coefficient k of a level is at 2k + offset of the level below, in the periodized transform
+        self.offset = self.wavelet.dec_len // 2
+        self.layouts = {}
+        self.dilated = {}
+        # the last window, and the undecimated coefficients of the stream at its pupil sizes
+        self.window = None
+        self.stream = None
+        self.shift = None
+        self.reused_windows = 0
+
+    def __call__(self, lpup, rpup):
+        """
+        Computes the cognitive load based on the size of the pupils in a time window
+
+        :param lpup: values for left pupil size
+        :type lpup: np.ndarray
+        :param rpup: values for right pupil size
+        :type rpup: np.ndarray
+        :return: Measure of cognitive load
+        :rtype: float
+        """
+        assert len(lpup) == len(rpup)
+        d = (np.asarray(lpup, dtype=np.float64) + np.asarray(rpup, dtype=np.float64)) / 2
+        return self.lhipa(d, len(d) / self.fq)
+
+    def lhipa(self, d, signal_dur):
+        """ lhipa of the pupil diameter signal d, that lasts signal_dur seconds """
+        layout = self._layout(len(d))
+        if layout is None:
+            # the levels of the window length are not all periodized without padding
+            maxlevel = pywt.dwt_max_level(len(d), filter_len=self.wavelet.dec_len)
+            hif, lof = 1, int(maxlevel / 2)
+            cD_H = pywt.downcoef("d", d, self.wavelet, "per", level=hif)
+            cD_L = pywt.downcoef("d", d, self.wavelet, "per", level=lof)
+        else:
+            hif, lof = layout["hif"], layout["lof"]
+            cD_H, cD_L = self._details(d, layout)
+        return count_lhipa_maxima(cD_H, cD_L, hif, lof) / signal_dur
+
+    def _layout(self, n):
+        """
+        The layout of the coefficients of a window of n pupil sizes, at every level: the position in the window
+        of the undecimated coefficient of every coefficient, and the coefficients the transform wraps around
+        """
+        if n in self.layouts:
+            return self.layouts[n]
+        maxlevel = pywt.dwt_max_level(n, filter_len=self.wavelet.dec_len)
+        lof = int(maxlevel / 2)
+        if lof < 1 or n % 2 ** lof:
+            self.layouts[n] = None
+            return None
+        taps = np.arange(self.wavelet.dec_len)
+        levels = []
+        # whether the coefficients of the level below are read from the stream, the pupil sizes always are
+        below = np.ones(n, dtype=bool)
+        for level in range(1, lof + 1):
+            k = np.arange(n >> level)
+            indices = 2 * k[:, None] + self.offset - taps
+            inside = (indices >= 0) & (indices < len(below))
+            interior = inside.all(axis=1)
+            interior[interior] = below[indices[interior]].all(axis=1)
+            boundary = np.flatnonzero(~interior)
+            position = 2 ** level * k + self.offset * (2 ** level - 1)
+            levels.append({"position": np.where(interior, position, 0),
+                           "boundary": boundary,
+                           "gather": indices[boundary] % len(below)})
+            below = interior
+        self.layouts[n] = {"hif": 1, "lof": lof, "levels": levels}
+        return self.layouts[n]
+
+    def _details(self, d, layout):
+        """ The detail coefficients at the high and low frequency levels, from the stream where they overlap """
+        n, lof = len(d), layout["lof"]
+        shift = self._find_shift(d)
+        if shift is None:
+            self.stream = {"a": [d.copy()] + [np.empty(n) for _ in range(1, lof)],
+                           "d": {level: np.empty(n) for level in {1, lof}}}
+            self._convolve(0, lof)
+        else:
+            self.reused_windows += 1
+            for array in self.stream["a"][1:] + list(self.stream["d"].values()):
+                array[:n - shift] = array[shift:]
+            self.stream["a"][0][:] = d
+            self._convolve(n - shift, lof)
+        self.window = d.copy()
+        self.shift = shift
+
+        details = {}
+        a = d
+        for level, coefficients in enumerate(layout["levels"], 1):
+            gathered = a[coefficients["gather"]]
+            if level in self.stream["d"]:
+                details[level] = self.stream["d"][level][coefficients["position"]]
+                details[level][coefficients["boundary"]] = gathered @ self.dec_hi
+            if level < lof:
+                a = self.stream["a"][level][coefficients["position"]]
+                a[coefficients["boundary"]] = gathered @ self.dec_lo
+        return details[1], details[lof]
+
+    def _find_shift(self, d):
+        """ How many pupil sizes the window moved since the last window, None when they do not overlap """
+        if self.window is None or len(self.window) != len(d):
+            return None
+        n = len(d)
+        # the windows usually move by the same step, else the step is searched for
+        if self.shift is not None and np.array_equal(self.window[self.shift:], d[:n - self.shift]):
+            return self.shift
+        for shift in np.flatnonzero(self.window[1:n // 2 + 1] == d[0]).tolist():
+            # the new pupil sizes need the undecimated coefficients of at least half a window
+            if np.array_equal(self.window[shift + 1:], d[:n - shift - 1]):
+                return shift + 1
+        return None
+
+    def _convolve(self, start, lof):
+        """ Compute the undecimated coefficients of the stream at the pupil sizes from start """
+        for level in range(1, lof + 1):
+            dilation = 2 ** (level - 1)
+            reach = dilation * (self.wavelet.dec_len - 1)
+            below = self.stream["a"][level - 1]
+            if start >= reach:
+                signal = below[start - reach:]
+            else:
+                # the pupil sizes before the window are not in the stream, they are only reached by the
+                # coefficients that are computed from the window
+                signal = np.concatenate((np.zeros(reach - start), below))
+            if level in self.stream["d"]:
+                self.stream["d"][level][start:] = np.convolve(signal, self._dilated(self.dec_hi, dilation), "valid")
+            if level < lof:
+                self.stream["a"][level][start:] = np.convolve(signal, self._dilated(self.dec_lo, dilation), "valid")
+
+    def _dilated(self, taps, dilation):
+        """ The filter with dilation - 1 zeros between its taps, cached """
+        key = (id(taps), dilation)
+        if key not in self.dilated:
+            self.dilated[key] = np.zeros(dilation * (len(taps) - 1) + 1)
+            self.dilated[key][::dilation] = taps
+        return self.dilated[key]
+
+
+def count_lhipa_maxima(cD_H, cD_L, hif, lof):
+    """
+    The number of modulus maxima of the LH:HF ratio below the universal threshold, lhipa and modmax
+    vectorized
+
+    :param cD_H: detail coefficients of the high frequency level
+    :type cD_H: np.ndarray
+    :param cD_L: detail coefficients of the low frequency level
+    :type cD_L: np.ndarray
+    :rtype: int
+    """
+    # normalize by 1/ 2j
+    cD_H = cD_H / math.sqrt(2 ** hif)
+    cD_L = cD_L / math.sqrt(2 ** lof)
+    # obtain the LH:HF ratio
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cD_LH = cD_L / cD_H[((2 ** lof) // (2 ** hif)) * np.arange(len(cD_L))]
+
+    # detect modulus maxima, the first and the last two coefficients are compared with themselves like modmax
+    m = np.abs(cD_LH)
+    ll = np.concatenate((m[:1], m[:-1]))
+    rr = m.copy()
+    rr[:-2] = m[1:-1]
+    cD_LHm = np.where((ll <= m) & (m >= rr) & ((ll < m) | (m > rr)), m, 0.0)
+
+    # threshold using universal threshold, the maxima above it are dropped
+    λuniv = np.std(cD_LHm) * math.sqrt(2.0 * np.log2(len(cD_LHm)))
+    return int(np.count_nonzero((cD_LHm > 0) & ~(cD_LHm > λuniv)))
@@ -20,7 +20,6 @@ def compute_information_processing_index(initTime, endTime, fx, fy,
     :rtype: float
     """
 
-    assert type(initTime) == type(endTime) == list
     assert len(initTime) == len(endTime) == len(fx) == len(fy)
     div = ipi_helper(initTime, endTime, fx, fy)
     number_of_long_f_short_s = max(np.sum(np.asarray(div) > long_threshold), 1)
@@ -65,7 +64,6 @@ def compute_ipi_thresholds(initTime, endTime, fx, fy):
     :return: lower and higher threshold
     :rtype: (float, float)
     """
-    assert type(initTime) == type(endTime) == list
     assert len(initTime) == len(endTime) == len(fx) == len(fy)
     div = ipi_helper(initTime, endTime, fx, fy)
 
@@ -0,0 +1,347 @@
+import abc
+from collections import deque
+
+import numpy as np
+
+from crunch import offload, scheduler, util
+from crunch.ringbuffer import RingBuffer
+
+# windows computed by a streaming measurement before its state is recomputed from the window
+RESYNC_INTERVAL = 100
+
+
+class BaseDataHandler(abc.ABC):
+    """
+    Core of the data handlers of every device. Keeps the latest window_length data points in
+    ring buffers, and tells when a window of data points is ready, every window_step data points.
+
+    A data point is a number, an array of a fixed shape, like the joints of a skeleton,
+    or a dictionary with a value for every key in subscribed_to, like a fixation. The measurement
+    function is called with a view of the window, or a view per key as keyword arguments,
+    the views are only valid during the call.
+
+    When the measurement function supports streaming (see crunch.streaming), and the data points
+    are not dictionaries, the handler keeps a stream updated as data points enter and leave the
+    window, and takes the measurement from the stream instead of calling the function.
+
+    An offloaded handler measures its windows in the process pool of crunch.offload, and passes the
+    measurements to their callbacks in window order, as they complete, when data points arrive.
+
+    Every window is admitted by the scheduler of the process (see crunch.scheduler), which sheds windows
+    by priority when the process falls behind, and by the gate of the handler if it has one, which holds
+    back the windows that should not be measured, like the EDA recorded while the wristband moves.
+
+    Handlers with identical windows on the same stream are grouped by subscribe, and share the ring
+    buffers of the first handler of the group, see WindowGroup.
+    """
+    # whether the handler stores every data point it receives, so it can share its ring buffers
+    groupable = True
+
+    def __init__(self, measurement_func=None, measurement_path=None,
+                 window_length=None, window_step=None,
+                 subscribed_to=None, sample_shape=None, use_streaming=True, offload=False,
+                 priority=scheduler.NORMAL, budget=None, gate=None):
+        """
+        :param measurement_func: the function we call to compute measurements from the raw data
+        :type measurement_func: (np.ndarray) -> any
+        :param measurement_path: path to the output csv file
+        :type measurement_path: str
+        :param window_length: length of the window, i.e number of data points for the function
+        :type window_length: int
+        :param window_step: how many steps for a new window, i.e for 6 steps,
+        a new measurement is computed every 6 data points
+        :type window_step: int
+        :param subscribed_to: the keys of dictionary data points, None if the data points are not dictionaries
+        :type subscribed_to: list of str
+        :param sample_shape: shape of a data point value, None takes the shape of the first data point
+        :type sample_shape: tuple of int
+        :param use_streaming: use the stream of the measurement function if it has one
+        :type use_streaming: bool
+        :param offload: measure the windows in the process pool, for slow measurement functions
+        :type offload: bool
+        :param priority: scheduler.HIGH windows are never shed, scheduler.LOW windows are shed first
+        :type priority: int
+        :param budget: seconds a window may wait before it is stale, None uses the budget of the scheduler
+        :type budget: float
+        :param gate: called with the handler when a window is ready, the window is only measured if it returns True
+        :type gate: (BaseDataHandler) -> bool
+        """
+        assert window_length and window_step and measurement_func, \
+            "Need to supply the required parameters"
+
+        self.data_counter = 0
+        self.window_step = window_step
+        self.window_length = window_length
+        self.measurement_func = measurement_func
+        self.measurement_path = measurement_path
+        self.subscribed_to = subscribed_to
+        self.sample_shape = None if sample_shape is None else tuple(sample_shape)
+        if subscribed_to is None:
+            self.buffers = {None: RingBuffer(window_length, sample_shape)}
+        else:
+            self.buffers = {key: RingBuffer(window_length, sample_shape) for key in subscribed_to}
+
+        stream_class = getattr(measurement_func, "streaming", None)
+        use_streaming = use_streaming and not offload and subscribed_to is None
+        self.stream = stream_class() if use_streaming and stream_class else None
+        self.streamed_windows = 0
+        # the streams updated when a data point is stored, of this handler and of the handlers sharing its buffers
+        self.streams = [self.stream] if self.stream is not None else []
+        self.offload = offload
+        self.max_pending = int(util.config("offload", "max_pending")) if offload else 0
+        # (future, callback) of the offloaded windows, oldest first, a deferred action has no future
+        self.pending = deque()
+        # the shared memory the windows are passed to the pool in, created with the first offloaded window
+        self.shared_windows = None
+        self.priority = priority
+        self.budget = budget
+        self.scheduler = scheduler.current()
+        self.scheduler.register(self)
+        self.gate = gate
+        self.gated_windows = 0
+
+    def add_data_point(self, datapoint):
+        """ Receive a new data point """
+        self.append(datapoint)
+        self.process_data_point()
+
+    @abc.abstractmethod
+    def process_data_point(self):
+        """ Called after a data point is stored, measures the window when it is ready """
+
+    def append(self, datapoint):
+        """ Store a data point """
+        self.data_counter += 1
+        if self.streams:
+            self._append_streaming(datapoint)
+        elif self.subscribed_to is None:
+            self.buffers[None].append(datapoint)
+        else:
+            for key, value in datapoint.items():
+                self.buffers[key].append(value)
+
+    def window_signature(self):
+        """ Handlers subscribed to the same stream with the same signature have identical windows """
+        keys = None if self.subscribed_to is None else tuple(self.subscribed_to)
+        return keys, self.window_length, self.window_step, self.sample_shape
+
+    def share_buffers(self, leader):
+        """ Read the windows from the ring buffers of leader, which stores the data points of both handlers """
+        assert leader.window_signature() == self.window_signature() and leader.data_counter == self.data_counter
+        self.buffers = leader.buffers
+        leader.streams.extend(self.streams)
+        self.streams = []
+
+    def window_ready(self):
+        """ Whether a new full window is ready """
+        return (self.data_counter % self.window_step == 0
+                and all(len(buffer) == self.window_length for buffer in self.buffers.values()))
+
+    def measure(self, **arguments):
+        """ Call the measurement function with the current window, and any other arguments """
+        if self.stream is not None and not arguments:
+            self.streamed_windows += 1
+            if self.streamed_windows % RESYNC_INTERVAL == 0:
+                self.stream.resync(self.buffers[None].view())
+            return self.stream.value()
+        if self.subscribed_to is None:
+            return self.measurement_func(self.buffers[None].view(), **arguments)
+        windows = {key: buffer.view() for key, buffer in self.buffers.items()}
+        return self.measurement_func(**windows, **arguments)
+
+    def submit(self, callback, **arguments):
+        """
+        Measure the current window and pass the measurement to callback, right away,
+        or after the measurements of the earlier windows when the handler is offloaded.
+        Nothing is measured when the gate holds the window back, or the scheduler sheds it
+        """
+        if self.gate is not None and not self.gate(self):
+            self.gated_windows += 1
+            return
+        if not self.scheduler.admit(self):
+            return
+        if not self.offload:
+            start = self.scheduler.clock()
+            callback(self.measure(**arguments))
+            self.scheduler.measured(self.scheduler.clock() - start)
+            return
+        if self.shared_windows is None:
+            self.shared_windows = offload.SharedWindows()
+        windows = {key: buffer.view() for key, buffer in self.buffers.items()}
+        self.pending.append((offload.submit(self.measurement_func, windows, arguments, self.shared_windows),
+                             callback))
+        self.collect()
+
+    def defer(self, action):
+        """ Call action once the measurements submitted so far have been passed to their callbacks """
+        if self.pending:
+            self.pending.append((None, action))
+        else:
+            action()
+
+    def collect(self, wait=False):
+        """
+        Pass the completed measurements to their callbacks, in window order. Waits for the oldest
+        measurements when more than max_pending windows are waiting, so a handler never falls far behind
+
+        :param wait: wait for every submitted measurement, i.e when the data stream ends
+        :type wait: bool
+        """
+        while self.pending and (wait or len(self.pending) > self.max_pending
+                                or self.pending[0][0] is None or self.pending[0][0].done()):
+            future, callback = self.pending.popleft()
+            if future is None:
+                callback()
+            else:
+                callback(future.result())
+
+    def _append_streaming(self, datapoint):
+        """ Store a data point, evicting the oldest data point from the streams when the window is full """
+        buffer = self.buffers[None]
+        if len(buffer) == self.window_length:
+            window = buffer.view()
+            for stream in self.streams:
+                stream.evict(window[0], window[1] if len(window) > 1 else None)
+        buffer.append(datapoint)
+        sample = buffer.view(1)[0]
+        for stream in self.streams:
+            # an array data point is a view of the ring buffer, the stream keeps a copy
+            stream.push(sample.copy() if isinstance(sample, np.ndarray) else sample)
+
+
+class WindowGroup:
+    """
+    Data handlers with identical windows on the same stream. The first handler stores every data point
+    in its ring buffers, the others read their windows from them, so a data point is stored once,
+    and then every handler measures the window in the same view.
+    """
+
+    def __init__(self, handlers):
+        """
+        :param handlers: the handlers, with the same window signature and no data points yet
+        :type handlers: list of BaseDataHandler
+        """
+        self.handlers = []
+        for handler in handlers:
+            self.add(handler)
+
+    def accepts(self, handler):
+        """ Whether the handler has the windows of the group """
+        leader = self.handlers[0]
+        return (isinstance(handler, BaseDataHandler) and handler.groupable and leader.groupable
+                and handler.window_signature() == leader.window_signature()
+                and handler.data_counter == leader.data_counter)
+
+    def add(self, handler):
+        if self.handlers:
+            assert self.accepts(handler), "The handler does not have the windows of the group"
+            handler.share_buffers(self.handlers[0])
+        self.handlers.append(handler)
+
+    def add_data_point(self, datapoint):
+        """ Store the data point once, and let every handler measure its window """
+        leader = self.handlers[0]
+        leader.append(datapoint)
+        for handler in self.handlers[1:]:
+            handler.data_counter = leader.data_counter
+        for handler in self.handlers:
+            handler.process_data_point()
+
+    def collect(self, wait=False):
+        """ Pass the completed measurements of the offloaded handlers to their callbacks """
+        for handler in self.handlers:
+            handler.collect(wait)
+
+
+def subscribe(subscribers, handler):
+    """
+    Add a data handler to the subscribers of a stream, grouping it with a subscriber that has identical windows
+
+    :param subscribers: the handlers and window groups an api sends the data points of a stream to
+    :type subscribers: list
+    :param handler: the handler subscribing to the stream
+    :type handler: BaseDataHandler
+    """
+    if isinstance(handler, BaseDataHandler) and handler.groupable:
+        for i, subscriber in enumerate(subscribers):
+            if isinstance(subscriber, WindowGroup) and subscriber.accepts(handler):
+                subscriber.add(handler)
+                return
+            if isinstance(subscriber, BaseDataHandler) and WindowGroup([subscriber]).accepts(handler):
+                subscribers[i] = WindowGroup([subscriber, handler])
+                return
+    subscribers.append(handler)
+
+
+class DataHandler(BaseDataHandler):
+    """
+    Data handler that publishes the ratio of a measurement and its baseline.
+
+    The class has two phases:
+        1. the baseline phase where measurement results are stored
+        and we eventually take the average of these values as baseline.
+        2. the csv_phase where the ratio of measurement results and the
+        baseline is published, or the measurement result if calculate_baseline is False.
+    """
+
+    def __init__(self, measurement_func=None, measurement_path=None,
+                 window_length=None, window_step=None,
+                 baseline_length=None, calculate_baseline=True,
+                 subscribed_to=None, sample_shape=None, use_streaming=True, offload=False,
+                 priority=scheduler.NORMAL, budget=None, gate=None):
+        """
+        :param baseline_length: How many measurement values used to calculate baseline
+        :type baseline_length: int
+        :param calculate_baseline: Should baseline be calculated? Skip if False
+        :type calculate_baseline: bool
+
+        The other parameters are described in BaseDataHandler
+        """
+        BaseDataHandler.__init__(self,
+                                 measurement_func=measurement_func,
+                                 measurement_path=measurement_path,
+                                 window_length=window_length,
+                                 window_step=window_step,
+                                 subscribed_to=subscribed_to,
+                                 sample_shape=sample_shape,
+                                 use_streaming=use_streaming,
+                                 offload=offload,
+                                 priority=priority,
+                                 budget=budget,
+                                 gate=gate)
+        self.phase_func = self.baseline_phase if calculate_baseline else self.csv_phase
+        self.calculate_baseline = calculate_baseline
+        self.baseline = 0
+        self.list_of_baseline_values = []
+        self.baseline_length = baseline_length
+
+    def process_data_point(self):
+        """ Pass the measurement of a new window to phase_func """
+        self.collect()
+        if self.window_ready():
+            self.submit(self.handle_measurement)
+
+    def handle_measurement(self, measurement):
+        """ Pass a measurement to the phase the handler is in when the measurement is ready """
+        self.phase_func(measurement)
+
+    def baseline_phase(self, measurement):
+        """
+        Appends a value to be used for calculating the baseline, then checks if we have enough values
+        to transition to next phase.
+        """
+        self.list_of_baseline_values.append(measurement)
+        if len(self.list_of_baseline_values) >= self.baseline_length:
+            self.transition_to_csv_phase()
+
+    def transition_to_csv_phase(self):
+        """Compute baseline and set phase_func to csv_phase"""
+        self.baseline = float(sum(self.list_of_baseline_values) / len(self.list_of_baseline_values))
+        assert 0 <= self.baseline < float('inf') and type(self.baseline) == float
+        self.phase_func = self.csv_phase
+
+    def csv_phase(self, measurement):
+        """Publish the measurement, or its ratio relative to baseline"""
+        if self.calculate_baseline:
+            measurement = round(measurement / self.baseline, 6)
+        util.publish(self.measurement_path, [measurement])
@@ -0,0 +1,215 @@
+"""
+Process pool for the measurement functions that are too slow to run in the device process.
+
+Every device process has its own pool, created when the first window is offloaded, shared by all its
+data handlers. The cores of the machine are split between the pools of the device processes, unless the
+number of workers is configured. The windows are copied to shared memory, and the pool workers read them
+from there, so the samples are never pickled. The shared memory of a data handler is reused from window
+to window, see SharedWindows. Before Python 3.8 there is no shared memory, and the windows are pickled.
+"""
+import importlib
+import os
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from crunch import util
+
+_pool = None
+# the device processes sharing the cores, set by configure
+_devices = 1
+_shared_windows = weakref.WeakSet()
+
+
+def configure(devices):
+    """
+    Split the cores between the pools of the device processes, called in every device process
+
+    :param devices: number of device processes that may offload windows
+    :type devices: int
+    """
+    global _devices
+    _devices = devices
+
+
+def workers():
+    """ The workers of the pool of this process, in the config, or the cores split between the device processes """
+    return int(util.config("offload", "workers")) or max(1, (os.cpu_count() or 1) // _devices)
+
+
+def _shared_memory():
+    """ The multiprocessing.shared_memory module, None before Python 3.8 """
+    try:
+        return importlib.import_module("multiprocessing.shared_memory")
+    except ImportError:
+        return None
+
+
+def uses_shared_memory():
+    """ Whether the windows are passed to the pool in shared memory, configured and available """
+    return util.config("offload", "shared_memory") == "True" and _shared_memory() is not None
+
+
+def start(workers=None):
+    """
+    Start the pool of this process
+
+    :param workers: number of worker processes, defaults to one per core
+    :type workers: int
+    """
+    global _pool
+    shutdown()
+    if os.name == "posix" and _shared_memory() is not None:
+        # the workers must share the resource tracker of this process, a worker with its own tracker
+        # would report the shared memory it attaches to as leaked, and unlink it, when it exits
+        importlib.import_module("multiprocessing.resource_tracker").ensure_running()
+    _pool = ProcessPoolExecutor(workers or os.cpu_count())
+    return _pool
+
+
+def pool():
+    """ The pool of this process, started on first use with the workers of workers() """
+    if _pool is None:
+        start(workers())
+    return _pool
+
+
+def shutdown(wait=True):
+    """ Stop the pool of this process, waiting for the windows that are being measured if wait """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait)
+        _pool = None
+    for shared_windows in list(_shared_windows):
+        shared_windows.close()
+
+
+class SharedWindows:
+    """
+    The shared memory segments of the windows of a data handler. A segment is taken for every window being
+    measured and given back when the measurement is done, so the segments are created once instead of for
+    every window, and a handler has at most a segment per key of each of its max_pending windows.
+    """
+
+    def __init__(self):
+        # the free segments, by their size
+        self.free = {}
+        self.sizes = {}
+        # segments are given back by the thread of the pool
+        self.lock = threading.Lock()
+        self.closed = False
+        self.created = 0
+        _shared_windows.add(self)
+
+    def take(self, nbytes):
+        """ A free segment of nbytes, created if there is none """
+        with self.lock:
+            free = self.free.get(nbytes)
+            if free:
+                return free.pop()
+        memory = _shared_memory().SharedMemory(create=True, size=nbytes)
+        self.sizes[memory.name] = nbytes
+        self.created += 1
+        return memory
+
+    def give_back(self, memories):
+        """ Keep the segments for the next windows, or free them if the pool is shut down """
+        with self.lock:
+            if not self.closed:
+                for memory in memories:
+                    self.free.setdefault(self.sizes[memory.name], []).append(memory)
+                return
+        _release(memories)
+
+    def close(self):
+        """ Free the segments, the segments of the windows still being measured are freed when they are done """
+        with self.lock:
+            self.closed = True
+            memories = [memory for free in self.free.values() for memory in free]
+            self.free = {}
+        _release(memories)
+
+
+def submit(measurement_func, windows, arguments, shared_windows=None):
+    """
+    Measure windows in the pool
+
+    :param measurement_func: a module level function, the workers import it by name
+    :type measurement_func: (np.ndarray) -> any
+    :param windows: the windows, copied before this returns, the window with the key None is passed
+    as the first argument, the others as keyword arguments
+    :type windows: dict of np.ndarray
+    :param arguments: other keyword arguments of the measurement function
+    :type arguments: dict
+    :param shared_windows: the shared memory of the data handler, None creates shared memory for the windows
+    :type shared_windows: SharedWindows
+    :return: future of the measurement
+    :rtype: concurrent.futures.Future
+    """
+    if not uses_shared_memory():
+        # the windows are pickled later, by the thread of the pool
+        windows = {key: np.array(window) for key, window in windows.items()}
+        return pool().submit(_measure, measurement_func, windows, arguments)
+
+    shared_memory = _shared_memory()
+    memories = []
+    try:
+        shared = {}
+        for key, window in windows.items():
+            if shared_windows is None:
+                memory = shared_memory.SharedMemory(create=True, size=max(window.nbytes, 1))
+            else:
+                memory = shared_windows.take(max(window.nbytes, 1))
+            memories.append(memory)
+            np.ndarray(window.shape, window.dtype, buffer=memory.buf)[...] = window
+            shared[key] = (memory.name, window.shape, window.dtype.str)
+        future = pool().submit(_measure_shared, measurement_func, shared, arguments)
+    except BaseException:
+        _release(memories)
+        raise
+    # the worker only attaches to the shared memory, it is freed or reused once the measurement is done
+    if shared_windows is None:
+        future.add_done_callback(lambda _: _release(memories))
+    else:
+        future.add_done_callback(lambda _: shared_windows.give_back(memories))
+    return future
+
+
+def _release(memories):
+    for memory in memories:
+        memory.close()
+        memory.unlink()
+
+
+def _measure(measurement_func, windows, arguments):
+    """ Pool worker, call the measurement function with read-only windows, like the data handlers """
+    windows = dict(windows)
+    for window in windows.values():
+        window.flags.writeable = False
+    if None in windows:
+        return measurement_func(windows.pop(None), **windows, **arguments)
+    return measurement_func(**windows, **arguments)
+
+
+def _measure_shared(measurement_func, shared, arguments):
+    """ Pool worker, call the measurement function with views of the windows in shared memory """
+    shared_memory = _shared_memory()
+    memories = []
+    try:
+        windows = {}
+        for key, (name, shape, dtype) in shared.items():
+            memory = shared_memory.SharedMemory(name=name)
+            memories.append(memory)
+            windows[key] = np.ndarray(shape, dtype, buffer=memory.buf)
+        return _measure(measurement_func, windows, arguments)
+    finally:
+        # the views must be gone before the shared memory can be closed, the traceback of an error
+        # in the measurement function still refers to them, then the memory is closed when it is collected
+        windows = None
+        for memory in memories:
+            try:
+                memory.close()
+            except BufferError:
+                pass
@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed capacity buffer of the latest samples, in a preallocated and typed NumPy array.
+
+    The ring is mirrored: every sample is written twice, capacity samples apart, so the latest
+    samples are always contiguous in memory, and are read as a view without copying. A sample
+    is a number, or an array of a fixed shape, like the 25 (x, y) joints of a skeleton.
+    """
+
+    def __init__(self, capacity, shape=None, dtype=np.float64):
+        """
+        :param capacity: number of samples kept
+        :type capacity: int
+        :param shape: shape of a sample, () for numbers, None takes the shape of the first sample
+        :type shape: tuple of int
+        :param dtype: type of the sample values
+        :type dtype: np.dtype
+        """
+        assert capacity > 0, "The capacity of a ring buffer must be positive"
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self.data = None
+        self.readonly = None
+        # index of the next sample in the first half of the ring, and number of samples appended
+        self.index = 0
+        self.count = 0
+        if shape is not None:
+            self._allocate(tuple(shape))
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, sample):
+        """ Append a sample, replacing the oldest sample when the buffer is full """
+        if self.data is None:
+            self._allocate(np.shape(sample))
+        self.data[self.index] = sample
+        # an array sample is converted once, and copied to the mirror
+        self.data[self.index + self.capacity] = self.data[self.index] if self.data.ndim > 1 else sample
+        self.index += 1
+        if self.index == self.capacity:
+            self.index = 0
+        self.count += 1
+
+    def extend(self, samples):
+        """ Append a block of samples, oldest first """
+        samples = np.asarray(samples, dtype=self.dtype)
+        if self.data is None:
+            self._allocate(samples.shape[1:])
+        self.count += len(samples)
+        samples = samples[-self.capacity:]
+        while len(samples):
+            length = min(len(samples), self.capacity - self.index)
+            self.data[self.index:self.index + length] = samples[:length]
+            self.data[self.index + self.capacity:self.index + self.capacity + length] = samples[:length]
+            self.index = (self.index + length) % self.capacity
+            samples = samples[length:]
+
+    def view(self, length=None):
+        """
+        The latest samples, oldest first, as a read-only view that changes when samples are appended
+
+        :param length: number of samples, defaults to every sample in the buffer
+        :type length: int
+        :rtype: np.ndarray
+        """
+        if self.data is None:
+            return np.empty(0, dtype=self.dtype)
+        length = len(self) if length is None else min(length, len(self))
+        end = self.index + self.capacity
+        return self.readonly[end - length:end]
+
+    def clear(self):
+        self.index = 0
+        self.count = 0
+
+    def _allocate(self, shape):
+        self.data = np.zeros((2 * self.capacity,) + tuple(shape), dtype=self.dtype)
+        # the views are slices of a read-only view, so measurement functions can not change the samples
+        self.readonly = self.data.view()
+        self.readonly.flags.writeable = False
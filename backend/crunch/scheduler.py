@@ -0,0 +1,157 @@
+"""
+Scheduler of the measurement windows of a device process, sheds windows when the process falls behind.
+
+Every data handler has a priority and a latency budget, the seconds a window may wait from the arrival of
+its last data point until it is measured. The apis tell the scheduler when the data point they send arrived,
+and how many data points of the same stream are queued behind it. Under overload the scheduler:
+    1. coalesces stale windows, a window over its budget is skipped when a newer window of the same
+       handler is already queued, so only the newest is measured
+    2. widens the window step of the LOW priority handlers, doubling it every interval the process is
+       overloaded, and narrowing it again when the process has caught up
+HIGH priority windows are never shed. The shed windows are counted, and printed every report_interval seconds.
+"""
+import time
+import weakref
+
+from crunch import util
+
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+_scheduler = None
+
+
+def current():
+    """ The scheduler of this process, created from the config on first use """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler(budget=float(util.config("scheduler", "budget")),
+                               max_load=float(util.config("scheduler", "max_load")),
+                               max_stride=int(util.config("scheduler", "max_stride")),
+                               interval=float(util.config("scheduler", "interval")),
+                               report_interval=float(util.config("scheduler", "report_interval")))
+    return _scheduler
+
+
+def install(scheduler):
+    """ Install the scheduler the data handlers created in this process register with """
+    global _scheduler
+    _scheduler = scheduler
+
+
+class Scheduler:
+    def __init__(self, budget=1.0, max_load=0.9, max_stride=8, interval=1.0, report_interval=10.0,
+                 clock=time.monotonic):
+        """
+        :param budget: default latency budget of a handler in seconds
+        :type budget: float
+        :param max_load: fraction of the time spent measuring above which the process is overloaded
+        :type max_load: float
+        :param max_stride: the most a window step is widened, as a multiple of the window step
+        :type max_stride: int
+        :param interval: seconds between the load checks that widen and narrow the window steps
+        :type interval: float
+        :param report_interval: minimum seconds between the prints of the shed windows
+        :type report_interval: float
+        :param clock: the time of the arrivals, in seconds
+        :type clock: () -> float
+        """
+        self.budget = budget
+        self.max_load = max_load
+        self.max_stride = max_stride
+        self.interval = interval
+        self.report_interval = report_interval
+        self.clock = clock
+        self.handlers = weakref.WeakSet()
+        # arrival time of the data point being sent, and number of data points queued behind it
+        self.arrival = None
+        self.backlog = 0
+        # seconds spent measuring, and whether a window was over its budget, since interval_start
+        self.busy = 0.0
+        self.late = False
+        self.interval_start = clock()
+        self.last_report = self.interval_start
+        self.shed = {}
+        self.reported = {}
+
+    def register(self, handler):
+        """ Schedule the windows of a handler, sets its priority, budget and stride """
+        if handler.budget is None:
+            handler.budget = self.budget
+        handler.stride = 1
+        handler.scheduled_windows = 0
+        self.handlers.add(handler)
+
+    def arrived(self, timestamp, backlog=0):
+        """
+        Called by an api before it sends a data point to the handlers
+
+        :param timestamp: when the data point arrived, on the clock of the scheduler
+        :type timestamp: float
+        :param backlog: number of data points of the same stream queued behind the data point
+        :type backlog: int
+        """
+        self.arrival = timestamp
+        self.backlog = backlog
+
+    def admit(self, handler):
+        """
+        Whether the window that is ready should be measured, or shed
+
+        :type handler: crunch.handler.BaseDataHandler
+        :rtype: bool
+        """
+        now = self.clock()
+        self._check_load(now)
+        handler.scheduled_windows += 1
+        if handler.priority == HIGH:
+            return True
+        if self.arrival is not None and now - self.arrival > handler.budget:
+            self.late = True
+            if self.backlog >= handler.window_step * handler.stride:
+                self._count(handler, "coalesced")
+                return False
+        if handler.scheduled_windows % handler.stride:
+            self._count(handler, "widened")
+            return False
+        return True
+
+    def measured(self, seconds):
+        """ Account for the seconds a handler spent measuring a window """
+        self.busy += seconds
+
+    def stats(self):
+        """ The windows shed per measurement, and the current stride of the widened handlers """
+        strides = {self._name(handler): handler.stride for handler in self.handlers if handler.stride > 1}
+        return {"shed": {name: dict(counts) for name, counts in self.shed.items()}, "strides": strides}
+
+    def _count(self, handler, reason):
+        counts = self.shed.setdefault(self._name(handler), {"coalesced": 0, "widened": 0})
+        counts[reason] += 1
+
+    def _check_load(self, now):
+        """ Widen or narrow the window steps of the LOW priority handlers once every interval """
+        elapsed = now - self.interval_start
+        if elapsed < self.interval:
+            return
+        load = self.busy / elapsed
+        for handler in self.handlers:
+            if handler.priority != LOW:
+                continue
+            if load > self.max_load or self.late:
+                handler.stride = min(handler.stride * 2, self.max_stride)
+            elif load < self.max_load / 2:
+                handler.stride = max(handler.stride // 2, 1)
+        self.busy = 0.0
+        self.late = False
+        self.interval_start = now
+
+        if now - self.last_report >= self.report_interval and self.shed != self.reported:
+            print("Shed measurement windows to keep up:", self.stats())
+            self.reported = {name: dict(counts) for name, counts in self.shed.items()}
+            self.last_report = now
+
+    @staticmethod
+    def _name(handler):
+        return handler.measurement_path or getattr(handler.measurement_func, "__name__", "measurement")
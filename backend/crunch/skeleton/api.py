@@ -1,17 +1,33 @@
 import os
+import queue
 import sys
+import threading
 from sys import platform
 
 import crunch.util as util
+from crunch import scheduler
+from crunch.handler import subscribe
 from crunch.skeleton.handler import DataHandler  # noqa
 
 
 class SkeletonAPI:
-    """Responsible for connecting to openpose and sending skeletal data to all subscribed handlers"""
+    """
+    Responsible for connecting to openpose and sending skeletal data to all subscribed handlers
+
+    The frame loop of openpose queues the keypoints of every frame, and a processing thread sends them to the
+    handlers. The scheduler is told when a frame arrived and how many frames are queued behind it, so the stale
+    windows are coalesced when the handlers fall behind openpose.
+    """
 
     raw_data = ["body"]
     subscribers = {"body": []}
 
+    def __init__(self):
+        self.scheduler = scheduler.current()
+        # the arrival time and the keypoints of the frames, queued for the processing thread
+        self.frames = queue.Queue()
+        self.processing_thread = None
+
     def add_subscriber(self, data_handler, requested_data):
         """
         Adds a handler as a subscriber for a specific raw data
@@ -22,7 +38,7 @@ class SkeletonAPI:
         :type requested_data: str
         """
         assert requested_data in self.subscribers.keys()
-        self.subscribers[requested_data].append(data_handler)
+        subscribe(self.subscribers[requested_data], data_handler)
     prev_frame = [(0.0, 0.0) for _ in range(25)]
 
     def preprocess(self, frame):
@@ -30,12 +46,56 @@ class SkeletonAPI:
         return self.prev_frame
 
     def add_datapoint(self, datums):
+        """ Queue the keypoints of the first person in a frame """
         datum = datums[0]
         if datum.poseKeypoints is not None:
             fixed_data = [(row[0], row[1]) for row in datum.poseKeypoints[0]]
-            data = self.preprocess(fixed_data)
-            for handler in self.subscribers["body"]:
-                handler.add_data_point(data)
+            self.frames.put((self.scheduler.clock(), fixed_data))
+
+    def start_processing(self):
+        """ Start the thread that sends the queued frames to the handlers """
+        self.processing_thread = threading.Thread(target=self.process_frames, daemon=True)
+        self.processing_thread.start()
+
+    def stop_processing(self):
+        """ Stop the processing thread, after it has processed the queued frames """
+        if self.processing_thread is not None:
+            self.frames.put(None)
+            self.processing_thread.join()
+            self.processing_thread = None
+
+    def process_frames(self):
+        """ Processing thread, sends the queued frames to the handlers until stopped """
+        for frame in iter(self.frames.get, None):
+            self.process_frame(*frame)
+
+    def process_pending(self):
+        """
+        Send the frames queued to the handlers
+
+        :return: number of frames processed
+        :rtype: int
+        """
+        processed = 0
+        while not self.frames.empty():
+            self.process_frame(*self.frames.get())
+            processed += 1
+        return processed
+
+    def process_frame(self, arrival, fixed_data):
+        """
+        Send the keypoints of a frame to the handlers
+
+        :param arrival: when the frame arrived, on the clock of the scheduler
+        :type arrival: float
+        :param fixed_data: the x and y of every keypoint
+        :type fixed_data: list of (float, float)
+        """
+        # the frames queued after this one are its backlog
+        self.scheduler.arrived(arrival, self.frames.qsize())
+        data = self.preprocess(fixed_data)
+        for handler in self.subscribers["body"]:
+            handler.add_data_point(data)
 
     def connect(self):
         dir_path = os.path.dirname(os.path.realpath(__file__))
@@ -73,14 +133,18 @@ class SkeletonAPI:
         opWrapper.start()
 
         user_wants_to_exit = False
-        while not user_wants_to_exit:
-            dataframe = op.VectorDatum()
-            if opWrapper.waitAndPop(dataframe):
-                if "no_display" not in params:
-                    user_wants_to_exit = self.display(dataframe)
-                self.add_datapoint(dataframe)
-            else:
-                break
+        self.start_processing()
+        try:
+            while not user_wants_to_exit:
+                dataframe = op.VectorDatum()
+                if opWrapper.waitAndPop(dataframe):
+                    if "no_display" not in params:
+                        user_wants_to_exit = self.display(dataframe)
+                    self.add_datapoint(dataframe)
+                else:
+                    break
+        finally:
+            self.stop_processing()
 
     def display(self, datums):
         import cv2
@@ -1,21 +1,24 @@
-from collections import deque
+from crunch import handler, scheduler
 
-import crunch.util as util
+# number of joints in a skeleton, every joint is an (x, y) position
+JOINTS = 25
 
 
-class DataHandler:
+class DataHandler(handler.DataHandler):
     """
-    Class that subscribes to a specific raw data stream,
+    Class that subscribes to the skeleton data stream,
     handles storing the data,
     preprocessing the data,
-    and calculating measurements from the data
+    and calculating measurements from the data.
+    The window is an array of shape (window_length, 25, 2)
     """
     def __init__(self, measurement_func=None, measurement_path=None,
                  window_length=None, window_step=None,
-                 calculate_baseline=True, baseline_length=None):
+                 calculate_baseline=True, baseline_length=None, offload=False,
+                 priority=scheduler.NORMAL, budget=None):
         """
         :param measurement_func: the function we call to compute measurements from the raw data
-        :type measurement_func: (list) -> float
+        :type measurement_func: (np.ndarray) -> float
         :param measurement_path: path to the output csv file
         :type measurement_path: str
         :param window_length: length of the window, i.e number of data points for the function
@@ -23,48 +26,21 @@ class DataHandler:
         :param window_step: how many steps for a new window, i.e for 6 steps,
         a new measurement is computed every 6 data points
         :type window_step: int
+        :param offload: measure the windows in the process pool, for slow measurement functions
+        :type offload: bool
+        :param priority: scheduler.HIGH windows are never shed, scheduler.LOW windows are shed first
+        :type priority: int
+        :param budget: seconds a window may wait before it is stale, None uses the budget of the scheduler
+        :type budget: float
         """
-        assert window_length and window_step and measurement_func, \
-            "Need to supply the required parameters"
-
-        self.data_queue = deque(maxlen=window_length)
-        self.data_counter = 0
-        self.phase_func = self.baseline_phase if calculate_baseline else self.csv_phase
-        self.window_step = window_step
-        self.window_length = window_length
-        self.measurement_func = measurement_func
-        self.measurement_path = measurement_path
-        self.calculate_baseline = calculate_baseline
-
-        self.baseline = 0
-        self.list_of_baseline_values = []
-        self.baseline_length = baseline_length
-
-    def baseline_phase(self):
-        """
-        Appends a value to be used for calculating the baseline, then checks if it is time to
-        transition to next phase
-        """
-        if self.data_counter % self.window_step == 0 and len(self.data_queue) == self.window_length:
-            measurement = self.measurement_func(list(self.data_queue))
-            self.list_of_baseline_values.append(measurement)
-            if len(self.list_of_baseline_values) >= self.baseline_length:
-                self.transition_to_csv_phase()
-
-    def add_data_point(self, datapoint):
-        """ Receive a new data point, and call appropriate measurement function when we have enough points """
-        self.data_queue.append(datapoint)
-        self.data_counter += 1
-        self.phase_func()
-
-    def transition_to_csv_phase(self):
-        self.baseline = float(sum(self.list_of_baseline_values) / len(self.list_of_baseline_values))
-        assert 0 <= self.baseline < float('inf') and type(self.baseline) == float
-        self.phase_func = self.csv_phase
-
-    def csv_phase(self):
-        if self.data_counter % self.window_step == 0 and len(self.data_queue) == self.window_length:
-            measurement = self.measurement_func(list(self.data_queue))
-            if self.calculate_baseline:
-                measurement = round(measurement / self.baseline, 6)
-            util.write_csv(self.measurement_path, [measurement])
+        handler.DataHandler.__init__(self,
+                                     measurement_func=measurement_func,
+                                     measurement_path=measurement_path,
+                                     window_length=window_length,
+                                     window_step=window_step,
+                                     baseline_length=baseline_length,
+                                     calculate_baseline=calculate_baseline,
+                                     sample_shape=(JOINTS, 2),
+                                     offload=offload,
+                                     priority=priority,
+                                     budget=budget)
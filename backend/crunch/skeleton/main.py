@@ -1,3 +1,4 @@
+from crunch import scheduler
 from crunch.skeleton.api import SkeletonAPI
 from crunch.skeleton.handler import DataHandler
 from crunch.skeleton.measurements import (amount_of_motion, fatigue,
@@ -26,7 +27,9 @@ def start_skeleton(api=SkeletonAPI):
                                   measurement_path="fatigue.csv",
                                   window_length=2,
                                   window_step=2,
-                                  baseline_length=100)
+                                  baseline_length=100,
+                                  offload=True,
+                                  priority=scheduler.LOW)
     api.add_subscriber(fatigue_handler, "body")
 
     # Instantiate the amount of motion data handler and subscribe to the api
@@ -42,7 +45,8 @@ def start_skeleton(api=SkeletonAPI):
                                           measurement_path="most_used_joints.csv",
                                           window_length=2,
                                           window_step=2,
-                                          calculate_baseline=False)
+                                          calculate_baseline=False,
+                                          priority=scheduler.LOW)
     api.add_subscriber(most_used_joint_handler, "body")
 
     # start up the api
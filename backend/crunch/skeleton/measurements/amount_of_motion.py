@@ -1,6 +1,20 @@
+import numpy as np
+
 from crunch.skeleton.measurements.helpers import norm_by_array
+from crunch.streaming import PairwiseStream, streaming
+
+
+class AmountOfMotionStream(PairwiseStream):
+    """ Streaming amount_of_motion, the distance travelled by the joints between subsequent frames """
+
+    def term(self, previous, sample):
+        return float(np.sqrt(np.square(sample - previous).sum(axis=1)).sum())
+
+    def value(self):
+        return float(self.total / len(self.last))
 
 
+@streaming(AmountOfMotionStream)
 def amount_of_motion(pos):
     """
     Find the total amount of distance travelled by each join
@@ -1,6 +1,20 @@
+import numpy as np
+
 from crunch.skeleton.measurements.helpers import norm_by_array
+from crunch.streaming import PairwiseStream, streaming
+
+
+class StabilityOfMotionStream(PairwiseStream):
+    """ Streaming stability_of_motion """
+
+    def term(self, previous, sample):
+        return float((1 / (1 + np.sqrt(np.square(sample - previous).sum(axis=1)))).sum())
+
+    def value(self):
+        return float(self.total / len(self.last))
 
 
+@streaming(StabilityOfMotionStream)
 def stability_of_motion(pos):
     """Take norm of two points before applying
     a formula, and summing them up
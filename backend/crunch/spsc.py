@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class SpscRing:
+    """
+    Lock-free ring of fixed width records, for one producer thread and one consumer thread.
+
+    The producer only writes head and dropped, the consumer only writes tail, so neither needs a lock:
+    a record is written before head is moved past it, and copied out before tail is moved past it.
+    When the ring is full the new record is dropped and counted, the producer never waits.
+    """
+
+    def __init__(self, capacity, width, dtype=np.float64):
+        """
+        :param capacity: maximum number of records waiting for the consumer
+        :type capacity: int
+        :param width: number of values in a record
+        :type width: int
+        :param dtype: type of the record values
+        :type dtype: np.dtype
+        """
+        assert capacity > 0, "The capacity of a ring must be positive"
+        self.capacity = capacity
+        self.data = np.zeros((capacity, width), dtype=dtype)
+        # number of records pushed and popped since the start, the ring holds head - tail records
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.high_watermark = 0
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def push(self, record):
+        """
+        Producer side, store a record in constant time
+
+        :param record: the values of the record
+        :type record: tuple of float
+        :return: False if the ring was full and the record was dropped
+        :rtype: bool
+        """
+        head = self.head
+        occupancy = head - self.tail
+        if occupancy >= self.capacity:
+            self.dropped += 1
+            return False
+        self.data[head % self.capacity] = record
+        self.head = head + 1
+        if occupancy >= self.high_watermark:
+            self.high_watermark = occupancy + 1
+        return True
+
+    def pop_block(self, max_records=None):
+        """
+        Consumer side, take the oldest records, at most up to the end of the ring
+
+        :param max_records: maximum number of records taken, None takes every contiguous record
+        :type max_records: int
+        :return: a copy of the records, oldest first, with one row per record
+        :rtype: np.ndarray
+        """
+        tail = self.tail
+        start = tail % self.capacity
+        count = min(self.head - tail, self.capacity - start)
+        if max_records is not None:
+            count = min(count, max_records)
+        block = self.data[start:start + count].copy()
+        self.tail = tail + count
+        return block
+
+    def stats(self):
+        """ Number of records waiting, the most records that have been waiting, and the dropped records """
+        return {"occupancy": len(self), "high_watermark": self.high_watermark, "dropped": self.dropped}
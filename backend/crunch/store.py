@@ -0,0 +1,312 @@
+"""
+Append-only binary store of the measurements of a session.
+
+A session is a directory with one sub directory per measurement. A measurement directory has a
+header.json describing the columns, and chunk files of fixed-width records, one little-endian
+float64 per column: time, value, and the header_features of the measurement. Every chunk but
+the last holds exactly chunk_size records, so a chunk can be memory mapped and searched by time
+directly. Textual values, like the anticipation measurement, are stored as an index into
+categories.txt.
+
+Print or export a recorded session with export_session.py in the backend folder.
+"""
+import bisect
+import json
+import os
+import time
+
+import numpy as np
+
+HEADER = "header.json"
+CATEGORIES = "categories.txt"
+DTYPE = np.dtype("<f8")
+
+_session = None
+
+
+def chunk_name(index):
+    return f"chunk_{index:06d}.bin"
+
+
+class MeasurementWriter:
+    """ Appends the records of one measurement to its chunk files """
+
+    def __init__(self, directory, columns, chunk_size=4096):
+        """
+        :param directory: the directory of the measurement
+        :type directory: str
+        :param columns: names of the columns, starting with time and value
+        :type columns: list of str
+        :param chunk_size: number of records in a chunk file
+        :type chunk_size: int
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        header_path = os.path.join(directory, HEADER)
+        if os.path.isfile(header_path):
+            with open(header_path) as header_file:
+                header = json.load(header_file)
+            assert header["columns"] == columns, f"The columns of {directory} have changed"
+        else:
+            header = {"columns": columns, "dtype": DTYPE.str, "chunk_size": chunk_size}
+            with open(header_path, "w") as header_file:
+                json.dump(header, header_file)
+        self.columns = header["columns"]
+        self.chunk_size = header["chunk_size"]
+        self.record_size = len(self.columns) * DTYPE.itemsize
+
+        self.categories = {}
+        categories_path = os.path.join(directory, CATEGORIES)
+        if os.path.isfile(categories_path):
+            with open(categories_path) as categories_file:
+                for category in categories_file.read().splitlines():
+                    self.categories[category] = len(self.categories)
+        self.categories_file = None
+
+        # continue in the last chunk, dropping a record that was only partly written
+        self.chunk_index = max(len(chunk_paths(directory)) - 1, 0)
+        self.chunk = open(os.path.join(directory, chunk_name(self.chunk_index)), "ab", buffering=0)
+        self.count = self.chunk.tell() // self.record_size
+        self.chunk.truncate(self.count * self.record_size)
+
+    def append(self, timestamp, row):
+        """
+        Append a record
+
+        :param timestamp: unix time of the measurement
+        :type timestamp: float
+        :param row: the measurement value, followed by the header features
+        :type row: list
+        """
+        value = row[0]
+        if isinstance(value, str):
+            value = self._category(value)
+        record = np.array([timestamp, value] + list(row[1:]), dtype=DTYPE)
+        if self.count == self.chunk_size:
+            self.chunk.close()
+            self.chunk_index += 1
+            self.chunk = open(os.path.join(self.directory, chunk_name(self.chunk_index)), "ab", buffering=0)
+            self.count = 0
+        # records are written in one unbuffered write, so readers never see a partial record in practice
+        self.chunk.write(record.tobytes())
+        self.count += 1
+
+    def close(self):
+        self.chunk.close()
+        if self.categories_file is not None:
+            self.categories_file.close()
+
+    def _category(self, value):
+        """ Index of a textual value, new values are appended to the categories file """
+        if value not in self.categories:
+            if self.categories_file is None:
+                self.categories_file = open(os.path.join(self.directory, CATEGORIES), "a", buffering=1)
+            self.categories_file.write(value + "\n")
+            self.categories[value] = len(self.categories)
+        return self.categories[value]
+
+
+class SessionWriter:
+    """ Writes the measurements of one process to a session directory """
+
+    def __init__(self, directory, chunk_size=4096):
+        """
+        :param directory: the session directory, shared by all processes of the session
+        :type directory: str
+        :param chunk_size: number of records in a chunk file
+        :type chunk_size: int
+        """
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.writers = {}
+
+    def write(self, path, row, header_features=[], timestamp=None):
+        """
+        Append a measurement, takes the same arguments as util.write_csv
+
+        :param path: path to the output csv file, the name of the measurement is derived from it
+        :type path: str
+        """
+        writer = self.writers.get(path)
+        if writer is None:
+            name = os.path.splitext(path)[0]
+            writer = MeasurementWriter(os.path.join(self.directory, name),
+                                       ["time", "value"] + header_features,
+                                       chunk_size=self.chunk_size)
+            self.writers[path] = writer
+        writer.append(time.time() if timestamp is None else timestamp, row)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+
+
+def chunk_paths(directory):
+    """ The chunk files of a measurement, in order """
+    return sorted(os.path.join(directory, file_name) for file_name in os.listdir(directory)
+                  if file_name.startswith("chunk_"))
+
+
+class MeasurementReader:
+    """
+    Reads the records of one measurement. The first timestamp of every chunk is kept as an index,
+    so a time range is found with a binary search over the chunks, and then within the memory
+    mapped chunks, in O(log n). The reader picks up records appended after it was created.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: the directory of the measurement
+        :type directory: str
+        """
+        self.directory = directory
+        with open(os.path.join(directory, HEADER)) as header_file:
+            header = json.load(header_file)
+        self.columns = header["columns"]
+        self.chunk_size = header["chunk_size"]
+        self.dtype = np.dtype(header["dtype"])
+        self.record_size = len(self.columns) * self.dtype.itemsize
+        self.categories = []
+        self.chunk_paths = []
+        self.chunk_starts = []
+        self.chunks = {}
+        self.position = 0
+
+    def __len__(self):
+        self._refresh()
+        if not self.chunk_paths:
+            return 0
+        return (len(self.chunk_paths) - 1) * self.chunk_size + len(self._chunk(len(self.chunk_paths) - 1))
+
+    def start_time(self):
+        """ Unix time of the first record, or None if nothing is recorded yet """
+        self._refresh()
+        return self.chunk_starts[0] if self.chunk_starts else None
+
+    def read(self, start=None, end=None):
+        """
+        Read the records in a time range
+
+        :param start: unix time of the first record, None reads from the first record
+        :type start: float
+        :param end: unix time of the last record, None reads to the last record
+        :type end: float
+        :return: array for every column, textual values are returned as strings
+        :rtype: dict of np.ndarray
+        """
+        self._refresh()
+        if not self.chunk_paths:
+            return self._columns(np.empty((0, len(self.columns)), dtype=self.dtype))
+        first = 0 if start is None else max(bisect.bisect_right(self.chunk_starts, start) - 1, 0)
+        last = len(self.chunk_paths) - 1 if end is None else bisect.bisect_right(self.chunk_starts, end) - 1
+        parts = []
+        for index in range(first, last + 1):
+            records = self._chunk(index)
+            times = records[:, 0]
+            begin = 0 if start is None or index != first else np.searchsorted(times, start, "left")
+            stop = len(records) if end is None or index != last else np.searchsorted(times, end, "right")
+            parts.append(records[begin:stop])
+        records = np.concatenate(parts) if parts else np.empty((0, len(self.columns)), dtype=self.dtype)
+        return self._columns(records)
+
+    def read_new(self):
+        """
+        Read the records appended since the last call
+
+        :return: array for every column, textual values are returned as strings
+        :rtype: dict of np.ndarray
+        """
+        total = len(self)
+        parts = []
+        while self.position < total:
+            index, offset = divmod(self.position, self.chunk_size)
+            records = self._chunk(index)[offset:]
+            parts.append(records)
+            self.position += len(records)
+        records = np.concatenate(parts) if parts else np.empty((0, len(self.columns)), dtype=self.dtype)
+        return self._columns(records)
+
+    def _refresh(self):
+        """ Index chunk files created since the last refresh """
+        paths = chunk_paths(self.directory)
+        for path in paths[len(self.chunk_paths):]:
+            with open(path, "rb") as chunk:
+                first_record = chunk.read(self.record_size)
+            if len(first_record) < self.record_size:
+                break
+            self.chunk_paths.append(path)
+            self.chunk_starts.append(float(np.frombuffer(first_record, dtype=self.dtype)[0]))
+
+    def _chunk(self, index):
+        """ Memory map a chunk, full chunks never change and are mapped once """
+        records = self.chunks.get(index)
+        if records is not None and len(records) == self.chunk_size:
+            return records
+        count = os.path.getsize(self.chunk_paths[index]) // self.record_size
+        if records is None or len(records) != count:
+            records = np.memmap(self.chunk_paths[index], dtype=self.dtype, mode="r",
+                                shape=(count, len(self.columns)))
+            self.chunks[index] = records
+        return records
+
+    def _columns(self, records):
+        columns = {name: records[:, i] for i, name in enumerate(self.columns)}
+        if os.path.isfile(os.path.join(self.directory, CATEGORIES)) and len(records):
+            if np.max(columns["value"]) >= len(self.categories):
+                with open(os.path.join(self.directory, CATEGORIES)) as categories_file:
+                    self.categories = categories_file.read().splitlines()
+            columns["value"] = np.asarray(self.categories, dtype=object)[columns["value"].astype(int)]
+        return columns
+
+
+class SessionReader:
+    """ Reads the measurements of a session directory """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.readers = {}
+
+    def measurements(self):
+        """ Names of the measurements recorded in the session """
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.isfile(os.path.join(self.directory, name, HEADER)))
+
+    def reader(self, name):
+        """ The reader of a measurement, created on first use """
+        if name not in self.readers:
+            self.readers[name] = MeasurementReader(os.path.join(self.directory, name))
+        return self.readers[name]
+
+    def read(self, name, start=None, end=None):
+        """ Read the records of a measurement in a time range, see MeasurementReader.read """
+        return self.reader(name).read(start, end)
+
+
+def new_session_path(directory):
+    """ Path of a new session directory, named after the current time """
+    return os.path.join(directory, time.strftime("%Y%m%d-%H%M%S"))
+
+
+def install(session):
+    """
+    Install the session that measurements in this process are written to
+
+    :param session: the session writer of this process, or None
+    :type session: SessionWriter
+    """
+    global _session
+    _session = session
+
+
+def current():
+    """ The session writer installed in this process, or None """
+    return _session
+
+
+def close():
+    """ Close the session writer of this process """
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
@@ -0,0 +1,67 @@
+"""
+Streaming measurements, updated as data points enter and leave the window instead of
+recomputed from the whole window.
+
+A measurement function supports streaming when it has a streaming attribute, a class with:
+    push(sample): a new data point entered the window, at the end
+    evict(sample, successor): the oldest data point left the window, successor is the new oldest
+    value(): the measurement of the data points in the window, equal to the measurement function
+    resync(window): recompute the state from the window, to drop accumulated rounding errors
+
+The data handlers use the streaming class of a measurement function automatically.
+"""
+import abc
+import math
+from collections import deque
+
+
+def streaming(stream_class):
+    """
+    Decorator that marks a measurement function as computable by a stream
+
+    :param stream_class: the class of the stream, see the module docstring
+    :type stream_class: type
+    """
+    def decorate(measurement_func):
+        measurement_func.streaming = stream_class
+        return measurement_func
+    return decorate
+
+
+class PairwiseStream(abc.ABC):
+    """
+    Stream of a measurement that is a sum of a term over every pair of adjacent data points.
+    The terms in the window are kept, so an evicted pair subtracts exactly the term it added.
+    """
+
+    def __init__(self):
+        self.terms = deque()
+        self.total = 0.0
+        self.last = None
+        self.count = 0
+
+    @abc.abstractmethod
+    def term(self, previous, sample):
+        """ The term of two adjacent data points """
+
+    def push(self, sample):
+        if self.last is not None:
+            term = self.term(self.last, sample)
+            self.terms.append(term)
+            self.total += term
+        self.last = sample
+        self.count += 1
+
+    def evict(self, sample, successor):
+        self.count -= 1
+        if self.terms:
+            self.total -= self.terms.popleft()
+        if not self.count:
+            self.last = None
+
+    @abc.abstractmethod
+    def value(self):
+        """ The measurement of the terms in the window """
+
+    def resync(self, window):
+        self.total = math.fsum(self.terms)
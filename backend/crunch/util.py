@@ -1,22 +1,63 @@
+import atexit
 import configparser
-import csv
 import os
 import time
 
+from crunch import bus, store
+from crunch.writer import CsvWriter
 
-def write_csv(path, row, header_features=[]):
+_csv_writer = None
+
+
+def publish(path, row, header_features=[]):
+    """
+    Publish a result to the measurement bus, and write it to the session store and its csv file if enabled
+
+    :param path: path to the output csv file, the name of the measurement is derived from it
+    :type path: str
+    :param row: the measurement value, followed by any extra features
+    :type row: list
+    :param header_features: names of the extra features, used as csv header
+    :type header_features: list of str
+    """
+    if path is None:
+        return
+    timestamp = time.time()
+    measurement_bus = bus.current()
+    if measurement_bus is not None:
+        measurement_bus.publish(os.path.splitext(path)[0], timestamp, row[0])
+    session = store.current()
+    if session is not None:
+        session.write(path, row, header_features=header_features, timestamp=timestamp)
+    if bus.write_csv_enabled():
+        write_csv(path, row, header_features=header_features, timestamp=timestamp)
+
+
+def write_csv(path, row, header_features=[], timestamp=None):
     """ write result to csv file """
     if path is not None:
-        if not os.path.exists("crunch/output"):
-            os.makedirs("crunch/output")
-
-        file_exists = os.path.isfile("crunch/output/" + path)
-        with open("crunch/output/" + path, "a", newline="") as csvfile:
-            writer = csv.writer(csvfile, delimiter=",")
-            if not file_exists:
-                header = ['time', 'value']
-                writer.writerow(header + header_features)
-            writer.writerow([time.time()] + row)
+        csv_writer().write(path, row, header_features=header_features, timestamp=timestamp)
+
+
+def csv_writer():
+    """ The csv writer of this process, created on first use """
+    global _csv_writer
+    if _csv_writer is None:
+        _csv_writer = CsvWriter("crunch/output",
+                                flush_interval=float(config("output", "flush_interval")),
+                                batch_size=int(config("output", "batch_size")))
+    return _csv_writer
+
+
+def close_csv():
+    """ Flush, fsync and close the csv files written by this process """
+    global _csv_writer
+    if _csv_writer is not None:
+        _csv_writer.close()
+        _csv_writer = None
+
+
+atexit.register(close_csv)
 
 
 def to_list(x):
@@ -0,0 +1,132 @@
+"""
+Encodings of the websocket frames. A frame holds every measurement sent to a client in one tick.
+
+Each measurement is encoded once, when it is published, into a fragment, and the frames of the
+clients are built by joining fragments.
+
+Every measurement carries its sequence number, increasing by one for every measurement the hub
+sends, which a client uses to resume after a reconnect.
+
+json: a text frame with a list of {"seq", "name", "value", "time"} objects, time formatted as HH:MM:SS
+binary: a binary frame, little endian, with numeric unix timestamps:
+    uint16 number of measurements, then per measurement:
+    uint64 sequence number, float64 time, uint8 length of the name, the utf-8 name, uint8 type of the value,
+    then a float64 if the type is 0, or an uint16 length and the utf-8 text if the type is 1
+"""
+import json
+import struct
+from datetime import datetime
+
+JSON = "json"
+BINARY = "binary"
+ENCODINGS = (JSON, BINARY)
+
+FLOAT_VALUE = 0
+TEXT_VALUE = 1
+
+# most measurements in one frame, the binary frames count them in an uint16
+MAX_FRAME_SIZE = 65535
+
+
+class JsonEncoder:
+    """ Encodes measurements as json text frames, the format the frontend has always received """
+
+    def __init__(self):
+        self._second = None
+        self._time = None
+
+    def fragment(self, seq, name, timestamp, value):
+        """
+        Encode one measurement
+
+        :param seq: sequence number of the measurement
+        :type seq: int
+        :param name: name of the measurement
+        :type name: str
+        :param timestamp: unix time of the measurement
+        :type timestamp: float
+        :param value: the measurement value
+        :type value: float or str
+        :return: the encoded measurement
+        :rtype: str
+        """
+        return json.dumps({"seq": seq, "name": name, "value": value, "time": self._format_time(timestamp)})
+
+    def frame(self, fragments):
+        """ Join encoded measurements into one frame """
+        return "[" + ",".join(fragments) + "]"
+
+    def _format_time(self, timestamp):
+        """ Format the time as HH:MM:SS, measurements arrive in order so the last second is cached """
+        second = int(timestamp)
+        if second != self._second:
+            self._second = second
+            self._time = datetime.fromtimestamp(second).strftime("%H:%M:%S")
+        return self._time
+
+
+class BinaryEncoder:
+    """ Encodes measurements as compact binary frames with numeric timestamps """
+
+    def fragment(self, seq, name, timestamp, value):
+        """
+        Encode one measurement
+
+        :param seq: sequence number of the measurement
+        :type seq: int
+        :param name: name of the measurement
+        :type name: str
+        :param timestamp: unix time of the measurement
+        :type timestamp: float
+        :param value: the measurement value
+        :type value: float or str
+        :return: the encoded measurement
+        :rtype: bytes
+        """
+        name = name.encode("utf-8")
+        if isinstance(value, str):
+            text = value.encode("utf-8")
+            return struct.pack(f"<QdB{len(name)}sBH{len(text)}s", seq, timestamp, len(name), name,
+                               TEXT_VALUE, len(text), text)
+        return struct.pack(f"<QdB{len(name)}sBd", seq, timestamp, len(name), name, FLOAT_VALUE, value)
+
+    def frame(self, fragments):
+        """ Join encoded measurements into one frame """
+        return struct.pack("<H", len(fragments)) + b"".join(fragments)
+
+
+def decode_binary_frame(frame):
+    """
+    Decode a binary frame, used by tests and benchmarks, the frontend has its own decoder
+
+    :param frame: the binary frame
+    :type frame: bytes
+    :return: the measurements in the frame
+    :rtype: list of dict
+    """
+    count, = struct.unpack_from("<H", frame, 0)
+    offset = 2
+    measurements = []
+    for _ in range(count):
+        seq, timestamp, name_length = struct.unpack_from("<QdB", frame, offset)
+        offset += 17
+        name = frame[offset:offset + name_length].decode("utf-8")
+        offset += name_length
+        value_type, = struct.unpack_from("<B", frame, offset)
+        offset += 1
+        if value_type == TEXT_VALUE:
+            text_length, = struct.unpack_from("<H", frame, offset)
+            offset += 2
+            value = frame[offset:offset + text_length].decode("utf-8")
+            offset += text_length
+        else:
+            value, = struct.unpack_from("<d", frame, offset)
+            offset += 8
+        measurements.append({"seq": seq, "name": name, "value": value, "time": timestamp})
+    return measurements
+
+
+def create_encoder(encoding):
+    """ The encoder of an encoding, one of ENCODINGS """
+    assert encoding in ENCODINGS, f"Unknown websocket encoding {encoding}"
+    return JsonEncoder() if encoding == JSON else BinaryEncoder()
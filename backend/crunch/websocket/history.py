@@ -0,0 +1,119 @@
+import bisect
+import heapq
+import time
+
+
+class MeasurementHistory:
+    """
+    Ring of the messages of one measurement sent in the last seconds. Messages are kept in
+    lists in the order they were sent, so both sequence numbers and send times are sorted,
+    and found with a binary search. Expired messages are skipped by moving the start of the
+    ring, and the lists are compacted once half of them is expired.
+    """
+
+    def __init__(self):
+        self.seqs = []
+        self.sent = []
+        self.messages = []
+        self.start = 0
+
+    def __len__(self):
+        return len(self.seqs) - self.start
+
+    def append(self, seq, sent, message):
+        self.seqs.append(seq)
+        self.sent.append(sent)
+        self.messages.append(message)
+
+    def trim(self, before):
+        """ Drop the messages sent before a monotonic time """
+        self.start = bisect.bisect_left(self.sent, before, self.start)
+        if self.start and self.start >= len(self.seqs) // 2:
+            del self.seqs[:self.start], self.sent[:self.start], self.messages[:self.start]
+            self.start = 0
+
+    def since_seq(self, seq):
+        """ The messages with a sequence number after seq """
+        return self.messages[bisect.bisect_right(self.seqs, seq, self.start):]
+
+    def since_time(self, sent):
+        """ The messages sent at or after a monotonic time """
+        return self.messages[bisect.bisect_left(self.sent, sent, self.start):]
+
+
+class History:
+    """
+    The messages sent by the hub in the last seconds, kept in memory per measurement, so clients
+    that connect or reconnect can catch up without reading the session from disk.
+    """
+
+    def __init__(self, seconds=300):
+        """
+        :param seconds: how many seconds messages are kept, 0 keeps no history
+        :type seconds: float
+        """
+        self.seconds = seconds
+        self.measurements = {}
+
+    def append(self, message):
+        """
+        Keep a sent message
+
+        :param message: sequence number, name of the measurement and the encoded measurement
+        :type message: (int, str, str or bytes)
+        """
+        if not self.seconds:
+            return
+        measurement = self.measurements.get(message[1])
+        if measurement is None:
+            measurement = self.measurements[message[1]] = MeasurementHistory()
+        now = time.monotonic()
+        measurement.append(message[0], now, message)
+        measurement.trim(now - self.seconds)
+
+    def trim(self):
+        """ Drop expired messages of every measurement, also those that are no longer sent """
+        before = time.monotonic() - self.seconds
+        for name, measurement in list(self.measurements.items()):
+            measurement.trim(before)
+            if not measurement:
+                del self.measurements[name]
+
+    def since_seq(self, seq, names=None):
+        """
+        The kept messages with a sequence number after seq
+
+        :param seq: sequence number of the last message the client received
+        :type seq: int
+        :param names: only the messages of these measurements, None for every measurement
+        :type names: set of str
+        :return: the messages, in the order they were sent
+        :rtype: list of (int, str, str or bytes)
+        """
+        self.trim()
+        return self._merge(measurement.since_seq(seq) for measurement in self._select(names))
+
+    def last(self, seconds, names=None):
+        """
+        The kept messages sent in the last seconds
+
+        :param seconds: number of seconds of history
+        :type seconds: float
+        :param names: only the messages of these measurements, None for every measurement
+        :type names: set of str
+        :return: the messages, in the order they were sent
+        :rtype: list of (int, str, str or bytes)
+        """
+        self.trim()
+        sent = time.monotonic() - seconds
+        return self._merge(measurement.since_time(sent) for measurement in self._select(names))
+
+    def _select(self, names):
+        if names is None:
+            return list(self.measurements.values())
+        return [self.measurements[name] for name in names if name in self.measurements]
+
+    @staticmethod
+    def _merge(parts):
+        """ Merge the messages of the measurements by sequence number """
+        return list(heapq.merge(*parts, key=lambda message: message[0]))
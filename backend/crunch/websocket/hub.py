@@ -0,0 +1,340 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+from crunch.websocket.encoding import JsonEncoder
+from crunch.websocket.history import History
+
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+DISCONNECT = "disconnect"
+POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+
+class ClientBuffer:
+    """
+    Bounded buffer of the messages waiting to be sent to one websocket client.
+    A message is a tuple of the sequence number, the measurement name and the encoded measurement.
+
+    When the client reads slower than measurements are published the buffer fills up,
+    and the slow consumer policy decides what happens to a new message:
+        drop_oldest: the oldest message in the buffer is dropped
+        coalesce: only the latest message of every measurement is kept
+        disconnect: the client is disconnected
+    """
+
+    def __init__(self, maxsize=256, policy=DROP_OLDEST):
+        """
+        :param maxsize: maximum number of messages in the buffer
+        :type maxsize: int
+        :param policy: the slow consumer policy, one of POLICIES
+        :type policy: str
+        """
+        assert policy in POLICIES, f"Unknown slow consumer policy {policy}"
+        self.maxsize = maxsize
+        self.policy = policy
+        self.messages = deque()
+        self.history = []
+        # None while the client receives every measurement, except the excluded measurements
+        self.subscriptions = None
+        self.excluded = set()
+        self.event = asyncio.Event()
+        self.dropped = 0
+        self.disconnected = False
+
+    def put(self, message):
+        """
+        Add a message to the buffer, applying the slow consumer policy if it is full
+
+        :param message: sequence number, name of the measurement and the encoded measurement
+        :type message: (int, str, str or bytes)
+        :return: False if the client should be disconnected
+        :rtype: bool
+        """
+        if self.disconnected:
+            return False
+        self.messages.append(message)
+        if len(self.messages) > self.maxsize:
+            if self.policy == DISCONNECT:
+                self.disconnected = True
+                self.messages.clear()
+                self.event.set()
+                return False
+            if self.policy == COALESCE:
+                self._coalesce()
+            while len(self.messages) > self.maxsize:
+                self.messages.popleft()
+                self.dropped += 1
+        self.event.set()
+        return True
+
+    def resume(self, history):
+        """
+        Send history before the buffered messages. The history is not limited by the buffer size,
+        and buffered messages that are also in the history are sent once.
+
+        :param history: messages sent before, in the order they were sent
+        :type history: list of (int, str, str or bytes)
+        """
+        if self.disconnected or not history:
+            return
+        self.history = history
+        self.event.set()
+
+    def discard(self, names):
+        """ Drop the buffered messages of measurements the client no longer subscribes to """
+        self.messages = deque(message for message in self.messages if message[1] not in names)
+        self.history = [message for message in self.history if message[1] not in names]
+
+    async def get(self):
+        """
+        Wait for the next message
+
+        :return: the oldest message in the buffer, or None if the client is disconnected
+        :rtype: (int, str, str or bytes)
+        """
+        await self._wait()
+        if self.disconnected:
+            return None
+        if self.history:
+            self._drop_resent()
+            return self.history.pop(0)
+        return self.messages.popleft()
+
+    async def get_batch(self):
+        """
+        Wait for at least one message, and take every message in the buffer
+
+        :return: the messages, or None if the client is disconnected
+        :rtype: list of (int, str, str or bytes)
+        """
+        await self._wait()
+        if self.disconnected:
+            return None
+        self._drop_resent()
+        messages = self.history + list(self.messages)
+        self.history = []
+        self.messages.clear()
+        return messages
+
+    async def _wait(self):
+        while not self.messages and not self.history and not self.disconnected:
+            self.event.clear()
+            await self.event.wait()
+
+    def _drop_resent(self):
+        """ Drop the buffered messages that are also in the history """
+        if self.history:
+            while self.messages and self.messages[0][0] <= self.history[-1][0]:
+                self.messages.popleft()
+
+    def _coalesce(self):
+        """ Keep only the latest message of every measurement, in the order they were published """
+        latest = OrderedDict()
+        for message in self.messages:
+            latest.pop(message[1], None)
+            latest[message[1]] = message
+        self.dropped += len(self.messages) - len(latest)
+        self.messages = deque(latest.values())
+
+
+class BroadcastHub:
+    """
+    Sends every published measurement to every connected client. Each client has its own
+    bounded buffer, so a slow client never holds back the others.
+
+    A measurement is encoded once when it is published. Measurements can be limited to a maximum
+    update rate, a measurement published too soon after the previous one is held back, replaced
+    by any newer value, and sent by tick once the rate allows it.
+
+    Every sent measurement gets the next sequence number, and is kept in the history for
+    history_seconds, so a client can ask for the measurements it missed when it reconnects.
+
+    A client receives every measurement, but those it unsubscribes from, until it subscribes to
+    some measurements. Subscribers are indexed by measurement, so a measurement is only routed
+    to the clients that want it.
+    """
+
+    def __init__(self, buffer_size=256, policy=DROP_OLDEST, encoder=None, max_rate=0, rate_limits={},
+                 history_seconds=300):
+        """
+        :param buffer_size: maximum number of buffered messages per client
+        :type buffer_size: int
+        :param policy: the slow consumer policy of the client buffers, see ClientBuffer
+        :type policy: str
+        :param encoder: encodes the measurements, see crunch.websocket.encoding
+        :type encoder: JsonEncoder or BinaryEncoder
+        :param max_rate: maximum updates per second of every measurement, 0 is unlimited
+        :type max_rate: float
+        :param rate_limits: maximum updates per second of specific measurements, overrides max_rate
+        :type rate_limits: dict of str: float
+        :param history_seconds: how many seconds sent measurements are kept for clients that resume
+        :type history_seconds: float
+        """
+        assert policy in POLICIES, f"Unknown slow consumer policy {policy}"
+        self.buffer_size = buffer_size
+        self.policy = policy
+        self.encoder = encoder if encoder is not None else JsonEncoder()
+        self.max_rate = max_rate
+        self.rate_limits = rate_limits
+        self.clients = set()
+        # the clients that receive every measurement, and the subscribers of every measurement
+        self.everything = set()
+        self.subscribers = {}
+        self.names = set()
+        self.next_allowed = {}
+        self.held_back = {}
+        self.seq = 0
+        self.history = History(history_seconds)
+
+    def register(self):
+        """
+        Register a new client
+
+        :return: the buffer of the client
+        :rtype: ClientBuffer
+        """
+        client = ClientBuffer(self.buffer_size, self.policy)
+        self.clients.add(client)
+        self.everything.add(client)
+        return client
+
+    def unregister(self, client):
+        """ Unregister a client, a client that was disconnected by the slow consumer policy is already gone """
+        if client not in self.clients:
+            return
+        self.clients.discard(client)
+        self.everything.discard(client)
+        if client.subscriptions:
+            self._remove_subscriber(client, client.subscriptions)
+        client.subscriptions = None
+
+    def subscribe(self, client, names):
+        """
+        Subscribe a client to measurements, from then on it only receives the measurements it subscribes to
+
+        :param client: the buffer of the client
+        :type client: ClientBuffer
+        :param names: names of the measurements
+        :type names: list of str
+        """
+        if client not in self.clients:
+            return
+        if client.subscriptions is None:
+            self.everything.discard(client)
+            client.subscriptions = set()
+            client.excluded.clear()
+        for name in names:
+            self.subscribers.setdefault(name, set()).add(client)
+        client.subscriptions.update(names)
+        client.discard(self.names - client.subscriptions)
+
+    def unsubscribe(self, client, names):
+        """
+        Unsubscribe a client from measurements, a client that receives every measurement
+        receives every measurement but these
+
+        :param client: the buffer of the client
+        :type client: ClientBuffer
+        :param names: names of the measurements
+        :type names: list of str
+        """
+        if client not in self.clients:
+            return
+        if client.subscriptions is None:
+            client.excluded.update(names)
+            client.discard(client.excluded)
+            return
+        names = client.subscriptions.intersection(names)
+        self._remove_subscriber(client, names)
+        client.subscriptions.difference_update(names)
+        client.discard(names)
+
+    def _remove_subscriber(self, client, names):
+        for name in names:
+            subscribers = self.subscribers.get(name)
+            if subscribers is None:
+                continue
+            subscribers.discard(client)
+            if not subscribers:
+                del self.subscribers[name]
+
+    def resume(self, client, since=None, seconds=None):
+        """
+        Send a client the measurements in the history it asks for
+
+        :param client: the buffer of the client
+        :type client: ClientBuffer
+        :param since: send the measurements after this sequence number
+        :type since: int
+        :param seconds: send the measurements of the last seconds, if since is not given
+        :type seconds: float
+        """
+        if since is not None:
+            # a sequence number from before the server restarted, everything kept is new to the client
+            if since > self.seq:
+                since = 0
+            client.resume(self.history.since_seq(since, self._subscriptions(client)))
+        elif seconds is not None:
+            client.resume(self.history.last(seconds, self._subscriptions(client)))
+
+    def _subscriptions(self, client):
+        """ The measurements a client receives, None for every measurement """
+        if client.subscriptions is None and client.excluded:
+            return self.names - client.excluded
+        return client.subscriptions
+
+    def publish(self, name, timestamp, value):
+        """
+        Send a measurement to every client, unless it is held back by the rate limit of the measurement
+
+        :param name: name of the measurement
+        :type name: str
+        :param timestamp: unix time of the measurement
+        :type timestamp: float
+        :param value: the measurement value
+        :type value: float or str
+        """
+        rate = self.rate_limits.get(name, self.max_rate)
+        if rate:
+            now = time.monotonic()
+            if now < self.next_allowed.get(name, 0):
+                self.held_back[name] = (timestamp, value)
+                return
+            self.next_allowed[name] = now + 1 / rate
+        self._broadcast(name, timestamp, value)
+
+    def tick(self):
+        """ Send the held back measurements the rate limits allow again, called every tick """
+        self.history.trim()
+        if not self.held_back:
+            return
+        now = time.monotonic()
+        for name, (timestamp, value) in list(self.held_back.items()):
+            if now >= self.next_allowed[name]:
+                del self.held_back[name]
+                self.next_allowed[name] = now + 1 / self.rate_limits.get(name, self.max_rate)
+                self._broadcast(name, timestamp, value)
+
+    def _broadcast(self, name, timestamp, value):
+        self.send(self.seq + 1, name, timestamp, value)
+
+    def send(self, seq, name, timestamp, value):
+        """
+        Encode a measurement once, keep it in the history, and put it in the buffer of its clients.
+        Measurements published to the hub are numbered and rate limited first, the websocket
+        workers send the measurements the aggregator already numbered and rate limited.
+
+        :param seq: sequence number of the measurement
+        :type seq: int
+        """
+        self.seq = seq
+        message = (seq, name, self.encoder.fragment(seq, name, timestamp, value))
+        self.history.append(message)
+        self.names.add(name)
+        for client in list(self.everything):
+            if name not in client.excluded and not client.put(message):
+                self.unregister(client)
+        for client in list(self.subscribers.get(name, ())):
+            if not client.put(message):
+                self.unregister(client)
@@ -0,0 +1,103 @@
+import csv
+import os
+
+# bytes before the offset of a file that are compared, to notice a file that was replaced by a longer one
+ANCHOR_SIZE = 64
+
+
+class TailReader:
+    """
+    Reads the rows appended to the measurement csv files since the last read.
+    A byte offset is kept for every file, so only the new part of a file is parsed,
+    no matter how long the session has been running.
+
+    A file that was replaced, i.e when a session is restarted, is read from the start. It is recognised
+    by its identity, the device and inode of the file, by being shorter than the offset, or by the last bytes
+    read, the anchor, that are no longer before the offset.
+    """
+
+    def __init__(self):
+        self.offsets = {}
+        self.partial_lines = {}
+        self.identities = {}
+        self.anchors = {}
+
+    def skip_existing(self, directory):
+        """
+        Start reading the csv files already in the directory from their current end,
+        so that history from before the websocket was started is not sent
+
+        :param directory: the directory with measurement csv files
+        :type directory: str
+        """
+        for file_name in os.listdir(directory):
+            if file_name.endswith(".csv"):
+                file_path = os.path.join(directory, file_name)
+                with open(file_path, "rb") as csv_file:
+                    stat = os.fstat(csv_file.fileno())
+                    csv_file.seek(max(stat.st_size - ANCHOR_SIZE, 0))
+                    self.anchors[file_path] = csv_file.read(stat.st_size)
+                self.offsets[file_path] = stat.st_size
+                self.identities[file_path] = (stat.st_dev, stat.st_ino)
+
+    def read_new_rows(self, file_path):
+        """
+        Parse the rows appended to a csv file since the last time it was read
+
+        :param file_path: path to the csv file
+        :type file_path: str
+        :return: the new rows as (time, value) tuples
+        :rtype: list of (float, float or str)
+        """
+        offset = self.offsets.get(file_path, 0)
+        anchor = self.anchors.get(file_path, b"")
+        try:
+            with open(file_path, "rb") as csv_file:
+                stat = os.fstat(csv_file.fileno())
+                identity = (stat.st_dev, stat.st_ino)
+                if offset and (identity != self.identities.get(file_path) or stat.st_size < offset
+                               or not self._anchored(csv_file, offset, anchor)):
+                    # the file was truncated or replaced, start over
+                    offset = 0
+                    anchor = b""
+                    self.partial_lines.pop(file_path, None)
+                csv_file.seek(offset)
+                data = csv_file.read()
+        except FileNotFoundError:
+            self._forget(file_path)
+            return []
+
+        self.offsets[file_path] = offset + len(data)
+        self.identities[file_path] = identity
+        self.anchors[file_path] = (anchor + data)[-ANCHOR_SIZE:]
+        lines = (self.partial_lines.pop(file_path, b"") + data).split(b"\n")
+        # the last line is incomplete unless the data ended with a newline
+        if lines[-1]:
+            self.partial_lines[file_path] = lines[-1]
+
+        rows = []
+        for row in csv.reader(line.decode("utf-8") for line in lines[:-1]):
+            try:
+                rows.append((float(row[0]), self._parse_value(row[1])))
+            except (ValueError, IndexError):
+                # the header, or an empty line
+                continue
+        return rows
+
+    @staticmethod
+    def _anchored(csv_file, offset, anchor):
+        """ Whether the file still has the anchor before the offset """
+        csv_file.seek(offset - len(anchor))
+        return csv_file.read(len(anchor)) == anchor
+
+    def _forget(self, file_path):
+        for state in (self.offsets, self.partial_lines, self.identities, self.anchors):
+            state.pop(file_path, None)
+
+    @staticmethod
+    def _parse_value(value):
+        """ Measurement values are numbers, except for a few textual measurements like anticipation """
+        try:
+            return float(value)
+        except ValueError:
+            return value
@@ -2,43 +2,217 @@ import asyncio
 import functools
 import json
 import os
+import signal
 import socket
-from datetime import datetime
+from urllib.parse import parse_qs, urlparse
 
-import pandas as pd
+import numpy as np
 import websockets
 from watchgod import awatch
 
 import crunch.util as util
+from crunch.store import SessionReader
+from crunch.websocket.encoding import MAX_FRAME_SIZE, create_encoder
+from crunch.websocket.hub import BroadcastHub
+from crunch.websocket.tail import TailReader
+from crunch.websocket.workers import (Aggregator, receive_measurements,
+                                      reuse_port_supported, start_workers)
 
 
-async def watcher(queue):
+async def reader(measurement_bus, hub):
+    """ Read measurements from the measurement bus, and broadcast them to the clients """
+    loop = asyncio.get_event_loop()
+    while True:
+        # the bus blocks, so wait for it in a thread, and time out regularly so the thread can exit
+        message = await loop.run_in_executor(None, measurement_bus.get, 1)
+        # then take whatever else is on the bus without waiting
+        while message is not None:
+            hub.publish(*message)
+            message = measurement_bus.get(timeout=0)
+
+
+async def replayer(hub, session_path, speed=1.0):
+    """ Replay a session from the session store, at the pace it was recorded """
+    session = SessionReader(session_path)
+    names, times, values = [], [], []
+    for name in session.measurements():
+        columns = session.read(name)
+        names.extend([name] * len(columns["time"]))
+        times.append(columns["time"])
+        values.extend(columns["value"].tolist())
+    if not names:
+        return
+    times = np.concatenate(times)
+    order = np.argsort(times, kind="stable")
+
+    loop = asyncio.get_event_loop()
+    replay_start = loop.time()
+    for index in order:
+        delay = (times[index] - times[order[0]]) / speed - (loop.time() - replay_start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        hub.publish(names[index], times[index], values[index])
+
+
+async def watcher(hub):
     if not os.path.exists("crunch/output"):
         os.makedirs("crunch/output")
+    tail_reader = TailReader()
+    tail_reader.skip_existing("./crunch/output/")
     async for changes in awatch('./crunch/output/'):
-        for a in changes:
-            file_path = a[1]
-            # get last row of changed file
-            df = pd.read_csv(file_path).iloc[-1]
-            # format how we send it to frontend
-            time = datetime.fromtimestamp(int(df.time)).strftime("%H:%M:%S")
-            data = {"name": file_path[16:-4], "value": df.value, "time": time}
-            # put it queue so web socket can read
-            await queue.put([data])
-
-
-async def handler(websocket, path, queue):
+        # a burst of events can name the same file many times, read each file once
+        file_paths = {file_path for _, file_path in changes if file_path.endswith(".csv")}
+        for file_path in sorted(file_paths):
+            name = os.path.splitext(os.path.basename(file_path))[0]
+            # send every row appended since the last change
+            for time, value in tail_reader.read_new_rows(file_path):
+                hub.publish(name, time, value)
+
+
+async def ticker(hub, tick):
+    """ Let the hub send the measurements held back by rate limits, every tick """
+    while True:
+        await asyncio.sleep(tick)
+        hub.tick()
+
+
+def parse_requests(request):
+    """
+    Parse the requests of a client, either a json message or the query of the websocket path:
+        {"type": "subscribe", "measurements": [names]} or ?subscribe=name,name, only receive these measurements
+        {"type": "unsubscribe", "measurements": [names]}, stop receiving these measurements
+        {"type": "resume", "since": seq} or ?since=seq, the measurements after a sequence number
+        {"type": "replay", "seconds": n} or ?seconds=n, the measurements of the last n seconds
+
+    :param request: the message or the websocket path
+    :type request: str
+    :return: the name and keyword arguments of the BroadcastHub method of every valid request
+    :rtype: list of (str, dict)
+    """
+    requests = []
+    try:
+        if request.startswith("{"):
+            message = json.loads(request)
+            request_type = message.get("type")
+            if request_type in ("subscribe", "unsubscribe"):
+                names = message["measurements"]
+                if isinstance(names, list) and all(isinstance(name, str) for name in names):
+                    requests.append((request_type, {"names": names}))
+            elif request_type == "resume":
+                requests.append(("resume", {"since": int(message["since"])}))
+            elif request_type == "replay":
+                requests.append(("resume", {"seconds": float(message["seconds"])}))
+        else:
+            query = parse_qs(urlparse(request).query)
+            # subscribe first, so the history is only of the subscribed measurements
+            if "subscribe" in query:
+                requests.append(("subscribe", {"names": ",".join(query["subscribe"]).split(",")}))
+            if "since" in query:
+                requests.append(("resume", {"since": int(query["since"][0])}))
+            elif "seconds" in query:
+                requests.append(("resume", {"seconds": float(query["seconds"][0])}))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return []
+    return requests
+
+
+def serve_requests(requests, client, hub):
+    for method, arguments in requests:
+        getattr(hub, method)(client, **arguments)
+
+
+async def receiver(websocket, client, hub):
+    """ Serve the requests a client sends """
+    async for message in websocket:
+        requests = parse_requests(message) if isinstance(message, str) else []
+        if not requests:
+            print("Ignoring invalid message from websocket client")
+        serve_requests(requests, client, hub)
+
+
+async def sender(websocket, client, hub, tick):
+    """ Send every measurement published in a tick to the client in one frame """
+    while True:
+        messages = await client.get_batch()
+        if messages is None:
+            print("Disconnecting websocket client that can not keep up")
+            await websocket.close(1008, "Client can not keep up")
+            break
+        # history can hold more measurements than fit in a frame
+        for start in range(0, len(messages), MAX_FRAME_SIZE):
+            await websocket.send(hub.encoder.frame([fragment for _, _, fragment in
+                                                    messages[start:start + MAX_FRAME_SIZE]]))
+        # collect the measurements of the next tick
+        await asyncio.sleep(tick)
+
+
+async def handler(websocket, path, hub, tick):
+    """ Send the measurements to a client, and serve the requests it makes when it connects or later """
+    client = hub.register()
+    serve_requests(parse_requests(path), client, hub)
+    tasks = [asyncio.ensure_future(sender(websocket, client, hub, tick)),
+             asyncio.ensure_future(receiver(websocket, client, hub))]
     try:
-        while True:
-            data = await queue.get()
-            await websocket.send(json.dumps(data))
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None and not isinstance(task.exception(), websockets.ConnectionClosed):
+                raise task.exception()
     finally:
+        for task in tasks:
+            task.cancel()
+        hub.unregister(client)
         print("Lost connection with websocket client")
 
 
-def start_websocket():
+def hub_settings():
+    """ The settings of the hubs serving the clients, from the config """
+    return {"buffer_size": int(util.config("websocket", "client_buffer")),
+            "policy": util.config("websocket", "slow_consumer_policy"),
+            "encoding": util.config("websocket", "encoding"),
+            "history_seconds": float(util.config("websocket", "history_seconds"))}
+
+
+def serve(hub, ip, port, tick, compression, reuse_port=False):
+    """ Start the websocket server of a hub """
+    return websockets.serve(functools.partial(handler, hub=hub, tick=tick), ip, port,
+                            compression=None if compression == "None" else compression, reuse_port=reuse_port)
+
+
+def serve_worker(connection, ip, port, tick, compression, settings):
+    """ Run a websocket worker process, serving the measurements the aggregator forwards over the connection """
+    # ctrl+c is handled by the main process, the workers stop with it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    settings = dict(settings)
+    hub = BroadcastHub(encoder=create_encoder(settings.pop("encoding")), **settings)
+    server = loop.run_until_complete(serve(hub, ip, port, tick, compression, reuse_port=True))
+    loop.create_task(ticker(hub, tick))
+    loop.run_until_complete(receive_measurements(connection, hub))
+    server.close()
+
+
+def start_websocket(measurement_bus=None, session_path=None, speed=1.0):
+    """
+    Start the websocket server, in this process or in [websocket] workers processes
+
+    :param measurement_bus: the bus the device processes publish to, if None the csv files are watched instead
+    :type measurement_bus: crunch.bus.MeasurementBus
+    :param session_path: replay this recorded session instead of live measurements
+    :type session_path: str
+    :param speed: how many times faster than real time the session is replayed
+    :type speed: float
+    """
     loop = asyncio.get_event_loop()
-    queue = asyncio.Queue(loop=loop)
+    tick = float(util.config("websocket", "tick"))
+    max_rate = float(util.config("websocket", "max_rate"))
+    rate_limits = {name: float(rate) for name, rate in util.config("rate_limits").items()}
+    settings = hub_settings()
+    compression = util.config("websocket", "compression")
+    workers = int(util.config("websocket", "workers"))
+    if workers > 1 and not reuse_port_supported():
+        print("Websocket workers can not share a port on this platform, starting one websocket server")
+        workers = 1
 
     local_ip = socket.gethostbyname(socket.gethostname())
     ip = "127.0.0.1" if util.config("websocket", "use_localhost") == "True" else local_ip
@@ -50,8 +224,20 @@ def start_websocket():
     print("###### Port: ", port)
     print("##################################################################")
 
-    start_server = websockets.serve(functools.partial(handler, queue=queue), ip, port)
-    loop.run_until_complete(asyncio.gather(
-        start_server,
-        watcher(queue),
-    ))
+    tasks = []
+    if workers > 1:
+        connections = start_workers(workers, serve_worker, (ip, port, tick, compression, settings))
+        hub = Aggregator(connections, max_rate=max_rate, rate_limits=rate_limits,
+                         buffer_size=int(util.config("websocket", "worker_buffer")), policy=settings["policy"])
+    else:
+        encoder = create_encoder(settings.pop("encoding"))
+        hub = BroadcastHub(encoder=encoder, max_rate=max_rate, rate_limits=rate_limits, **settings)
+        tasks.append(serve(hub, ip, port, tick, compression))
+    if session_path is not None:
+        tasks.append(replayer(hub, session_path, speed))
+    elif measurement_bus is not None:
+        tasks.append(reader(measurement_bus, hub))
+    else:
+        tasks.append(watcher(hub))
+    tasks.append(ticker(hub, tick))
+    loop.run_until_complete(asyncio.gather(*tasks))
@@ -0,0 +1,229 @@
+"""
+Websocket workers, for audiences larger than one process can serve.
+
+The main process runs the aggregator, which reads the measurements, numbers and rate limits them
+like the hub does, and forwards them in batches over a pipe to every worker. Every worker is a
+process with its own hub and websocket server, all listening on the same port with SO_REUSEPORT,
+so the operating system spreads the clients over the workers. The workers receive the same
+numbered measurements, so a client can resume on any worker.
+
+The batches are queued for every worker and written to its pipe by a thread, so a worker that stops
+reading does not block the event loop or the other workers. When the queue of a worker is full the
+slow consumer policy of the clients is applied to the worker.
+"""
+import asyncio
+import pickle
+import socket
+import threading
+from collections import OrderedDict, deque
+from multiprocessing import Pipe, Process
+
+from crunch.websocket.hub import (COALESCE, DISCONNECT, DROP_OLDEST, POLICIES,
+                                  BroadcastHub)
+
+
+def reuse_port_supported():
+    """ Whether the workers can share a port, SO_REUSEPORT is not available on Windows """
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+class WorkerFeed:
+    """
+    Bounded queue of the batches waiting to be forwarded to one worker, written to its pipe by a thread.
+
+    When the worker reads slower than measurements are published the queue fills up,
+    and the slow consumer policy decides what happens to a new batch:
+        drop_oldest: the oldest batches in the queue are dropped
+        coalesce: only the latest measurement of every measurement name is kept
+        disconnect: the pipe to the worker is closed, and the worker stops
+    """
+
+    def __init__(self, connection, maxsize=4096, policy=DROP_OLDEST):
+        """
+        :param connection: the pipe to the worker
+        :type connection: multiprocessing.connection.Connection
+        :param maxsize: maximum number of measurements in the queue
+        :type maxsize: int
+        :param policy: the slow consumer policy, one of POLICIES
+        :type policy: str
+        """
+        assert policy in POLICIES, f"Unknown slow consumer policy {policy}"
+        self.connection = connection
+        self.maxsize = maxsize
+        self.policy = policy
+        # batches of measurements, with the batch serialized for all workers or None if it was coalesced
+        self.batches = deque()
+        self.size = 0
+        self.dropped = 0
+        self.closing = False
+        self.disconnected = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._forward, daemon=True)
+        self.thread.start()
+
+    def put(self, batch, payload):
+        """
+        Queue a batch for the worker, applying the slow consumer policy if the queue is full
+
+        :param batch: numbered measurements
+        :type batch: list of (int, str, float, object)
+        :param payload: the pickled batch
+        :type payload: bytes
+        :return: False if the worker is disconnected
+        :rtype: bool
+        """
+        with self.condition:
+            if self.disconnected or self.closing:
+                return False
+            self.batches.append((batch, payload))
+            self.size += len(batch)
+            if self.size > self.maxsize:
+                if self.policy == DISCONNECT:
+                    print(f"Websocket worker is not reading, disconnecting it after {self.size} measurements")
+                    self._disconnect()
+                    return False
+                if self.policy == COALESCE:
+                    self._coalesce()
+                while self.size > self.maxsize and len(self.batches) > 1:
+                    dropped, _ = self.batches.popleft()
+                    self.size -= len(dropped)
+                    self.dropped += len(dropped)
+            self.condition.notify()
+            return True
+
+    def close(self):
+        """ Forward the queued batches, and close the pipe to the worker """
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+
+    def _disconnect(self):
+        """ Drop the queued batches, the thread closes the pipe once a write in progress returns """
+        self.disconnected = True
+        self.batches.clear()
+        self.size = 0
+        self.condition.notify()
+
+    def _coalesce(self):
+        """ Replace the queued batches with one batch of the latest measurement of every name """
+        latest = OrderedDict()
+        for batch, _ in self.batches:
+            for measurement in batch:
+                latest.pop(measurement[1], None)
+                latest[measurement[1]] = measurement
+        self.dropped += self.size - len(latest)
+        self.batches = deque([(list(latest.values()), None)])
+        self.size = len(latest)
+
+    def _forward(self):
+        """ Write the queued batches to the pipe, until the feed is closed or the worker is gone """
+        while True:
+            with self.condition:
+                while not self.batches and not self.closing and not self.disconnected:
+                    self.condition.wait()
+                if self.disconnected or not self.batches:
+                    break
+                batch, payload = self.batches.popleft()
+                self.size -= len(batch)
+            try:
+                self.connection.send_bytes(payload or pickle.dumps(batch, pickle.HIGHEST_PROTOCOL))
+            except (OSError, ValueError):
+                with self.condition:
+                    self._disconnect()
+        self.connection.close()
+
+
+class Aggregator(BroadcastHub):
+    """
+    Numbers and rate limits the published measurements, and forwards them to the workers.
+    Measurements published in the same iteration of the event loop are forwarded in one batch,
+    serialized once for all workers, and queued in the WorkerFeed of every worker.
+    """
+
+    def __init__(self, connections, max_rate=0, rate_limits={}, buffer_size=4096, policy=DROP_OLDEST):
+        """
+        :param connections: the pipes to the workers
+        :type connections: list of multiprocessing.connection.Connection
+        :param max_rate: maximum updates per second of every measurement, 0 is unlimited
+        :type max_rate: float
+        :param rate_limits: maximum updates per second of specific measurements, overrides max_rate
+        :type rate_limits: dict of str: float
+        :param buffer_size: maximum number of measurements queued for a worker
+        :type buffer_size: int
+        :param policy: the slow consumer policy of the workers, one of POLICIES
+        :type policy: str
+        """
+        super().__init__(max_rate=max_rate, rate_limits=rate_limits, history_seconds=0)
+        self.feeds = [WorkerFeed(connection, buffer_size, policy) for connection in connections]
+        self.batch = []
+
+    def send(self, seq, name, timestamp, value):
+        """ Add a numbered measurement to the batch, which is forwarded when the event loop is idle """
+        self.seq = seq
+        if not self.batch:
+            asyncio.get_event_loop().call_soon(self.flush)
+        self.batch.append((seq, name, float(timestamp), value))
+
+    def flush(self):
+        """ Queue the batch for every worker that is still connected """
+        if not self.batch:
+            return
+        payload = pickle.dumps(self.batch, pickle.HIGHEST_PROTOCOL)
+        self.feeds = [feed for feed in self.feeds if feed.put(self.batch, payload)]
+        self.batch = []
+
+    def close(self):
+        """ Forward the queued batches, and close the pipes to the workers """
+        self.flush()
+        for feed in self.feeds:
+            feed.close()
+
+
+def start_workers(count, target, args=()):
+    """
+    Start the worker processes
+
+    :param count: number of workers
+    :type count: int
+    :param target: the function a worker runs, called with the pipe to the aggregator and args
+    :type target: function
+    :param args: the other arguments of target
+    :type args: tuple
+    :return: the pipes to the workers
+    :rtype: list of multiprocessing.connection.Connection
+    """
+    connections = []
+    for _ in range(count):
+        receiving, sending = Pipe(duplex=False)
+        Process(target=target, args=(receiving,) + tuple(args), daemon=True).start()
+        receiving.close()
+        connections.append(sending)
+    return connections
+
+
+def receive_measurements(connection, hub):
+    """
+    Send the measurements the aggregator forwards to the clients of a worker, as they arrive
+
+    :param connection: the pipe from the aggregator
+    :type connection: multiprocessing.connection.Connection
+    :param hub: the hub of the worker
+    :type hub: BroadcastHub
+    :return: a future that is done when the aggregator is gone
+    :rtype: asyncio.Future
+    """
+    loop = asyncio.get_event_loop()
+    closed = loop.create_future()
+
+    def receive():
+        try:
+            while connection.poll():
+                for measurement in pickle.loads(connection.recv_bytes()):
+                    hub.send(*measurement)
+        except (EOFError, OSError):
+            loop.remove_reader(connection.fileno())
+            if not closed.done():
+                closed.set_result(None)
+
+    loop.add_reader(connection.fileno(), receive)
+    return closed
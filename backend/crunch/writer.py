@@ -0,0 +1,109 @@
+import csv
+import os
+import threading
+import time
+
+
+class CsvWriter:
+    """
+    Writes measurement rows to csv files, keeping one open and buffered file per measurement.
+    Buffered rows are flushed when batch_size rows have been written, and at least every
+    flush_interval seconds by a background thread. close flushes and fsyncs every file,
+    and must be called on shutdown.
+    """
+
+    def __init__(self, directory="crunch/output", flush_interval=1.0, batch_size=100):
+        """
+        :param directory: the directory the csv files are written to
+        :type directory: str
+        :param flush_interval: maximum number of seconds a row stays in the buffer
+        :type flush_interval: float
+        :param batch_size: number of rows written before the buffers are flushed
+        :type batch_size: int
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.files = {}
+        self.writers = {}
+        self.unflushed_rows = 0
+        self.lock = threading.RLock()
+        self.closed = threading.Event()
+        self.flush_thread = None
+
+    def write(self, path, row, header_features=[], timestamp=None):
+        """
+        Write a row to the csv file of a measurement
+
+        :param path: path to the csv file, relative to the output directory
+        :type path: str
+        :param row: the measurement value, followed by any extra features
+        :type row: list
+        :param header_features: names of the extra features, written in the header of a new file
+        :type header_features: list of str
+        :param timestamp: unix time of the measurement, defaults to now
+        :type timestamp: float
+        """
+        with self.lock:
+            writer = self.writers.get(path)
+            if writer is None:
+                writer = self._open(path, header_features)
+            writer.writerow([time.time() if timestamp is None else timestamp] + row)
+            self.unflushed_rows += 1
+            if self.unflushed_rows >= self.batch_size:
+                self._flush()
+
+    def flush(self, sync=False):
+        """
+        Flush the buffered rows of every file
+
+        :param sync: also fsync the files, so the rows survive a crash of the machine
+        :type sync: bool
+        """
+        with self.lock:
+            self._flush(sync)
+
+    def close(self):
+        """ Flush, fsync and close every file, and stop the flush thread """
+        # the flush thread is not joined, close can be called from a signal handler holding the lock
+        self.closed.set()
+        self.flush_thread = None
+        with self.lock:
+            self._flush(sync=True)
+            for csv_file in self.files.values():
+                csv_file.close()
+            self.files.clear()
+            self.writers.clear()
+
+    def _open(self, path, header_features):
+        """ Open the csv file of a measurement for appending, and write the header if the file is new """
+        if not self.files:
+            os.makedirs(self.directory, exist_ok=True)
+        file_path = os.path.join(self.directory, path)
+        file_exists = os.path.isfile(file_path)
+        csv_file = open(file_path, "a", newline="")
+        writer = csv.writer(csv_file, delimiter=",")
+        if not file_exists:
+            writer.writerow(['time', 'value'] + header_features)
+        self.files[path] = csv_file
+        self.writers[path] = writer
+        self._start_flush_thread()
+        return writer
+
+    def _flush(self, sync=False):
+        for csv_file in self.files.values():
+            csv_file.flush()
+            if sync:
+                os.fsync(csv_file.fileno())
+        self.unflushed_rows = 0
+
+    def _start_flush_thread(self):
+        if self.flush_thread is None and self.flush_interval > 0:
+            self.closed = threading.Event()
+            self.flush_thread = threading.Thread(target=self._flush_periodically, args=(self.closed,), daemon=True)
+            self.flush_thread.start()
+
+    def _flush_periodically(self, closed):
+        while not closed.wait(self.flush_interval):
+            if self.unflushed_rows:
+                self.flush()
@@ -0,0 +1,41 @@
+"""
+Print or export the measurements of a session recorded in the session store
+
+    python export_session.py crunch/sessions/<session> [--start 0] [--end 60] [--csv out_dir]
+"""
+import argparse
+import csv
+import os
+
+from crunch.store import SessionReader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print or export the measurements of a recorded session")
+    parser.add_argument("session", help="path to the session directory")
+    parser.add_argument("--start", type=float, help="seconds from the start of the session")
+    parser.add_argument("--end", type=float, help="seconds from the start of the session")
+    parser.add_argument("--csv", help="export the measurements as csv files to this directory")
+    args = parser.parse_args()
+
+    session = SessionReader(args.session)
+    names = session.measurements()
+    start_times = [session.reader(name).start_time() for name in names]
+    session_start = min((start_time for start_time in start_times if start_time is not None), default=0)
+    start = None if args.start is None else session_start + args.start
+    end = None if args.end is None else session_start + args.end
+
+    for name in names:
+        columns = session.read(name, start, end)
+        if args.csv is not None:
+            os.makedirs(args.csv, exist_ok=True)
+            with open(os.path.join(args.csv, name + ".csv"), "w", newline="") as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(list(columns))
+                writer.writerows(zip(*columns.values()))
+        else:
+            print(f"{name}: {len(columns['time'])} records")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,16 @@
 import argparse
+import signal
+import sys
+
+from crunch import start_processes, util
+from crunch.websocket import start_websocket
+
+
+def signal_handler(sig, frame):
+    """ Flush and close the csv files on ctrl+c, the device processes do the same for their own files """
+    util.close_csv()
+    sys.exit(0)
 
-from crunch import start_processes
 
 if __name__ == '__main__':
     # read system arguments
@@ -9,6 +19,10 @@ if __name__ == '__main__':
                         help='Set the environment to be static, default is mobile')
     parser.add_argument('--mobile', action='store_true',
                         help='Set the environment to be mobile, default is mobile (this argument is redundant)')
+    parser.add_argument('--replay', metavar='SESSION',
+                        help='Replay a recorded session from crunch/sessions to the frontend, instead of the devices')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='How many times faster than real time a session is replayed')
     args = vars(parser.parse_args())
 
     # Determine whether it is a mobile or static setup
@@ -17,15 +31,10 @@ if __name__ == '__main__':
     else:
         mobile = True
 
-    # start program
-    start_processes(mobile)
+    signal.signal(signal.SIGINT, signal_handler)
 
-"""
-Use this to move csv to different folder on exit
-def signal_handler(sig, frame):
-    print('You pressed Ctrl+C!')
-    sys.exit(0)
-
-import sys
-signal.signal(signal.SIGINT, signal_handler)
-"""
+    # start program
+    if args['replay']:
+        start_websocket(session_path=args['replay'], speed=args['speed'])
+    else:
+        start_processes(mobile)
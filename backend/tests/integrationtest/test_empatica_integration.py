@@ -11,7 +11,8 @@ class MockAPI:
     Mock api that reads from csv files instead of getting data from devices
     """
 
-    subscribers = {"EDA": [], "IBI": [], "TEMP": [], "HR": []}
+    def __init__(self, device_id=None):
+        self.subscribers = {"EDA": [], "IBI": [], "TEMP": [], "HR": [], "BVP": [], "ACC": []}
 
     def add_subscriber(self, data_handler, requested_data):
         """
@@ -28,7 +29,7 @@ class MockAPI:
     def connect(self):
         """ Simulates connecting to the device, starts reading from csv files and push data to handlers """
         for i in range(1000):
-            for name in self.subscribers:
+            for name in ["EDA", "IBI", "TEMP", "HR"]:
                 self._mock_datapoint(i, name)
 
     def _mock_datapoint(self, index, name):
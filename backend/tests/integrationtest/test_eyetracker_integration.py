@@ -14,6 +14,7 @@ class MockAPI:
     data = pd.read_csv(os.path.join(dirname, "../mock_data/eyetracker.csv"))
     raw_data = {"fixation": ["initTime", "endTime", "fx", "fy"], "gaze": ["lpup", "rpup"]}
     subscribers = {"fixation": [], "gaze": []}
+    frequency = 120
 
     def add_subscriber(self, data_handler, requested_data):
         """
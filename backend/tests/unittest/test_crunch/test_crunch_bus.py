@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+import crunch.util as util
+from crunch import bus
+
+
+@pytest.fixture
+def measurement_bus(tmp_path, monkeypatch):
+    """ Install a bus in this process, and write csv files to a temporary folder """
+    monkeypatch.chdir(tmp_path)
+    measurement_bus = bus.MeasurementBus()
+    yield measurement_bus
+    bus.install(None)
+
+
+def test_publish_to_bus(measurement_bus):
+    """ Test that published measurements are read back from the bus in order """
+    bus.install(measurement_bus, write_csv=False)
+    for i in range(5):
+        util.publish("arousal.csv", [float(i)])
+
+    for i in range(5):
+        name, timestamp, value = measurement_bus.get(timeout=1)
+        assert name == "arousal" and value == float(i) and timestamp > 0
+    assert measurement_bus.get(timeout=0.01) is None
+    assert not os.path.exists("crunch/output/arousal.csv")
+
+
+@pytest.mark.parametrize('write_csv', [True, False])
+def test_csv_side_sink(measurement_bus, write_csv):
+    """ Test that the csv file is only written when enabled """
+    bus.install(measurement_bus, write_csv=write_csv)
+    util.publish("stress.csv", [1.0])
+
+    assert measurement_bus.get(timeout=1)[0] == "stress"
+    assert os.path.exists("crunch/output/stress.csv") == write_csv
+
+
+def test_full_bus_drops(measurement_bus):
+    """ Test that publishing to a full bus never blocks """
+    small_bus = bus.MeasurementBus(maxsize=1)
+    assert small_bus.publish("arousal", 0, 1.0)
+    assert not small_bus.publish("arousal", 0, 2.0)
@@ -0,0 +1,118 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from crunch.empatica.handler import DataHandler as EmpaticaDataHandler
+from crunch.empatica.measurements import compute_arousal
+from crunch.eyetracker.handler import ThresholdDataHandler
+from crunch.handler import BaseDataHandler, DataHandler, WindowGroup, subscribe
+
+
+@pytest.mark.parametrize('window, step', [(3, 1), (3, 3), (4, 2), (5, 7)])
+def test_windows(window, step):
+    """ Test that the measurement function receives every full window, every window_step data points """
+    windows = []
+    handler = DataHandler(measurement_func=lambda data: windows.append(data.tolist()) or 1,
+                          window_length=window, window_step=step, calculate_baseline=False)
+    for i in range(30):
+        handler.add_data_point(i)
+    assert windows == [list(range(end - window, end)) for end in range(step, 31, step) if end >= window]
+
+
+def test_dictionary_and_array_data_points():
+    """ Test that dictionary data points give a window per key, and array data points keep their shape """
+    received = {}
+
+    def measurement(lpup, rpup, joints):
+        received.update(lpup=lpup.copy(), rpup=rpup.copy(), joints=joints)
+        return 1
+
+    gaze = DataHandler(measurement_func=lambda lpup, rpup: measurement(lpup, rpup, None),
+                       subscribed_to=["lpup", "rpup"], window_length=2, window_step=2, calculate_baseline=False)
+    for i in range(4):
+        gaze.add_data_point({"lpup": i, "rpup": -i})
+    assert received["lpup"].tolist() == [2, 3] and received["rpup"].tolist() == [-2, -3]
+
+    body = DataHandler(measurement_func=lambda pos: measurement(received["lpup"], received["rpup"], pos.copy()),
+                       window_length=2, window_step=2, calculate_baseline=False)
+    frames = [[(i, j) for j in range(25)] for i in range(2)]
+    for frame in frames:
+        body.add_data_point(frame)
+    assert np.array_equal(received["joints"], np.array(frames))
+
+
+def test_gate():
+    """ Test that the windows the gate holds back are counted and not measured """
+    windows = []
+    handler = DataHandler(measurement_func=lambda data: windows.append(data.tolist()) or 1,
+                          window_length=2, window_step=2, calculate_baseline=False,
+                          gate=lambda handler: handler.data_counter % 4 != 0)
+    for i in range(8):
+        handler.add_data_point(i)
+    assert windows == [[0, 1], [4, 5]]
+    assert handler.gated_windows == 2
+
+
+def test_window_groups():
+    """ Test that handlers with identical windows share one ring buffer, and measure the same windows """
+    windows = {"first": [], "second": []}
+    first = DataHandler(measurement_func=lambda data: windows["first"].append(data.tolist()) or 1,
+                        window_length=4, window_step=2, calculate_baseline=False)
+    second = DataHandler(measurement_func=lambda data: windows["second"].append(data.tolist()) or 1,
+                         window_length=4, window_step=2, calculate_baseline=False)
+    other_step = DataHandler(measurement_func=lambda data: 1, window_length=4, window_step=3,
+                             calculate_baseline=False)
+    # the empatica handlers have a different sample shape than the generic handlers
+    arousal = [EmpaticaDataHandler(measurement_func=compute_arousal, window_length=4, window_step=2,
+                                   baseline_length=100) for _ in range(2)]
+    subscribers = []
+    for handler in [first, other_step, arousal[0], second, arousal[1]]:
+        subscribe(subscribers, handler)
+
+    assert len(subscribers) == 3 and subscribers[1] is other_step
+    assert subscribers[0].handlers == [first, second] and subscribers[2].handlers == arousal
+    assert first.buffers is second.buffers and arousal[0].streams == [arousal[0].stream, arousal[1].stream]
+
+    for i in range(20):
+        for subscriber in subscribers:
+            subscriber.add_data_point(float(i % 7))
+    assert windows["first"] == windows["second"]
+    assert windows["first"] == [[float(j % 7) for j in range(end - 4, end)] for end in range(4, 21, 2)]
+    assert arousal[0].baseline == arousal[1].baseline and len(arousal[0].baseline[0]) == 9
+
+
+def test_threshold_handlers_are_not_grouped():
+    """ Test that a handler that does not store every data point keeps its own ring buffers """
+    threshold = ThresholdDataHandler(measurement_func=lambda **kwargs: 1, subscribed_to=["initTime"],
+                                     window_length=4, window_step=2, baseline_length=1, threshold_length=1)
+    fixation = DataHandler(measurement_func=lambda initTime: 1, subscribed_to=["initTime"],
+                           window_length=4, window_step=2)
+    subscribers = []
+    subscribe(subscribers, threshold)
+    subscribe(subscribers, fixation)
+    assert subscribers == [threshold, fixation]
+
+
+def test_window_group_streams():
+    """ Test that the stream of a grouped handler is updated by the handler storing the data points """
+    batch = DataHandler(measurement_func=lambda data: float(np.sum(np.maximum(np.diff(data), 0))),
+                        window_length=5, window_step=1, calculate_baseline=False)
+    streamed = DataHandler(measurement_func=compute_arousal, window_length=5, window_step=1,
+                           calculate_baseline=False)
+    group = WindowGroup([batch, streamed])
+    assert streamed.stream is not None and batch.streams == [streamed.stream]
+    published = []
+    with patch("crunch.util.publish", lambda path, row: published.append(row[0])):
+        for i in range(30):
+            group.add_data_point(float(i * i % 11))
+    assert published[0::2] == pytest.approx(published[1::2])
+
+
+def test_base_data_handler_is_abstract():
+    """ Test that a handler without process_data_point fails when it is created, not at the first data point """
+    class WithoutProcessing(BaseDataHandler):
+        pass
+
+    with pytest.raises(TypeError):
+        WithoutProcessing(measurement_func=len, window_length=1, window_step=1)
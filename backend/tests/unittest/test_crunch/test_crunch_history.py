@@ -0,0 +1,49 @@
+import pytest
+
+from crunch.websocket import history as history_module
+from crunch.websocket.history import History
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ A monotonic clock the test moves forward """
+    now = [1000.0]
+    monkeypatch.setattr(history_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def message(seq, name):
+    return (seq, name, f"{name}:{seq}")
+
+
+def test_since_seq_merges_measurements(clock):
+    """ Test that the messages after a sequence number are returned in order, across measurements """
+    history = History(seconds=60)
+    for seq, name in enumerate(["arousal", "stress", "stress", "arousal", "engagement"], start=1):
+        history.append(message(seq, name))
+    assert [seq for seq, _, _ in history.since_seq(2)] == [3, 4, 5]
+    assert [seq for seq, _, _ in history.since_seq(0)] == [1, 2, 3, 4, 5]
+    assert history.since_seq(5) == []
+
+
+def test_expired_messages_are_dropped(clock):
+    """ Test that messages older than the history are dropped, also of measurements no longer sent """
+    history = History(seconds=10)
+    seq = 0
+    for _ in range(20):
+        seq += 1
+        history.append(message(seq, "arousal"))
+        seq += 1
+        history.append(message(seq, "stress" if seq < 20 else "engagement"))
+        clock[0] += 1
+    assert [seq for seq, _, _ in history.since_seq(0)] == list(range(21, 41))
+    assert [seq for seq, _, _ in history.last(3)] == list(range(35, 41))
+    assert "stress" not in history.measurements
+    # the ring is compacted, so it does not grow with the length of the session
+    assert len(history.measurements["arousal"].seqs) < 20
+
+
+def test_no_history(clock):
+    history = History(seconds=0)
+    history.append(message(1, "arousal"))
+    assert history.since_seq(0) == [] and history.last(10) == []
@@ -0,0 +1,255 @@
+import asyncio
+import functools
+import json
+import time
+
+import pytest
+import websockets
+
+from crunch.websocket.encoding import (BinaryEncoder, JsonEncoder,
+                                       decode_binary_frame)
+from crunch.websocket.hub import (COALESCE, DISCONNECT, DROP_OLDEST,
+                                  BroadcastHub)
+from crunch.websocket.websocket import handler, parse_requests
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def decode(message):
+    return json.loads(message[2])
+
+
+def test_broadcast():
+    """ Test that every client receives every message """
+    async def scenario():
+        hub = BroadcastHub(buffer_size=10)
+        clients = [hub.register() for _ in range(3)]
+        for i in range(5):
+            hub.publish("arousal", 0, i)
+        received = []
+        for client in clients:
+            received.append([decode(await client.get())["value"] for _ in range(5)])
+        return received
+
+    assert run(scenario()) == [list(range(5))] * 3
+
+
+@pytest.mark.parametrize('policy, expected', [
+    (DROP_OLDEST, [("stress", 2), ("stress", 3), ("arousal", 4)]),
+    (COALESCE, [("arousal", 0), ("stress", 3), ("arousal", 4)]),
+])
+def test_slow_consumer_policy(policy, expected):
+    """ Test that a full buffer drops or coalesces messages, without affecting a fast client """
+    async def scenario():
+        hub = BroadcastHub(buffer_size=3, policy=policy)
+        slow, fast = hub.register(), hub.register()
+        received = []
+        for i, name in enumerate(["arousal", "stress", "stress", "stress", "arousal"]):
+            hub.publish(name, 0, i)
+            received.append(decode(await fast.get())["value"])
+        slow_received = [(data["name"], data["value"]) for data in map(decode, await slow.get_batch())]
+        return received, slow_received
+
+    received, slow_received = run(scenario())
+    assert received == list(range(5))
+    assert slow_received == expected
+
+
+def test_disconnect_policy():
+    """ Test that a client is disconnected and unregistered when its buffer overflows """
+    async def scenario():
+        hub = BroadcastHub(buffer_size=2, policy=DISCONNECT)
+        client = hub.register()
+        for i in range(3):
+            hub.publish("arousal", 0, i)
+        return hub, await client.get()
+
+    hub, data = run(scenario())
+    assert data is None and not hub.clients
+
+
+def test_disconnect_subscribed():
+    """ Test that the handler can unregister a subscribed client the disconnect policy already unregistered """
+    errors = []
+
+    async def recorded_handler(websocket, path, hub):
+        try:
+            await handler(websocket, path, hub=hub, tick=0.01)
+        except Exception as error:
+            errors.append(error)
+            raise
+
+    async def scenario():
+        hub = BroadcastHub(buffer_size=2, policy=DISCONNECT)
+        server = await websockets.serve(functools.partial(recorded_handler, hub=hub), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with websockets.connect(f"ws://127.0.0.1:{port}/?subscribe=arousal") as websocket:
+            await asyncio.sleep(0.05)
+            for i in range(3):
+                hub.publish("arousal", 0, i)
+            await websocket.wait_closed()
+        server.close()
+        await server.wait_closed()
+        return hub, websocket.close_code
+
+    hub, close_code = run(scenario())
+    assert close_code == 1008 and not errors
+    assert not hub.clients and not hub.subscribers
+
+
+def test_unregister_twice():
+    hub = BroadcastHub()
+    client = hub.register()
+    hub.subscribe(client, ["arousal"])
+    hub.unregister(client)
+    hub.unregister(client)
+    assert not hub.clients and not hub.subscribers and client.subscriptions is None
+
+
+def test_rate_limit():
+    """ Test that a rate limited measurement only sends the latest value once the rate allows it """
+    async def scenario():
+        hub = BroadcastHub(rate_limits={"cognitive_load": 20})
+        client = hub.register()
+        for i in range(5):
+            hub.publish("cognitive_load", 0, i)
+            hub.publish("arousal", 0, i)
+        first = [(data["name"], data["value"]) for data in map(decode, await client.get_batch())]
+        hub.tick()
+        assert not client.messages
+        await asyncio.sleep(0.06)
+        hub.tick()
+        return first, [(data["name"], data["value"]) for data in map(decode, await client.get_batch())]
+
+    first, second = run(scenario())
+    assert first == [("cognitive_load", 0)] + [("arousal", i) for i in range(5)]
+    assert second == [("cognitive_load", 4)]
+
+
+def test_resume():
+    """ Test that a reconnecting client gets the measurements it missed once, before the new ones """
+    async def scenario():
+        hub = BroadcastHub(buffer_size=10)
+        for i in range(5):
+            hub.publish("arousal" if i % 2 else "stress", 0, i)
+        client = hub.register()
+        hub.publish("arousal", 0, 5)
+        hub.resume(client, since=2)
+        hub.publish("stress", 0, 6)
+        resumed = [message[0] for message in await client.get_batch()]
+        late = hub.register()
+        hub.resume(late, since=100)
+        restarted = [message[0] for message in await late.get_batch()]
+        recent = hub.register()
+        hub.resume(recent, seconds=60)
+        return resumed, restarted, len(await recent.get_batch())
+
+    resumed, restarted, recent = run(scenario())
+    assert resumed == [3, 4, 5, 6, 7]
+    # a sequence number the server has not reached yet is from before a restart
+    assert restarted == list(range(1, 8))
+    assert recent == 7
+
+
+def test_subscriptions():
+    """ Test that subscribed clients only receive their measurements, and others receive everything """
+    async def scenario():
+        hub = BroadcastHub(buffer_size=10)
+        everything, single, unsubscribed = hub.register(), hub.register(), hub.register()
+        hub.publish("stress", 0, 0)
+        hub.publish("engagement", 0, 1)
+        hub.subscribe(single, ["arousal"])
+        hub.unsubscribe(unsubscribed, ["stress"])
+        for i, name in enumerate(["arousal", "stress", "engagement", "arousal"], start=2):
+            hub.publish(name, 0, i)
+        received = [[decode(message)["value"] for message in await client.get_batch()]
+                    for client in (everything, single, unsubscribed)]
+        assert set(hub.subscribers) == {"arousal"}
+        hub.unregister(single)
+        hub.unregister(unsubscribed)
+        return hub, received
+
+    hub, received = run(scenario())
+    assert received == [list(range(6)), [2, 5], [1, 2, 4, 5]]
+    assert not hub.subscribers and hub.everything == hub.clients
+
+
+def test_resume_subscribed():
+    """ Test that the history a subscribed client resumes is only of its measurements """
+    async def scenario():
+        hub = BroadcastHub(buffer_size=10)
+        for i, name in enumerate(["arousal", "stress", "engagement", "arousal"]):
+            hub.publish(name, 0, i)
+        client = hub.register()
+        hub.subscribe(client, ["arousal", "stress"])
+        hub.resume(client, since=0)
+        return [decode(message)["value"] for message in await client.get_batch()]
+
+    assert run(scenario()) == [0, 1, 3]
+
+
+@pytest.mark.parametrize('request_, expected', [
+    ('/?since=12', [("resume", {"since": 12})]),
+    ('/?seconds=30', [("resume", {"seconds": 30.0})]),
+    ('/?since=3&subscribe=arousal,stress',
+     [("subscribe", {"names": ["arousal", "stress"]}), ("resume", {"since": 3})]),
+    ('/', []),
+    ('{"type": "resume", "since": 4}', [("resume", {"since": 4})]),
+    ('{"type": "replay", "seconds": 2.5}', [("resume", {"seconds": 2.5})]),
+    ('{"type": "subscribe", "measurements": ["arousal"]}', [("subscribe", {"names": ["arousal"]})]),
+    ('{"type": "unsubscribe", "measurements": ["stress"]}', [("unsubscribe", {"names": ["stress"]})]),
+    ('{"type": "subscribe", "measurements": "arousal"}', []),
+    ('{"type": "resume"}', []),
+    ('{"type": "replay", "seconds": "many"}', []),
+    ('{not json', []),
+])
+def test_parse_requests(request_, expected):
+    assert parse_requests(request_) == expected
+
+
+def test_handler_requests():
+    """ Test that the requests a client makes on connect, and later, are served over the websocket """
+    async def scenario():
+        hub = BroadcastHub()
+        for i in range(5):
+            hub.publish("arousal", 0, i)
+        server = await websockets.serve(functools.partial(handler, hub=hub, tick=0.01), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with websockets.connect(f"ws://127.0.0.1:{port}/?since=3") as websocket:
+            connected = [m["seq"] for m in json.loads(await websocket.recv())]
+            await websocket.send(json.dumps({"type": "replay", "seconds": 60}))
+            replayed = [m["seq"] for m in json.loads(await websocket.recv())]
+            await websocket.send(json.dumps({"type": "subscribe", "measurements": ["stress"]}))
+            await asyncio.sleep(0.05)
+            hub.publish("arousal", 0, 5)
+            hub.publish("stress", 0, 6)
+            subscribed = [m["value"] for m in json.loads(await websocket.recv())]
+        server.close()
+        await server.wait_closed()
+        return connected, replayed, subscribed
+
+    connected, replayed, subscribed = run(scenario())
+    assert connected == [4, 5]
+    assert replayed == [1, 2, 3, 4, 5]
+    assert subscribed == [6]
+
+
+@pytest.mark.parametrize('encoder', [JsonEncoder(), BinaryEncoder()])
+def test_encoding(encoder):
+    """ Test that a frame holds every measurement, numeric and textual """
+    now = time.time()
+    frame = encoder.frame([encoder.fragment(1, "arousal", now, 1.25), encoder.fragment(2, "anticipation", now, "low")])
+    if isinstance(encoder, JsonEncoder):
+        measurements = json.loads(frame)
+        assert measurements[0]["time"] == time.strftime("%H:%M:%S", time.localtime(int(now)))
+    else:
+        measurements = decode_binary_frame(frame)
+        assert measurements[0]["time"] == now
+    expected = [(1, "arousal", 1.25), (2, "anticipation", "low")]
+    assert [(m["seq"], m["name"], m["value"]) for m in measurements] == expected
@@ -0,0 +1,136 @@
+import time
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from crunch import offload
+from crunch.empatica.handler import DataHandler as EmpaticaDataHandler
+from crunch.handler import DataHandler
+
+
+def slow_first(window):
+    """ Measurement function that takes longer for the early windows, so they complete last """
+    time.sleep(0.2 / (1 + window[0]))
+    return float(window[-1])
+
+
+def pupil_sum(lpup, rpup, scale=1):
+    assert not lpup.flags.writeable
+    return float(np.sum(lpup) + np.sum(rpup)) * scale
+
+
+def fails(window):
+    raise ValueError("measurement failed")
+
+
+@pytest.fixture
+def pool():
+    """ A pool of several workers, so the windows can complete out of order """
+    yield offload.start(3)
+    offload.shutdown()
+
+
+@pytest.mark.parametrize('shared_memory', ["True", "False"])
+def test_submit(pool, shared_memory):
+    """ Test that the pool measures the windows, passed in shared memory or pickled """
+    windows = {"lpup": np.arange(4.0), "rpup": np.ones(4)}
+    with patch("crunch.offload.util.config", lambda section, key: shared_memory):
+        future = offload.submit(pupil_sum, windows, {"scale": 2})
+    windows["lpup"][:] = 100
+    assert future.result() == 20.0
+
+
+def test_offloaded_measurements_in_window_order(pool):
+    """ Test that an offloaded handler publishes the measurements in window order """
+    published = []
+    handler = DataHandler(measurement_func=slow_first, window_length=2, window_step=1,
+                          calculate_baseline=False, offload=True)
+    with patch("crunch.util.publish", lambda path, row: published.append(row[0])):
+        for i in range(8):
+            handler.add_data_point(i)
+        handler.collect(wait=True)
+    assert published == [float(i) for i in range(1, 8)]
+    assert not handler.pending
+
+
+def test_offloaded_handler_waits_when_behind(pool):
+    """ Test that a handler never has more than max_pending windows in the pool """
+    handler = DataHandler(measurement_func=slow_first, window_length=1, window_step=1,
+                          calculate_baseline=False, offload=True)
+    with patch("crunch.util.publish", lambda path, row: None):
+        for i in range(handler.max_pending * 2):
+            handler.add_data_point(i)
+            assert len(handler.pending) <= handler.max_pending
+
+
+def test_offloaded_errors(pool):
+    """ Test that an error in an offloaded measurement is raised in the handler """
+    handler = DataHandler(measurement_func=fails, window_length=1, window_step=1,
+                          calculate_baseline=False, offload=True)
+    handler.add_data_point(1)
+    with pytest.raises(ValueError):
+        handler.collect(wait=True)
+
+
+def test_offloaded_empatica_handler(pool):
+    """ Test that an offloaded empatica handler publishes the same rows as an inline one """
+    rows = {True: [], False: []}
+    data = np.random.default_rng(3).uniform(0, 5, 60).tolist()
+    for offloaded in (False, True):
+        handler = EmpaticaDataHandler(measurement_func=slow_first, window_length=4, window_step=2,
+                                      baseline_length=12, offload=offloaded)
+        with patch("crunch.util.publish", lambda path, row, **kwargs: rows[offloaded].append(row)):
+            for datapoint in data:
+                handler.add_data_point(datapoint)
+            handler.collect(wait=True)
+    assert rows[True] == rows[False] and len(rows[True]) == 24
+
+
+def test_shared_windows_reused(pool):
+    """ Test that the shared memory of an offloaded handler is reused from window to window """
+    published = []
+    handler = DataHandler(measurement_func=pupil_sum, subscribed_to=["lpup", "rpup"], sample_shape=(),
+                          window_length=4, window_step=1, calculate_baseline=False, offload=True)
+    with patch("crunch.util.publish", lambda path, row: published.append(row[0])):
+        for i in range(100):
+            handler.add_data_point({"lpup": i, "rpup": 1})
+        handler.collect(wait=True)
+    assert published == [float(4 * i + 6 + 4) for i in range(97)]
+    # a segment per key of every window being measured at once
+    assert handler.shared_windows.created <= 2 * (handler.max_pending + 1)
+
+    offload.shutdown()
+    assert handler.shared_windows.closed and not handler.shared_windows.free
+
+
+def test_pickled_without_shared_memory():
+    """ Test that the windows are pickled when shared memory is not available, before Python 3.8 """
+    published = []
+    with patch.dict("sys.modules", {"multiprocessing.shared_memory": None}):
+        assert not offload.uses_shared_memory()
+        offload.start(2)
+        try:
+            handler = DataHandler(measurement_func=pupil_sum, subscribed_to=["lpup", "rpup"], sample_shape=(),
+                                  window_length=4, window_step=1, calculate_baseline=False, offload=True)
+            with patch("crunch.util.publish", lambda path, row: published.append(row[0])):
+                for i in range(10):
+                    handler.add_data_point({"lpup": i, "rpup": 1})
+                handler.collect(wait=True)
+        finally:
+            offload.shutdown()
+    assert published == [float(4 * i + 6 + 4) for i in range(7)]
+    assert handler.shared_windows.created == 0
+
+
+def test_workers_split_between_devices():
+    """ Test that the cores are split between the pools of the device processes, unless configured """
+    with patch("crunch.offload.os.cpu_count", lambda: 8):
+        offload.configure(3)
+        try:
+            with patch("crunch.offload.util.config", lambda section, key: "0"):
+                assert offload.workers() == 2
+            with patch("crunch.offload.util.config", lambda section, key: "5"):
+                assert offload.workers() == 5
+        finally:
+            offload.configure(1)
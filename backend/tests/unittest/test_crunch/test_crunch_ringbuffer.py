@@ -0,0 +1,54 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+from crunch.ringbuffer import RingBuffer
+
+
+@pytest.mark.parametrize('capacity, appended', [(1, 5), (4, 2), (4, 4), (4, 11), (7, 100)])
+def test_view_is_latest_samples(capacity, appended):
+    """ Test that the view always holds the latest samples in order, like a deque with maxlen """
+    buffer = RingBuffer(capacity)
+    reference = deque(maxlen=capacity)
+    for i in range(appended):
+        buffer.append(i)
+        reference.append(i)
+        assert buffer.view().tolist() == list(reference)
+        assert len(buffer) == len(reference)
+    assert buffer.view(2).tolist() == list(reference)[-2:]
+
+
+def test_view_is_zero_copy_and_read_only():
+    buffer = RingBuffer(3)
+    for i in range(5):
+        buffer.append(i)
+    window = buffer.view()
+    assert np.shares_memory(window, buffer.data)
+    with pytest.raises(ValueError):
+        window[0] = 1
+
+
+def test_fixed_shape_samples():
+    """ Test that array samples, like the joints of a skeleton, take the shape of the first sample """
+    buffer = RingBuffer(2)
+    joints = [[(i, j) for j in range(25)] for i in range(3)]
+    for sample in joints:
+        buffer.append(sample)
+    assert buffer.view().shape == (2, 25, 2)
+    assert np.array_equal(buffer.view(), np.array(joints[1:], dtype=float))
+
+
+@pytest.mark.parametrize('blocks', [[3], [2, 2, 2], [1, 9], [10, 1, 4]])
+def test_extend(blocks):
+    """ Test that appending blocks of samples equals appending them one by one """
+    buffer, reference = RingBuffer(4), RingBuffer(4)
+    start = 0
+    for size in blocks:
+        block = np.arange(start, start + size)
+        start += size
+        buffer.extend(block)
+        for sample in block:
+            reference.append(sample)
+        assert buffer.view().tolist() == reference.view().tolist()
+    assert buffer.count == reference.count
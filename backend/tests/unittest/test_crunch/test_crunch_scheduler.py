@@ -0,0 +1,134 @@
+import pytest
+
+from crunch import scheduler
+from crunch.empatica.api import EmpaticaAPI
+from crunch.eyetracker.api import EyetrackerAPI
+from crunch.handler import DataHandler
+from crunch.skeleton.api import SkeletonAPI
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """ Installs a scheduler with a fake clock for the handlers created in the test """
+    clock = FakeClock()
+    previous = scheduler.current()
+    clock.scheduler = scheduler.Scheduler(budget=1.0, max_load=0.5, max_stride=4, interval=1.0,
+                                          report_interval=5.0, clock=clock)
+    scheduler.install(clock.scheduler)
+    yield clock
+    scheduler.install(previous)
+
+
+def counting_handler(measured, priority=scheduler.NORMAL, window_length=1, window_step=1, cost=0.0, clock=None):
+    """ Handler recording the last data point of every window it measures, taking cost seconds per window """
+    def measurement(window):
+        if clock is not None:
+            clock.now += cost
+        measured.append(window[-1])
+        return 1.0
+    return DataHandler(measurement_func=measurement, window_length=window_length, window_step=window_step,
+                       calculate_baseline=False, priority=priority)
+
+
+def test_stale_windows_are_coalesced(clock):
+    """ Test that a stale window is skipped when a newer window is queued, and the newest is measured """
+    measured = []
+    handler = counting_handler(measured, window_length=10, window_step=10)
+    for i in range(100):
+        clock.scheduler.arrived(0.0, backlog=99 - i)
+        clock.now = 5.0
+        handler.add_data_point(i)
+    assert measured == [99]
+    assert clock.scheduler.stats()["shed"] == {"measurement": {"coalesced": 9, "widened": 0}}
+
+
+def test_stale_windows_without_backlog_are_measured(clock):
+    """ Test that a late window is measured when no newer window is queued """
+    measured = []
+    handler = counting_handler(measured)
+    for i in range(5):
+        clock.scheduler.arrived(clock.now - 10, backlog=0)
+        handler.add_data_point(i)
+    assert measured == [0, 1, 2, 3, 4]
+
+
+def test_low_priority_windows_are_widened_under_load(clock):
+    """ Test that the window step of a LOW priority handler widens while the process is overloaded """
+    measured, high = [], []
+    low_handler = counting_handler(measured, priority=scheduler.LOW, cost=0.2, clock=clock)
+    high_handler = counting_handler(high, priority=scheduler.HIGH)
+    for i in range(40):
+        clock.now += 0.1
+        low_handler.add_data_point(i)
+        high_handler.add_data_point(i)
+    assert low_handler.stride == 4
+    assert len(high) == 40 and len(measured) < 40
+    assert clock.scheduler.stats()["shed"]["measurement"]["widened"] == 40 - len(measured)
+
+    # the step narrows again once the measurements are cheap
+    measured.clear()
+    low_handler.measurement_func = lambda window: measured.append(window[-1]) or 1.0
+    for i in range(40):
+        clock.now += 0.1
+        low_handler.add_data_point(i)
+    assert low_handler.stride == 1
+    assert measured[-3:] == [37, 38, 39]
+
+
+def test_shed_windows_are_reported(clock, capsys):
+    measured = []
+    handler = counting_handler(measured, window_length=2, window_step=2)
+    for i in range(6):
+        clock.scheduler.arrived(0.0, backlog=10)
+        clock.now += 2.0
+        handler.add_data_point(i)
+    assert "Shed measurement windows" in capsys.readouterr().out
+
+
+def test_eyetracker_backlog_is_coalesced(clock):
+    """ Test that the eyetracker reports its backlog, so a stale queue of gaze samples is measured once """
+    measured = []
+    handler = DataHandler(measurement_func=lambda lpup, rpup: measured.append(lpup[-1]) or 1.0,
+                          subscribed_to=["lpup", "rpup"], window_length=10, window_step=10, calculate_baseline=False)
+    api = EyetrackerAPI()
+    api.subscribers = {"gaze": [handler], "fixation": []}
+    for i in range(100):
+        api.gaze_data_callback({'device_time_stamp': i * 8333, 'left_pupil_diameter': float(i),
+                                'right_pupil_diameter': float(i), 'left_gaze_point_on_display_area': (0.5, 0.5),
+                                'right_gaze_point_on_display_area': (0.5, 0.5)})
+    clock.now = 5.0
+    api.process_pending()
+    assert measured == [99.0]
+
+
+def test_empatica_backlog_is_coalesced(clock):
+    """ Test that the empatica api reports the samples received after a sample, so stale windows are coalesced """
+    measured = []
+    api = EmpaticaAPI()
+    api.add_subscriber(counting_handler(measured, window_length=10, window_step=10, cost=2.0, clock=clock), "EDA")
+    api._feed(b"".join(b"E4_Gsr 1600000000.0 %d\n" % i for i in range(100)))
+    # the first window is measured in time, the next are stale with newer windows received, except the last
+    assert measured == [9.0, 99.0]
+    assert clock.scheduler.stats()["shed"] == {"measurement": {"coalesced": 8, "widened": 0}}
+
+
+def test_skeleton_backlog_is_coalesced(clock):
+    """ Test that the skeleton api reports the queued frames, so a stale queue of frames is measured once """
+    measured = []
+    api = SkeletonAPI()
+    api.subscribers = {"body": [DataHandler(measurement_func=lambda window: measured.append(window[-1, 0, 0]) or 1.0,
+                                            sample_shape=(25, 2), window_length=10, window_step=10,
+                                            calculate_baseline=False)]}
+    for i in range(100):
+        api.add_datapoint([type("Datum", (), {"poseKeypoints": [[(i + 1, 1.0)] * 25]})])
+    clock.now = 5.0
+    api.process_pending()
+    assert measured == [100.0]
@@ -0,0 +1,65 @@
+import threading
+
+import numpy as np
+import pytest
+
+from crunch.spsc import SpscRing
+
+
+@pytest.mark.parametrize('capacity, block', [(4, None), (4, 3), (7, 2), (100, None)])
+def test_spsc_ring_order(capacity, block):
+    """ Test that the records are popped in the order they were pushed, across the end of the ring """
+    ring = SpscRing(capacity, 2)
+    popped = []
+    for i in range(50):
+        assert ring.push((i, -i))
+        if i % 3 == 2:
+            while len(ring):
+                popped.extend(ring.pop_block(block).tolist())
+    while len(ring):
+        popped.extend(ring.pop_block(block).tolist())
+    assert popped == [[i, -i] for i in range(50)]
+
+
+def test_spsc_ring_drops_when_full():
+    """ Test that a full ring drops and counts new records, and keeps the queued ones """
+    ring = SpscRing(3, 1)
+    assert [ring.push((i,)) for i in range(5)] == [True, True, True, False, False]
+    assert ring.stats() == {"occupancy": 3, "high_watermark": 3, "dropped": 2}
+    assert ring.pop_block().ravel().tolist() == [0, 1, 2]
+    assert len(ring.pop_block()) == 0
+    assert ring.push((5,))
+    assert ring.pop_block().ravel().tolist() == [5]
+
+
+def test_spsc_ring_block_is_a_copy():
+    """ Test that a popped block does not change when the producer reuses the slots """
+    ring = SpscRing(2, 1)
+    ring.push((1,))
+    ring.push((2,))
+    block = ring.pop_block()
+    ring.push((3,))
+    ring.push((4,))
+    assert block.ravel().tolist() == [1, 2]
+
+
+def test_spsc_ring_threads():
+    """ Test a producer and a consumer thread, every record arrives once and in order, or is counted as dropped """
+    ring = SpscRing(64, 1)
+    received = []
+    done = threading.Event()
+
+    def consume():
+        while not done.is_set() or len(ring):
+            block = ring.pop_block(16)
+            received.extend(block.ravel().tolist())
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    for i in range(20000):
+        ring.push((i,))
+    done.set()
+    consumer.join()
+
+    assert len(received) + ring.dropped == 20000
+    assert np.all(np.diff(received) > 0)
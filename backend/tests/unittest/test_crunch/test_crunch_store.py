@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pytest
+
+from crunch.store import MeasurementReader, SessionReader, SessionWriter
+
+
+@pytest.fixture
+def session_path(tmp_path):
+    return str(tmp_path / "session")
+
+
+def write_session(session_path, count, chunk_size=4):
+    session = SessionWriter(session_path, chunk_size=chunk_size)
+    for i in range(count):
+        session.write("engagement.csv", [i / 10, i, 2 * i], header_features=["amplitude", "nr of peaks"],
+                      timestamp=1000.0 + i)
+    session.close()
+
+
+@pytest.mark.parametrize('start, end', [(None, None), (1003, 1009), (1004, 1004), (990, 1001.5), (1015, 1030)])
+def test_read_time_range(session_path, start, end):
+    """ Test that a time range returns the same records as filtering every record """
+    write_session(session_path, 18)
+    columns = SessionReader(session_path).read("engagement", start, end)
+
+    times = 1000.0 + np.arange(18)
+    expected = times[(times >= (start or 0)) & (times <= (end or float("inf")))]
+    assert list(columns) == ["time", "value", "amplitude", "nr of peaks"]
+    assert np.array_equal(columns["time"], expected)
+    assert np.allclose(columns["value"], (expected - 1000) / 10)
+
+
+def test_read_new_and_reopen(session_path):
+    """ Test that new records are read once, also after the writer continues an existing session """
+    write_session(session_path, 6)
+    reader = MeasurementReader(os.path.join(session_path, "engagement"))
+    assert len(reader.read_new()["time"]) == 6
+    assert len(reader.read_new()["time"]) == 0
+
+    write_session(session_path, 5)
+    assert len(reader) == 11
+    assert np.array_equal(reader.read_new()["amplitude"], np.arange(5))
+
+
+def test_textual_values(session_path):
+    """ Test that textual measurements are returned as strings """
+    session = SessionWriter(session_path)
+    for i, value in enumerate(["low", "high", "low", "medium"]):
+        session.write("anticipation.csv", [value], timestamp=i)
+    session.close()
+
+    values = SessionReader(session_path).read("anticipation", start=1)["value"]
+    assert values.tolist() == ["high", "low", "medium"]
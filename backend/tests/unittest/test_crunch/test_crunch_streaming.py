@@ -0,0 +1,72 @@
+import os
+
+import pandas as pd
+import pytest
+
+from crunch.empatica.measurements import compute_arousal, compute_stress
+from crunch.handler import RESYNC_INTERVAL, DataHandler
+from crunch.skeleton.measurements import amount_of_motion, stability_of_motion
+from crunch.streaming import PairwiseStream
+
+MOCK_DATA = os.path.join(os.path.dirname(__file__), "../../mock_data/")
+
+
+def empatica_data(name):
+    return pd.read_csv(MOCK_DATA + name + ".csv")[name].tolist()
+
+
+def skeleton_data():
+    frames = []
+    for row in pd.read_csv(MOCK_DATA + "skeleton.csv", header=None).values.tolist():
+        frames.append([(float(row[j].strip().strip("[]()")), float(row[j + 1].strip().strip("[]()")))
+                       for j in range(0, len(row) - 1, 2)])
+    return frames
+
+
+def streamed_and_batch(measurement_func, data, window):
+    """ The measurements of every window, taken from the stream and from the measurement function """
+    streamed = DataHandler(measurement_func=measurement_func, window_length=window, window_step=1)
+    batch = DataHandler(measurement_func=measurement_func, window_length=window, window_step=1,
+                        use_streaming=False)
+    assert streamed.stream is not None and batch.stream is None
+    results = []
+    for datapoint in data:
+        streamed.append(datapoint)
+        batch.append(datapoint)
+        if streamed.window_ready():
+            results.append((streamed.measure(), batch.measure()))
+    return results
+
+
+@pytest.mark.parametrize('measurement_func, name, window', [
+    (compute_arousal, "EDA", 2),
+    (compute_arousal, "EDA", 121),
+    (compute_stress, "TEMP", 10),
+    (compute_stress, "TEMP", 200),
+])
+def test_empatica_streams(measurement_func, name, window):
+    """ Test that the streams give the same measurements as the measurement functions """
+    results = streamed_and_batch(measurement_func, empatica_data(name), window)
+    assert results
+    for streamed, batch in results:
+        assert type(streamed) == float
+        assert streamed == pytest.approx(batch, rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize('measurement_func', [amount_of_motion, stability_of_motion])
+@pytest.mark.parametrize('window', [2, 20, 150])
+def test_skeleton_streams(measurement_func, window):
+    results = streamed_and_batch(measurement_func, skeleton_data(), window)
+    assert len(results) > RESYNC_INTERVAL or window > 2
+    for streamed, batch in results:
+        assert streamed == pytest.approx(batch, rel=1e-9)
+
+
+def test_pairwise_stream_is_abstract():
+    """ Test that a stream without a term or a value fails when it is created, not at the first window """
+    class WithoutValue(PairwiseStream):
+        def term(self, previous, sample):
+            return sample - previous
+
+    with pytest.raises(TypeError):
+        WithoutValue()
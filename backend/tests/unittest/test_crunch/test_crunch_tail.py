@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from crunch.websocket.tail import TailReader
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    return str(tmp_path / "arousal.csv")
+
+
+def append(path, text):
+    with open(path, "a", newline="") as csv_file:
+        csv_file.write(text)
+
+
+def test_read_new_rows(csv_path):
+    """ Test that every appended row is read exactly once, and the header is skipped """
+    reader = TailReader()
+    append(csv_path, "time,value\r\n1.0,0.5\r\n")
+    assert reader.read_new_rows(csv_path) == [(1.0, 0.5)]
+    assert reader.read_new_rows(csv_path) == []
+
+    append(csv_path, "2.0,0.6\r\n3.0,low\r\n")
+    assert reader.read_new_rows(csv_path) == [(2.0, 0.6), (3.0, "low")]
+
+
+def test_partial_line(csv_path):
+    """ Test that a row written in two parts is only read when it is complete """
+    reader = TailReader()
+    append(csv_path, "time,value\r\n1.0,0.")
+    assert reader.read_new_rows(csv_path) == []
+
+    append(csv_path, "5\r\n")
+    assert reader.read_new_rows(csv_path) == [(1.0, 0.5)]
+
+
+def test_skip_existing_and_truncate(tmp_path, csv_path):
+    """ Test that existing history is skipped, and that a replaced file is read from the start """
+    append(csv_path, "time,value\r\n1.0,0.5\r\n")
+    reader = TailReader()
+    reader.skip_existing(str(tmp_path))
+    assert reader.read_new_rows(csv_path) == []
+
+    with open(csv_path, "w", newline="") as csv_file:
+        csv_file.write("time,value\r\n")
+    assert reader.read_new_rows(csv_path) == []
+
+    append(csv_path, "2.0,0.6\r\n")
+    assert reader.read_new_rows(csv_path) == [(2.0, 0.6)]
+
+
+@pytest.mark.parametrize('replace', ["rewrite", "recreate"])
+def test_replaced_by_longer_file(csv_path, replace):
+    """ Test that a file replaced by a file longer than the offset, before the next read, is read from the start """
+    reader = TailReader()
+    append(csv_path, "time,value\r\n1.0,0.5\r\n")
+    assert reader.read_new_rows(csv_path) == [(1.0, 0.5)]
+
+    if replace == "recreate":
+        os.remove(csv_path)
+    with open(csv_path, "w", newline="") as csv_file:
+        csv_file.write("time,value\r\n10.0,0.1\r\n11.0,0.2\r\n")
+    assert reader.read_new_rows(csv_path) == [(10.0, 0.1), (11.0, 0.2)]
+    assert reader.read_new_rows(csv_path) == []
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pipe
+
+import pytest
+
+from crunch.websocket.hub import (COALESCE, DISCONNECT, DROP_OLDEST,
+                                  BroadcastHub)
+from crunch.websocket.workers import (Aggregator, WorkerFeed,
+                                      receive_measurements)
+
+# larger than the buffer of a pipe, so a worker that does not read blocks the write
+LARGE = "x" * 100000
+
+
+def receive_all(connection):
+    """ The measurements received over the pipe until the aggregator closes it """
+    measurements = []
+    while True:
+        try:
+            measurements += pickle.loads(connection.recv_bytes())
+        except EOFError:
+            return measurements
+
+
+def test_aggregator_forwards_numbered_measurements():
+    """ Test that every worker sends the measurements with the sequence numbers of the aggregator """
+    async def scenario():
+        pipes = [Pipe(duplex=False) for _ in range(2)]
+        aggregator = Aggregator([sending for _, sending in pipes], rate_limits={"cognitive_load": 1})
+        hubs = [BroadcastHub() for _ in pipes]
+        clients = [hub.register() for hub in hubs]
+        closed = [receive_measurements(receiving, hub) for (receiving, _), hub in zip(pipes, hubs)]
+        for i in range(3):
+            aggregator.publish("arousal", 0, i)
+            aggregator.publish("cognitive_load", 0, i)
+        received = [[json.loads(message[2]) for message in await client.get_batch()] for client in clients]
+        aggregator.close()
+        await asyncio.wait_for(asyncio.gather(*closed), 1)
+        return received
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        received = loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+    expected = [(1, "arousal", 0), (2, "cognitive_load", 0), (3, "arousal", 1), (4, "arousal", 2)]
+    for measurements in received:
+        assert [(m["seq"], m["name"], m["value"]) for m in measurements] == expected
+
+
+@pytest.mark.parametrize("policy", [DROP_OLDEST, COALESCE])
+def test_aggregator_slow_worker(policy):
+    """ Test that a worker that does not read does not block the aggregator or the other workers """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        (slow, slow_sending), (fast, fast_sending) = Pipe(duplex=False), Pipe(duplex=False)
+        aggregator = Aggregator([slow_sending, fast_sending], buffer_size=4, policy=policy)
+        fast_received = ThreadPoolExecutor(1).submit(receive_all, fast)
+        for i in range(20):
+            aggregator.publish("arousal", i, LARGE)
+            aggregator.publish("cognitive_load", i, i)
+            aggregator.flush()
+            # the fast worker keeps up with the measurements
+            while aggregator.feeds[1].size:
+                time.sleep(0.001)
+        slow_feed = aggregator.feeds[0]
+        assert slow_feed.dropped > 0 and slow_feed.size <= 4
+        aggregator.close()
+        assert [m[0] for m in fast_received.result(5)] == list(range(1, 41))
+        measurements = receive_all(slow)
+    finally:
+        loop.close()
+    assert measurements[-2:] == [(39, "arousal", 19.0, LARGE), (40, "cognitive_load", 19.0, 19)]
+    assert len(measurements) < 40
+
+
+def test_worker_feed_disconnect():
+    """ Test that a worker that does not read is disconnected with the disconnect policy """
+    receiving, sending = Pipe(duplex=False)
+    feed = WorkerFeed(sending, maxsize=4, policy=DISCONNECT)
+    results = [feed.put([(i, "arousal", 0.0, LARGE)], None) for i in range(10)]
+    assert not results[-1] and feed.disconnected
+    assert not feed.put([(11, "arousal", 0.0, 0)], None)
+    assert len(receive_all(receiving)) < 10
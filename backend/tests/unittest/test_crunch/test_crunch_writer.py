@@ -0,0 +1,45 @@
+import os
+import time
+
+import pytest
+
+from crunch.writer import CsvWriter
+
+
+def read_lines(path):
+    with open(path) as csv_file:
+        return csv_file.read().splitlines()
+
+
+@pytest.mark.parametrize('batch_size', [2, 3, 10])
+def test_batched_writes(tmp_path, batch_size):
+    """ Test that rows stay buffered until a full batch is written """
+    writer = CsvWriter(str(tmp_path), flush_interval=0, batch_size=batch_size)
+    path = os.path.join(str(tmp_path), "arousal.csv")
+    for i in range(batch_size - 1):
+        writer.write("arousal.csv", [i], timestamp=i)
+    assert len(read_lines(path)) <= 1
+
+    writer.write("arousal.csv", [batch_size], timestamp=batch_size)
+    assert len(read_lines(path)) == batch_size + 1
+    writer.close()
+
+
+def test_close_and_reopen(tmp_path):
+    """ Test that close writes every row, and that the header is only written to new files """
+    path = os.path.join(str(tmp_path), "engagement.csv")
+    for i in range(2):
+        writer = CsvWriter(str(tmp_path), flush_interval=0, batch_size=100)
+        writer.write("engagement.csv", [1.0, 2.0], header_features=["amplitude"], timestamp=10.0)
+        writer.close()
+
+    assert read_lines(path) == ["time,value,amplitude", "10.0,1.0,2.0", "10.0,1.0,2.0"]
+
+
+def test_flush_interval(tmp_path):
+    """ Test that the background thread flushes rows that are left in the buffer """
+    writer = CsvWriter(str(tmp_path), flush_interval=0.01, batch_size=100)
+    writer.write("stress.csv", [1.0], timestamp=1.0)
+    time.sleep(0.2)
+    assert read_lines(os.path.join(str(tmp_path), "stress.csv")) == ["time,value", "1.0,1.0"]
+    writer.close()
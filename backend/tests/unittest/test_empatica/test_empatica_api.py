@@ -1,8 +1,11 @@
+import asyncio
 import random
+from unittest.mock import patch
 
 import pytest
 
-from crunch.empatica.api import EmpaticaAPI
+from crunch.empatica.api import (DeviceError, EmpaticaAPI, configured_devices,
+                                 connect_devices)
 
 
 class MockSubscriber():
@@ -28,3 +31,196 @@ def test_empatica_api(expected, type):
         api._send_data_to_subscriber(type, wristband_fixture)
 
     assert mock_subscriber.nr_points_received == expected
+
+
+def test_empatica_api_instances():
+    """ Test that every api has its own wristband and subscribers """
+    first, second = EmpaticaAPI("AAAAAA"), EmpaticaAPI("BBBBBB")
+    first.add_subscriber(MockSubscriber(), "EDA")
+    assert (first.deviceID, second.deviceID) == ("AAAAAA", "BBBBBB")
+    assert len(first.subscribers["EDA"]) == 1 and second.subscribers["EDA"] == []
+
+
+def test_empatica_configured_devices():
+    """ Test that a group session lists its wristbands in the config, separated by commas """
+    with patch("crunch.util.config", lambda section, key: "C13A64, 740163 ,"):
+        assert configured_devices() == ["C13A64", "740163"]
+    assert EmpaticaAPI().deviceID == configured_devices()[0]
+
+
+class FakeServer:
+    """
+    Fake E4 streaming server, replies to the commands, sends a sample line before every reply, and sends
+    samples_per_session samples once streaming, then ends the session with the line in end_session
+    """
+
+    def __init__(self, samples_per_session=5, end_session=None, devices="C13A64"):
+        self.samples_per_session = samples_per_session
+        self.end_session = end_session
+        self.devices = devices
+        self.commands = []
+        self.sessions = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.serve, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve(self, reader, writer):
+        self.sessions += 1
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line.decode().split()
+            self.commands.append(" ".join(command))
+            writer.write(b"E4_Gsr 1600000000,0 0,5\n")
+            if command[0] == "device_list":
+                writer.write(f"R device_list 1 | {self.devices} Empatica_E4\n".encode())
+            else:
+                writer.write(f"R {' '.join(command)} OK\n".encode())
+            if command == ["pause", "OFF"]:
+                for i in range(self.samples_per_session):
+                    writer.write(f"E4_Temperature {1600000000 + i} 32,{i}\n".encode())
+                if self.end_session:
+                    writer.write(self.end_session)
+                await writer.drain()
+                break
+        writer.close()
+
+
+def stream(api, server, until):
+    """ Let the api stream from the fake server until the condition is true """
+    async def scenario():
+        api.serverPort = await server.start()
+        running = asyncio.ensure_future(api.run())
+        while not until() and not running.done():
+            await asyncio.sleep(0.01)
+        api.stop()
+        await asyncio.wait_for(running, 1)
+        server.server.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+
+
+@pytest.fixture
+def api():
+    api = EmpaticaAPI()
+    api.minBackoff = 0.01
+    api.maxBackoff = 0.04
+    api.timeout = 1
+    return api
+
+
+def test_empatica_api_session(api, capsys):
+    """
+    Test that the api subscribes to the raw data that has subscribers, and that the replies are not mistaken
+    for samples
+    """
+    server = FakeServer(end_session=b"R connection lost to device C13A64\n")
+    temp, eda, hr = MockSubscriber(), MockSubscriber(), MockSubscriber()
+    api.add_subscriber(temp, "TEMP")
+    api.add_subscriber(eda, "EDA")
+    api.add_subscriber(hr, "HR")
+    api.minBackoff = 10
+    stream(api, server, until=lambda: api.lost is not None)
+
+    assert server.commands[:7] == ["device_list", "device_connect C13A64", "pause ON", "device_subscribe gsr ON",
+                                   "device_subscribe ibi ON", "device_subscribe tmp ON", "pause OFF"]
+    assert temp.nr_points_received == 5
+    # a sample line is sent before each of the 7 replies
+    assert eda.nr_points_received == 7
+    assert "Lost connection to device" in capsys.readouterr().out
+
+
+def test_empatica_api_reconnect(api):
+    """ Test that the api reconnects when the server closes the connection, and the handlers keep receiving """
+    server = FakeServer()
+    temp = MockSubscriber()
+    api.add_subscriber(temp, "TEMP")
+    stream(api, server, until=lambda: temp.nr_points_received >= 15)
+
+    assert server.sessions >= 3
+    assert temp.nr_points_received >= 15
+    assert api.subscribers["TEMP"] == [temp]
+
+
+def test_empatica_api_backoff(api, capsys):
+    """ Test that the backoff doubles while the device is not available, up to the maximum backoff """
+    server = FakeServer(devices="AAAAAA")
+    stream(api, server, until=lambda: api.sessions >= 4)
+
+    out = capsys.readouterr().out
+    assert "Device not available, reconnecting in 0.01 sec" in out
+    assert "reconnecting in 0.02 sec" in out and "reconnecting in 0.04 sec" in out
+    assert "reconnecting in 0.08 sec" not in out
+
+
+class FailingSubscriber(MockSubscriber):
+    """ Mock subscriber with a bug, raises on every data point """
+
+    def add_data_point(self, data_point):
+        MockSubscriber.add_data_point(self, data_point)
+        raise ZeroDivisionError("division by zero")
+
+
+def test_empatica_api_unexpected_error(api, capsys):
+    """ Test that the api reconnects after an unexpected error in a handler """
+    server = FakeServer()
+    failing = FailingSubscriber()
+    api.add_subscriber(failing, "TEMP")
+    stream(api, server, until=lambda: api.sessions >= 3)
+
+    assert server.sessions >= 3 and failing.nr_points_received >= 2
+    assert "unexpected error in the session, reconnecting" in capsys.readouterr().out
+
+
+def test_empatica_connect_devices(capsys):
+    """ Test that an api that fails does not stop the other apis streaming in the process """
+    class FailingAPI(EmpaticaAPI):
+        async def run(self):
+            raise RuntimeError("broken")
+
+    class StreamingAPI(EmpaticaAPI):
+        streamed = False
+
+        async def run(self):
+            await asyncio.sleep(0.05)
+            self.streamed = True
+
+    streaming = StreamingAPI("BBBBBB")
+    connect_devices([FailingAPI("AAAAAA"), streaming])
+
+    assert streaming.streamed
+    assert "AAAAAA: stopped streaming, RuntimeError: broken" in capsys.readouterr().out
+
+
+def test_empatica_api_command_error(api):
+    """ Test that an error reply of the server raises a DeviceError """
+    async def scenario():
+        async def serve(reader, writer):
+            await reader.readline()
+            writer.write(b"R device_connect ERR The device requested for connection is not available.\n")
+            await writer.drain()
+
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        reader, api.writer = await asyncio.open_connection("127.0.0.1", server.sockets[0].getsockname()[1])
+        api.replies = asyncio.Queue()
+        receiving = asyncio.ensure_future(api._receive(reader))
+        try:
+            with pytest.raises(DeviceError, match="not available"):
+                await api.command("device_connect C13A64")
+        finally:
+            receiving.cancel()
+            await asyncio.wait([receiving])
+            api.writer.close()
+            server.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        loop.close()
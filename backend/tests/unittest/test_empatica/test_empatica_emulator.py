@@ -0,0 +1,174 @@
+import asyncio
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from crunch.empatica import start_empatica
+from crunch.empatica.api import EmpaticaAPI
+from crunch.empatica.emulator import E4Emulator, Recording
+
+
+class MockSubscriber():
+    """ Mock subscriber that keeps the data points it receives """
+
+    def __init__(self):
+        self.data_points = []
+
+    def add_data_point(self, data_point):
+        self.data_points.append(data_point)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def create_api(port, device="C13A64"):
+    api = EmpaticaAPI()
+    api.serverPort = port
+    api.deviceID = device
+    api.minBackoff = 0.01
+    api.timeout = 1
+    return api
+
+
+async def stream(apis, until, timeout=5):
+    """ Let the apis stream until the condition is true """
+    running = [asyncio.ensure_future(api.run()) for api in apis]
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    while not until() and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+    for api in apis:
+        api.stop()
+    await asyncio.wait_for(asyncio.gather(*running), 1)
+
+
+def test_emulator_recording():
+    """ Test that the recording has every stream, in the order of the samples """
+    recording = Recording()
+    tags = [tag for tag, _, _ in recording.samples]
+    assert {tag: tags.count(tag) for tag in set(tags)} == {
+        "E4_Gsr": 275, "E4_Temperature": 272, "E4_Bvp": 4422, "E4_Acc": 2214, "E4_Ibi": 60, "E4_Hr": 60}
+    assert recording.offsets == sorted(recording.offsets)
+    assert recording.samples[tags.index("E4_Acc")][2] == "-46 10 15"
+    assert recording.samples[tags.index("E4_Ibi")][2] == "0.515649"
+
+
+@pytest.mark.parametrize('decimal_comma', [False, True])
+def test_emulator_stream(decimal_comma):
+    """ Test that the api streams the recording from the emulator, faster than real time """
+    async def scenario():
+        emulator = E4Emulator(speed=100, decimal_comma=decimal_comma)
+        api = create_api(await emulator.start())
+        eda, temp = MockSubscriber(), MockSubscriber()
+        api.add_subscriber(eda, "EDA")
+        api.add_subscriber(temp, "TEMP")
+        await stream([api], until=lambda: len(eda.data_points) >= 40)
+        await emulator.stop()
+        return emulator, eda, temp
+
+    emulator, eda, temp = run(scenario())
+    recording = Recording()
+    expected = [float(values) for tag, _, values in recording.samples if tag == "E4_Gsr"]
+    assert eda.data_points == expected[:len(eda.data_points)]
+    assert len(temp.data_points) > 0
+    # only the subscribed streams are sent, and no samples were lost
+    assert emulator.samples_sent >= len(eda.data_points) + len(temp.data_points)
+
+
+@pytest.mark.parametrize('disconnect_mode', ["lost", "close"])
+def test_emulator_disconnect(disconnect_mode):
+    """ Test that the injected disconnects end the session, and the api reconnects """
+    async def scenario():
+        emulator = E4Emulator(speed=100, disconnect_interval=0.1, disconnect_mode=disconnect_mode)
+        api = create_api(await emulator.start())
+        eda = MockSubscriber()
+        api.add_subscriber(eda, "EDA")
+        await stream([api], until=lambda: api.sessions >= 3 and api.streaming)
+        await emulator.stop()
+        return emulator, api, eda
+
+    emulator, api, eda = run(scenario())
+    assert emulator.disconnects >= 2
+    assert api.sessions >= 3
+    assert len(eda.data_points) > 0
+
+
+def test_emulator_devices():
+    """ Test that every virtual device streams to its own client, and a device has one client at a time """
+    async def scenario():
+        emulator = E4Emulator(devices=["AAAAAA", "BBBBBB"], speed=100)
+        port = await emulator.start()
+        apis = [create_api(port, "AAAAAA"), create_api(port, "BBBBBB")]
+        subscribers = [MockSubscriber(), MockSubscriber()]
+        for api, subscriber in zip(apis, subscribers):
+            api.add_subscriber(subscriber, "EDA")
+        await stream(apis, until=lambda: all(len(subscriber.data_points) >= 10 for subscriber in subscribers))
+
+        # a second client of a connected device is refused
+        emulator.connected["AAAAAA"] = object()
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"device_list\r\ndevice_connect AAAAAA\r\n")
+        replies = [await reader.readline(), await reader.readline()]
+        writer.close()
+        await emulator.stop()
+        return subscribers, replies
+
+    subscribers, replies = run(scenario())
+    assert all(len(subscriber.data_points) >= 10 for subscriber in subscribers)
+    assert replies[0] == b"R device_list 1 | BBBBBB Empatica_E4\n"
+    assert replies[1].startswith(b"R device_connect ERR")
+
+
+class GroupAPI(EmpaticaAPI):
+    """ Api of a group session, stops once it has received samples samples """
+    port = None
+    samples = 50
+    instances = []
+
+    def __init__(self, device_id=None):
+        EmpaticaAPI.__init__(self, device_id)
+        self.serverPort = self.port
+        self.minBackoff = 0.01
+        self.timeout = 1
+        self.instances.append(self)
+
+    def _receive_sample(self, name, timestamp, data):
+        EmpaticaAPI._receive_sample(self, name, timestamp, data)
+        if self.parser.samples >= self.samples:
+            self.stop()
+
+
+def test_emulator_group_session():
+    """ Test that start_empatica streams 8 wristbands in one process, each with its own handlers """
+    devices = [f"{i:06X}" for i in range(8)]
+    emulator = E4Emulator(devices=devices, speed=200)
+    loop = asyncio.new_event_loop()
+    GroupAPI.port = loop.run_until_complete(emulator.start())
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    try:
+        with patch("crunch.util.write_csv", lambda *args, **kwargs: None):
+            start_empatica(GroupAPI, device_ids=devices)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.run_until_complete(emulator.stop())
+        loop.close()
+
+    apis = GroupAPI.instances
+    assert [api.deviceID for api in apis] == devices
+    assert all(api.parser.samples >= GroupAPI.samples for api in apis)
+    for api in apis:
+        handlers = {name: [handler for group in subscribers for handler in getattr(group, "handlers", [group])]
+                    for name, subscribers in api.subscribers.items()}
+        assert sum(len(name_handlers) for name_handlers in handlers.values()) == 7
+        assert all(handler.measurement_path.startswith(api.deviceID + "_")
+                   for name_handlers in handlers.values() for handler in name_handlers
+                   if getattr(handler, "measurement_path", None))
+        assert all(handler.data_counter > 0 for handler in handlers["EDA"])
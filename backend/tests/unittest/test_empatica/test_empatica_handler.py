@@ -1,8 +1,14 @@
+import os
 import random
+from unittest.mock import patch
 
+import numpy as np
+import pandas as pd
 import pytest
 
-from crunch.empatica.handler import DataHandler
+from crunch.empatica.handler import BeatDetector, DataHandler, MotionArtifacts
+
+MOCK_DATA = os.path.join(os.path.dirname(__file__), "../../mock_data/")
 
 
 @pytest.fixture(scope="module")
@@ -27,3 +33,66 @@ def test_empatica_handler(wristband_fixture, window, baseline):
 
     assert handler.baseline != 0
     assert handler._handle_datapoint == handler._calculate_measurement
+
+
+class IntervalSubscriber:
+    def __init__(self):
+        self.intervals = []
+
+    def add_data_point(self, interval):
+        self.intervals.append(interval)
+
+
+def test_beat_detector():
+    """ Test that the beat to beat intervals detected in the pulse agree with the intervals of the wristband """
+    bvp = pd.read_csv(MOCK_DATA + "BVP.csv", skiprows=2, header=None)[0].to_numpy()
+    recorded = pd.read_csv(MOCK_DATA + "IBI.csv")
+    block = np.column_stack((np.arange(len(bvp)) / 64, bvp))
+    # the wristband recorded the intervals of a part of the pulse only, from the beat before the first interval
+    times, ibi = recorded.iloc[:, 0].to_numpy(), recorded["IBI"].to_numpy()
+    block = block[(block[:, 0] >= times[0] - ibi[0] - 0.2) & (block[:, 0] <= times[-1] + 0.2)]
+    detector = BeatDetector(measurement_path="beat_to_beat.csv")
+    subscriber = IntervalSubscriber()
+    detector.add_subscriber(subscriber)
+    with patch("crunch.util.publish") as publish:
+        for i in range(0, len(block), 16):
+            detector.add_data_block(block[i:i + 16])
+
+    assert abs(len(subscriber.intervals) - len(ibi)) <= 0.1 * len(ibi)
+    assert abs(np.median(subscriber.intervals) - np.median(ibi)) < 0.02
+    assert publish.call_count == len(subscriber.intervals)
+
+
+def test_motion_artifacts_gate():
+    """ Test that the gate holds back the windows that overlap the motion of the wristband """
+    artifacts = MotionArtifacts(fq=32)
+    gated = DataHandler(measurement_func=lambda *args: 1, window_length=8, window_step=1, baseline_length=100,
+                        gate=artifacts.gate(fq=4))
+    still = np.tile([0.0, 0, 0, 64], (32, 1))
+    still[:, 0] = np.arange(32) / 32
+    shaking = still + [[0, 0, 0, 32], [0, 0, 0, -32]] * 16
+    gated_windows = []
+    for second, block in enumerate([still, still, shaking, still, still, still, still]):
+        artifacts.add_data_block(block + [second, 0, 0, 0])
+        for _ in range(4):
+            gated.add_data_point(1.0)
+        gated_windows.append(gated.gated_windows)
+
+    # the windows are two seconds, they overlap the motion until two seconds after it
+    assert gated_windows[:2] == [0, 0] and gated_windows[2] == 4
+    assert gated_windows[4] == gated_windows[5] == gated_windows[6] < 16
+
+
+def test_gated_baseline():
+    """ Test that the baseline waits for a window the gate lets through """
+    moving = [True]
+    handler = DataHandler(measurement_func=lambda *args: 2, window_length=2, window_step=2, baseline_length=4,
+                          gate=lambda handler: not moving[0])
+    for i in range(6):
+        handler.add_data_point(1.0)
+    assert handler.baseline is None and handler._handle_datapoint == handler._calculate_baseline
+
+    moving[0] = False
+    for i in range(2):
+        handler.add_data_point(1.0)
+    assert handler.baseline == [2] and handler._handle_datapoint == handler._calculate_measurement
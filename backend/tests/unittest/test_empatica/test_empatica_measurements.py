@@ -1,5 +1,6 @@
 import os
 
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -7,7 +8,8 @@ from crunch.empatica.measurements import (compute_arousal,
                                           compute_emotional_regulation,
                                           compute_engagement,
                                           compute_entertainment,
-                                          compute_stress)
+                                          compute_stress, detect_beats,
+                                          detect_motion)
 
 
 @pytest.fixture(scope="module")
@@ -57,3 +59,25 @@ def test_emotional_regulation(empatica_fixture, index):
     measurement = compute_emotional_regulation(data)
 
     assert type(float(sum(measurement))) == float
+
+
+@pytest.mark.parametrize('rate', [50, 75, 120])
+def test_detect_beats(rate):
+    """ Test that a beat is found for every period of a pulse, also with a dicrotic notch """
+    t = np.arange(10 * 64) / 64
+    phase = 2 * np.pi * t * rate / 60
+    bvp = np.sin(phase) + 0.3 * np.sin(2 * phase)
+    beats = detect_beats(bvp, 64)
+
+    assert abs(len(beats) - 10 * rate / 60) <= 1
+    assert np.allclose(np.diff(beats) / 64, 60 / rate, atol=2 / 64)
+
+
+def test_detect_motion():
+    """ Test that the data points are flagged while the acceleration changes, and not when it is still """
+    still = np.tile([0, 0, 64], (64, 1))
+    shaking = still[:32] + np.array([[0, 0, 32], [0, 0, -32]] * 16)
+    flags = detect_motion(np.concatenate((still, shaking, still)), 32)
+
+    assert len(flags) == 160 - 32
+    assert not flags[:32].any() and flags[40:64].all() and not flags[-32:].any()
@@ -0,0 +1,115 @@
+import socket
+
+import numpy as np
+import pytest
+
+from crunch.empatica.parser import STREAMS, StreamParser
+
+
+@pytest.fixture
+def parsed():
+    """ A parser dispatching every stream, and the samples and messages it has parsed """
+    samples = []
+    messages = []
+    dispatch = {tag: (lambda name: lambda *sample: samples.append((name,) + sample))(name)
+                for tag, name in STREAMS.items()}
+    return StreamParser(dispatch, on_message=messages.append, buffer_size=64), samples, messages
+
+
+def test_parser_samples(parsed):
+    """ Test that the sample lines are dispatched by their tag, with the timestamp and the values """
+    parser, samples, _ = parsed
+    parser.feed(b"E4_Gsr 1600000000.25 0.213\r\nE4_Acc 1600000000.5 51 -2 -10\nE4_Ibi 1600000001 0.8\n")
+    assert samples == [("EDA", 1600000000.25, 0.213), ("ACC", 1600000000.5, 51, -2, -10),
+                       ("IBI", 1600000001, 0.8)]
+    assert parser.samples == 3
+
+
+def test_parser_decimal_comma(parsed):
+    """ Test that the decimal commas of some locales are parsed """
+    parser, samples, _ = parsed
+    parser.feed(b"E4_Temperature 1600000000,125 32,47\n")
+    assert samples == [("TEMP", 1600000000.125, 32.47)]
+
+
+def test_parser_split_lines(parsed):
+    """ Test that a line split between receives is parsed once the rest arrives """
+    parser, samples, _ = parsed
+    data = b"E4_Hr 1600000000.0 124.5\nE4_Gsr 1600000000.1 0.8\n" * 3
+    for i in range(len(data)):
+        parser.feed(data[i:i + 1])
+    assert samples == [("HR", 1600000000.0, 124.5), ("EDA", 1600000000.1, 0.8)] * 3
+    assert parser.length == 0
+
+
+def test_parser_messages(parsed):
+    """ Test that the responses to commands are passed to on_message, not to the streams """
+    parser, samples, messages = parsed
+    parser.feed(b"R device_subscribe gsr OK\nE4_Gsr 1600000000 0.5\nR device_list 1 | 9ff167 Empatica_E4\n")
+    assert messages == [b"R device_subscribe gsr OK", b"R device_list 1 | 9ff167 Empatica_E4"]
+    assert samples == [("EDA", 1600000000, 0.5)]
+
+
+def test_parser_malformed(parsed):
+    """ Test that a malformed sample line is counted and skipped """
+    parser, samples, _ = parsed
+    parser.feed(b"E4_Gsr 1600000000 nan?\nE4_Gsr\nE4_Gsr 1600000000 0.5\n")
+    assert samples == [("EDA", 1600000000, 0.5)]
+    assert parser.malformed == 2
+
+
+def test_parser_field_count(parsed):
+    """ Test that a sample line with too few or too many values for its stream is counted and skipped """
+    parser, samples, _ = parsed
+    parser.feed(b"E4_Gsr 1600000000.2\nE4_Gsr 1600000000.2 0.5 0.6\nE4_Acc 1600000000 51 -2\n"
+                b"E4_Hr 1600000000 60\n")
+    assert samples == [("HR", 1600000000, 60)]
+    assert parser.malformed == 3 and parser.samples == 1
+
+
+def test_parser_field_count_blocks():
+    """ Test that a block sample with the wrong number of values is skipped, whichever sample it is """
+    blocks = []
+    parser = StreamParser({}, blocks={b"E4_Bvp": blocks.append})
+    parser.feed(b"E4_Bvp 1600000000 1.5 2.5\nE4_Bvp 1600000000.015625 2.25\nE4_Bvp 1600000000.03125\n")
+    assert [block.tolist() for block in blocks] == [[[1600000000.015625, 2.25]]]
+    assert parser.malformed == 2
+
+
+def test_parser_long_line(parsed):
+    """ Test that a line longer than the buffer is dropped, and the next line is still parsed """
+    parser, samples, messages = parsed
+    parser.feed(b"R " + b"x" * 100 + b"\nE4_Hr 1600000000 60\n")
+    assert samples == [("HR", 1600000000, 60)]
+    assert messages == []
+    assert parser.dropped_bytes == 103
+
+
+def test_parser_receive(parsed):
+    """ Test that the parser receives from a socket into its buffer """
+    parser, samples, _ = parsed
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        sender.sendall(b"E4_Bvp 1600000000 -0.5\nE4_Bvp 16000")
+        assert parser.receive(receiver) > 0
+        sender.sendall(b"00000.25 1.5\n")
+        parser.receive(receiver)
+        sender.close()
+        assert parser.receive(receiver) == 0
+    assert samples == [("BVP", 1600000000, -0.5), ("BVP", 1600000000.25, 1.5)]
+
+
+def test_parser_blocks():
+    """ Test that the samples of the block streams received at once are parsed into one array """
+    samples, blocks = [], []
+    parser = StreamParser({b"E4_Gsr": lambda *sample: samples.append(sample)}, on_message=samples.append,
+                          blocks={b"E4_Bvp": blocks.append, b"E4_Acc": blocks.append})
+    parser.feed(b"E4_Bvp 1600000000,0 -1,5\nE4_Gsr 1600000000 0.5\nE4_Acc 1600000000 51 -2 -10\n"
+                b"E4_Bvp 1600000000.015625 2.25\nE4_Bvp 1600000000.03125 x\nE4_Acc 1600000000.03125 50 -2 -")
+    assert samples == [(1600000000, 0.5)]
+    assert [block.tolist() for block in blocks] == [[[1600000000, -1.5], [1600000000.015625, 2.25]],
+                                                    [[1600000000, 51, -2, -10]]]
+    assert parser.samples == 4 and parser.malformed == 1
+
+    parser.feed(b"10\n")
+    assert np.array_equal(blocks[-1], [[1600000000.03125, 50, -2, -10]])
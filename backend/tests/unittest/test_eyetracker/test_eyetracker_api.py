@@ -1,6 +1,8 @@
 import pytest
 
 from crunch.eyetracker.api import EyetrackerAPI
+from crunch.eyetracker.fixation import (DispersionFixationdata,
+                                        GazedataToFixationdata)
 
 
 class MockSubscriber:
@@ -15,7 +17,7 @@ class MockSubscriber:
 def raw_gaze_fixture():
     def _gaze_fixture_factory(index, move_left=0):
         return {
-            'device_time_stamp': 312133244857 + index*100000/120,
+            'device_time_stamp': 312133244857 + index*1000000/120,
             'left_pupil_diameter': 0.5,
             'left_gaze_point_on_display_area': (0.753740668296814 - move_left, -0.11630667001008987),
             'right_gaze_point_on_display_area': (1.1366922855377197 - move_left, -0.03179898485541344),
@@ -32,6 +34,8 @@ def test_gaze(raw_gaze_fixture, expected):
     api.add_subscriber(mock_subscriber, "gaze")
     for i in range(expected):
         api.gaze_data_callback(raw_gaze_fixture(i))
+    assert mock_subscriber.nr_points_received == 0
+    assert api.process_pending() == expected
 
     assert mock_subscriber.nr_points_received == expected
 
@@ -47,5 +51,46 @@ def test_fixation(raw_gaze_fixture, expected, move_gaze_index):
         if i in move_gaze_index:
             move_eye_left += 3
         api.gaze_data_callback(raw_gaze_fixture(i, move_eye_left))
+    api.process_pending()
 
     assert mock_subscriber.nr_points_received == expected
+
+
+def test_fixation_detector():
+    """ Test that the fixation detector is selected by name """
+    assert type(EyetrackerAPI().gaze_to_fixation) is GazedataToFixationdata
+    assert type(EyetrackerAPI(fixation_detector="idt").gaze_to_fixation) is DispersionFixationdata
+
+
+def test_processing_thread(raw_gaze_fixture):
+    """ Test that the processing thread sends the gaze samples queued by the callback """
+    mock_subscriber = MockSubscriber()
+    api = EyetrackerAPI()
+    api.add_subscriber(mock_subscriber, "gaze")
+    api.start_processing()
+    for i in range(1000):
+        api.gaze_data_callback(raw_gaze_fixture(i))
+    api.stop_processing()
+
+    assert mock_subscriber.nr_points_received == 1000
+    assert api.gaze_ring.stats() == {"occupancy": 0, "high_watermark": api.gaze_ring.high_watermark, "dropped": 0}
+
+
+class MockEyetracker:
+    """ Mock eyetracker of tobii_research, with the gaze output frequencies of a Tobii Pro Spectrum """
+    frequency = 150.0
+
+    def get_all_gaze_output_frequencies(self):
+        return 150.0, 300.0, 600.0, 1200.0
+
+    def set_gaze_output_frequency(self, frequency):
+        self.frequency = frequency
+
+
+@pytest.mark.parametrize('frequency, supported', [(1200, True), (300, True), (120, False)])
+def test_gaze_output_frequency(frequency, supported):
+    """ Test that the eyetracker is set to the frequency of the api, if it supports it """
+    eyetracker = MockEyetracker()
+    api = EyetrackerAPI(frequency=frequency)
+    assert api.set_gaze_output_frequency(eyetracker) == supported
+    assert eyetracker.frequency == (frequency if supported else 150)
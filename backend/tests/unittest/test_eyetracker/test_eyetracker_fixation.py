@@ -0,0 +1,225 @@
+from math import nan
+
+import numpy as np
+import pytest
+
+from crunch.eyetracker.fixation import (FIXATION, GAP, SACCADE,
+                                        DispersionFixationdata,
+                                        GazedataToFixationdata, binocular,
+                                        detect_fixations)
+
+# microseconds between the gaze samples at 120 Hz
+STEP = 1000000 / 120
+
+
+def insert(detector, points, start=0):
+    """ Insert gaze points (fx, fy) for both eyes, 120 a second, returns the fixation points """
+    fixations = []
+    for i, (fx, fy) in enumerate(points):
+        fixation = detector.insert_new_gaze_data(fx, fy, fx, fy, (start + i) * STEP)
+        if fixation is not None:
+            fixations.append(fixation)
+    return fixations
+
+
+def test_binocular():
+    assert binocular(0.2, 0.4) == pytest.approx(0.3)
+    assert binocular(nan, 0.4) == 0.4 and binocular(0.2, nan) == 0.2
+    assert binocular(nan, nan) != binocular(nan, nan)
+
+
+def test_fixation():
+    """ Test that a fixation is ended by a saccade, with the average gaze point and its start and end times """
+    detector = GazedataToFixationdata()
+    fixations = insert(detector, [(0.5, 0.5)] * 10 + [(0.1, 0.1)] + [(0.1, 0.1)] * 2 + [(0.9, 0.9)])
+
+    assert len(fixations) == 1
+    assert fixations[0] == pytest.approx({"initTime": STEP / 1000, "endTime": 9 * STEP / 1000,
+                                          "fx": 960, "fy": 540})
+    # the gaze points after the first saccade were too few to be a fixation
+    assert detector.state == SACCADE and detector.count == 0
+
+
+def test_short_gap():
+    """ Test that a blink shorter than max_gap is bridged when the eyes return to the fixation """
+    detector = GazedataToFixationdata(max_gap=75)
+    fixations = insert(detector, [(0.5, 0.5)] * 5 + [(nan, nan)] * 6 + [(0.5, 0.5)] * 5 + [(0.9, 0.9)])
+
+    assert len(fixations) == 1
+    assert fixations[0]["initTime"] == pytest.approx(STEP / 1000)
+    assert fixations[0]["endTime"] == pytest.approx(15 * STEP / 1000)
+
+
+def test_long_gap():
+    """ Test that a blink longer than max_gap ends the fixation, and the gaze after it starts a new one """
+    detector = GazedataToFixationdata(max_gap=75)
+    points = [(0.5, 0.5)] * 5 + [(nan, nan)] * 30 + [(0.5, 0.5)] * 5
+    fixations = []
+    for i, (fx, fy) in enumerate(points):
+        fixation = detector.insert_new_gaze_data(fx, fy, fx, fy, i * STEP)
+        if fixation is not None:
+            fixations.append((i, fixation))
+        assert detector.state == (GAP if 5 <= i < 35 else FIXATION if i not in (0, 35) else SACCADE)
+
+    # the fixation is published during the blink, once it is longer than max_gap
+    assert [i for i, _ in fixations] == [14]
+    assert fixations[0][1]["endTime"] == pytest.approx(4 * STEP / 1000)
+    assert detector.count == 4 and detector.start == 36 * STEP
+
+
+def test_max_fixation():
+    """ Test that a long fixation is published every max_fixation milliseconds """
+    detector = GazedataToFixationdata(max_fixation=1000)
+    fixations = insert(detector, [(0.5, 0.5)] * 600)
+
+    assert len(fixations) == 4
+    assert all(fixation["endTime"] - fixation["initTime"] <= 1000 for fixation in fixations)
+    assert all(b["initTime"] > a["endTime"] for a, b in zip(fixations, fixations[1:]))
+
+
+def test_duplicate_timestamps():
+    """ Test that gaze samples with the timestamp of the previous sample are skipped """
+    detector = GazedataToFixationdata()
+    for i in range(10):
+        detector.insert_new_gaze_data(0.5, 0.5, 0.5, 0.5, i // 2 * STEP)
+    assert detector.skipped == 5 and detector.count == 4
+
+
+def test_constant_state():
+    """ Test that the state of the detector does not grow over a long session with blinks """
+    detector = GazedataToFixationdata(max_fixation=10 ** 9)
+    points = ([(0.5, 0.5)] * 100 + [(nan, nan)] * 3) * 100
+    assert insert(detector, points) == []
+    # every gaze point but the first, which has no velocity, is in the fixation
+    assert detector.count == 100 * 100 - 1
+    assert all(isinstance(value, (int, float, type(None))) for value in vars(detector).values())
+
+
+def recorded_gaze(seed, n=6000):
+    """ Random gaze with fixations, saccades, blinks, one lost eye and duplicate timestamps """
+    random = np.random.default_rng(seed)
+    targets = np.repeat(random.random((n // 20, 2)), random.integers(1, 40, n // 20), axis=0)[:n]
+    gaze = targets + random.normal(0, 0.0002, targets.shape)
+    left, right = gaze.copy(), gaze.copy()
+    for start in random.integers(0, len(gaze), 40):
+        left[start:start + random.integers(1, 30)] = nan
+        right[start:start + random.integers(1, 30)] = nan
+    timestamps = np.cumsum(random.choice([0, STEP, STEP, STEP, 2 * STEP], len(gaze)))
+    return left[:, 0], left[:, 1], right[:, 0], right[:, 1], timestamps
+
+
+@pytest.mark.parametrize('seed, max_gap, max_fixation', [(1, 75, 3000), (2, 20, 100), (3, 200, 50)])
+def test_detect_fixations(seed, max_gap, max_fixation):
+    """ Test that the recorded gaze gives the fixation points of the detector the gaze is inserted in """
+    gaze = recorded_gaze(seed)
+    detector = GazedataToFixationdata(max_gap=max_gap, max_fixation=max_fixation)
+    streamed = [detector.insert_new_gaze_data(*sample) for sample in zip(*gaze)]
+    streamed = [fixation for fixation in streamed if fixation is not None]
+    batch = detect_fixations(*gaze, max_gap=max_gap, max_fixation=max_fixation)
+
+    assert len(streamed) > 20
+    assert batch == [pytest.approx(fixation) for fixation in streamed]
+
+
+@pytest.mark.parametrize('ending', [[(nan, nan)] * 20, [(nan, nan)] * 2, [(0.9, 0.9)]])
+def test_detect_fixations_ending(ending):
+    """ Test that the last fixation is only detected when the recording ends with a saccade or a long gap """
+    points = np.array([(0.5, 0.5)] * 10 + ending)
+    detector = GazedataToFixationdata()
+    streamed = insert(detector, points)
+    batch = detect_fixations(points[:, 0], points[:, 1], points[:, 0], points[:, 1], np.arange(len(points)) * STEP)
+
+    assert batch == [pytest.approx(fixation) for fixation in streamed]
+    assert len(batch) == (len(ending) != 2)
+
+
+def test_detect_fixations_without_gaze():
+    assert detect_fixations([], [], [], [], []) == []
+    assert detect_fixations([nan], [nan], [nan], [nan], [0]) == []
+
+
+def test_dispersion_fixation():
+    """ Test that gaze points within the dispersion threshold for min_fixation are a fixation """
+    detector = DispersionFixationdata(dispersion_threshold=50, min_fixation=100)
+    random = np.random.default_rng(0)
+    # 300 milliseconds of gaze spread 20 pixels, and 300 milliseconds 200 pixels to the right
+    points = [(0.5, 0.5)] * 36 + [(0.6, 0.5)] * 36
+    points = np.array(points) + random.uniform(-10, 10, (72, 2)) / (1920, 1080)
+    fixations = insert(detector, points.tolist() + [(0.1, 0.1)])
+
+    assert len(fixations) == 2
+    assert fixations[0]["initTime"] == 0 and fixations[0]["endTime"] == pytest.approx(35 * STEP / 1000)
+    assert fixations[0]["fx"] == pytest.approx(960, abs=5) and fixations[1]["fx"] == pytest.approx(1152, abs=5)
+    assert detector.state == SACCADE and len(detector.window) == 1
+
+
+def test_dispersion_sliding_window():
+    """ Test that the monotonic deques give the spread of the sliding window while the gaze is dispersed """
+    detector = DispersionFixationdata(dispersion_threshold=300, min_fixation=100)
+    random = np.random.default_rng(1)
+    for i, (fx, fy) in enumerate(random.random((2000, 2)) * 0.3):
+        assert detector.insert_new_gaze_data(fx, fy, fx, fy, i * STEP) is None
+        if detector.state == FIXATION:
+            # only the sliding window is checked
+            detector._end()
+            continue
+        window = np.array(detector.window)
+        max_x, max_y, min_x, min_y = (extremes[0][1] for extremes in detector.extremes)
+        assert (max_x, max_y, -min_x, -min_y) == (window[:, 1].max(), window[:, 2].max(),
+                                                  window[:, 1].min(), window[:, 2].min())
+        assert np.ptp(window[:, 1]) + np.ptp(window[:, 2]) <= 300
+        assert window[-1, 0] - window[0, 0] < 100 * 1000
+
+
+def test_dispersion_gaps():
+    """ Test that a long blink ends a dispersion fixation, and the longest fixation splits it """
+    detector = DispersionFixationdata(min_fixation=100, max_gap=75, max_fixation=1000)
+    fixations = insert(detector, [(0.5, 0.5)] * 30 + [(nan, nan)] * 4 + [(0.5, 0.5)] * 30 + [(nan, nan)] * 20)
+    assert [(fixation["initTime"], round(fixation["endTime"], 3)) for fixation in fixations] == \
+        [(0, round(63 * STEP / 1000, 3))]
+    assert detector.state == GAP and not detector.window and detector.count == 0
+
+    fixations = insert(detector, [(0.5, 0.5)] * 300, start=100)
+    assert len(fixations) == 2
+
+
+def gaze_trace(rate, seconds=6, seed=0):
+    """
+    The same gaze trace sampled at the rate: fixations of 150 to 400 milliseconds, saccades of 1 millisecond
+    across the screen, and half of them with a pause of 10 milliseconds halfway
+    """
+    random = np.random.default_rng(seed)
+    times, points = [0.0], [(0.15, 0.5)]
+    while times[-1] < seconds * 1000:
+        target = (0.85 - (points[-1][0] > 0.5) * 0.7 + random.uniform(-0.05, 0.05), random.random())
+        times.append(times[-1] + random.uniform(150, 400))
+        points.append(points[-1])
+        if random.random() < 0.5:
+            halfway = tuple((a + b) / 2 for a, b in zip(points[-1], target))
+            times += [times[-1] + 1, times[-1] + 11]
+            points += [halfway, halfway]
+        times.append(times[-1] + 1)
+        points.append(target)
+    t = np.arange(int(seconds * rate)) * 1000 / rate
+    points = np.array(points)
+    fx, fy = np.interp(t, times, points[:, 0]), np.interp(t, times, points[:, 1])
+    return fx, fy, fx, fy, t * 1000
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_fixations_independent_of_frequency(seed):
+    """ Test that the same gaze trace gives the same fixations at 120 and 1200 Hz """
+    fixations = {}
+    for rate in (120, 1200):
+        detector = GazedataToFixationdata()
+        fixations[rate] = [fixation for fixation in map(detector.insert_new_gaze_data, *gaze_trace(rate, seed=seed))
+                           if fixation is not None]
+
+    assert len(fixations[120]) == len(fixations[1200]) > 15
+    for slow, fast in zip(fixations[120], fixations[1200]):
+        # the fixations start and end within two gaze samples at 120 Hz, one may be the start of the saccade
+        assert slow["initTime"] == pytest.approx(fast["initTime"], abs=2 * STEP / 1000)
+        assert slow["endTime"] == pytest.approx(fast["endTime"], abs=2 * STEP / 1000)
+        assert slow["fx"] == pytest.approx(fast["fx"], abs=50) and slow["fy"] == pytest.approx(fast["fy"], abs=50)
+    # the pauses in the saccades last 12 gaze samples at 1200 Hz, they are too short to be fixations
+    assert len(detect_fixations(*gaze_trace(1200, seed=seed), min_velocity_fixation=0)) > len(fixations[1200])
@@ -1,7 +1,9 @@
 import numpy as np
 import pytest
+import pywt
 
-from crunch.eyetracker.measurements import (compute_anticipation,
+from crunch.eyetracker.measurements import (CognitiveLoad,
+                                            compute_anticipation,
                                             compute_cognitive_load,
                                             compute_ipi,
                                             compute_perceived_difficulty,
@@ -40,3 +42,45 @@ def test_compute_cognitive_load(gaze_fixture):
 
 def test_compute_perceived_difficulty(fixation_fixture):
     assert compute_perceived_difficulty(**fixation_fixture) > 0
+
+
+def pupil_sizes(n, seed=0):
+    random = np.random.default_rng(seed)
+    return random.random(n) * 2 + 4, random.random(n) * 2 + 4
+
+
+@pytest.mark.parametrize('window_length, steps, reused', [(1000, [250] * 6 + [100, 100, 1000, 3, 250], 10),
+                                                          (10000, [2500] * 3, 3),
+                                                          (999, [250] * 3, 0)])
+def test_cognitive_load_engine(window_length, steps, reused):
+    """ Test that the engine gives the cognitive load of compute_cognitive_load for sliding windows """
+    lpup, rpup = pupil_sizes(window_length + sum(steps))
+    engine = CognitiveLoad()
+    start = 0
+    for step in [0] + steps:
+        start += step
+        window = slice(start, start + window_length)
+        assert engine(lpup[window], rpup[window]) == compute_cognitive_load(lpup[window], rpup[window])
+    # the windows that overlap the last window by at least half reuse its coefficients, the odd window never does
+    assert engine.reused_windows == reused
+
+
+def test_cognitive_load_details():
+    """ Test that the detail coefficients read from the stream are the coefficients of the periodized transform """
+    engine = CognitiveLoad()
+    d = np.concatenate(pupil_sizes(1500))
+    for start in (0, 250, 500):
+        window = d[start:start + 1000]
+        layout = engine._layout(len(window))
+        cD_H, cD_L = engine._details(window, layout)
+        assert np.allclose(cD_H, pywt.downcoef("d", window, engine.wavelet, "per", level=1))
+        assert np.allclose(cD_L, pywt.downcoef("d", window, engine.wavelet, "per", level=layout["lof"]))
+
+
+def test_cognitive_load_frequency():
+    """ Test that the cognitive load is per second of pupil sizes, at the frequency of the eyetracker """
+    lpup, rpup = pupil_sizes(10000)
+    load = compute_cognitive_load(lpup, rpup, fq=1200)
+    assert CognitiveLoad(fq=1200)(lpup, rpup) == load
+    # the pupil sizes last ten times longer at 120 Hz
+    assert compute_cognitive_load(lpup, rpup) == pytest.approx(load / 10)
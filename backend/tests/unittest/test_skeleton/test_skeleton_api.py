@@ -25,4 +25,5 @@ def test_skeleton_api(expected):
         datum = DatumMock()
         api.add_datapoint([datum])
 
+    assert api.process_pending() == expected
     assert mock_subscriber.nr_points_received == expected
@@ -8,6 +8,8 @@ import MeasurementList from './MeasurementList';
 const MainContent = () => {
   // Websocket & connection
   const webSocket = useRef(null);
+  // Sequence number of the last measurement received, to resume from after a reconnect
+  const lastSeq = useRef(null);
   const [connectionError, setError] = useState('');
   const [ip, setIP] = useState(null);
   const [wsStatus, setStatus] = useState(3);
@@ -121,21 +123,54 @@ const MainContent = () => {
     return copy.charAt(0).toUpperCase() + copy.slice(1);
   }
 
-  const receiveMessage = (message) => {
-    try {
-      const measurement = JSON.parse(message.data)[0];
-      if (specialMeasurements.includes(convertSnakeCase(measurement.name))) {
-        const dataPoint = { value: measurement.value, time: measurement.time };
-        handleAdd(convertSnakeCase(measurement.name), dataPoint);
-        handleSpecialStats(convertSnakeCase(measurement.name), dataPoint.value);
+  function decodeBinaryFrame(buffer) {
+    // Binary frames, see crunch/websocket/encoding.py in the backend
+    const view = new DataView(buffer);
+    const decoder = new TextDecoder();
+    const measurements = [];
+    let offset = 2;
+    for (let i = 0; i < view.getUint16(0, true); i += 1) {
+      const seq = Number(view.getBigUint64(offset, true));
+      const time = new Date(view.getFloat64(offset + 8, true) * 1000);
+      const nameLength = view.getUint8(offset + 16);
+      const name = decoder.decode(new Uint8Array(buffer, offset + 17, nameLength));
+      offset += 17 + nameLength;
+      let value;
+      if (view.getUint8(offset) === 1) {
+        const textLength = view.getUint16(offset + 1, true);
+        value = decoder.decode(new Uint8Array(buffer, offset + 3, textLength));
+        offset += 3 + textLength;
       } else {
-        const dataPoint = {
-          value: parseFloat(measurement.value.toFixed(2)),
-          time: measurement.time,
-        };
-        handleAdd(convertSnakeCase(measurement.name), dataPoint);
-        handleDefaultStats(convertSnakeCase(measurement.name), dataPoint.value);
+        value = view.getFloat64(offset + 1, true);
+        offset += 9;
       }
+      measurements.push({
+        seq, name, value, time: time.toTimeString().slice(0, 8),
+      });
+    }
+    return measurements;
+  }
+
+  const receiveMessage = (message) => {
+    try {
+      // A frame holds every measurement sent since the previous frame
+      const measurements = typeof message.data === 'string'
+        ? JSON.parse(message.data) : decodeBinaryFrame(message.data);
+      measurements.forEach((measurement) => {
+        lastSeq.current = measurement.seq;
+        if (specialMeasurements.includes(convertSnakeCase(measurement.name))) {
+          const dataPoint = { value: measurement.value, time: measurement.time };
+          handleAdd(convertSnakeCase(measurement.name), dataPoint);
+          handleSpecialStats(convertSnakeCase(measurement.name), dataPoint.value);
+        } else {
+          const dataPoint = {
+            value: parseFloat(measurement.value.toFixed(2)),
+            time: measurement.time,
+          };
+          handleAdd(convertSnakeCase(measurement.name), dataPoint);
+          handleDefaultStats(convertSnakeCase(measurement.name), dataPoint.value);
+        }
+      });
     } catch (error) {
       setError(error);
     }
@@ -143,7 +178,10 @@ const MainContent = () => {
 
   useEffect(() => {
     if (ip !== null) {
-      webSocket.current = new WebSocket(`ws://${ip}/`);
+      // After a reconnect the server sends the measurements missed in between
+      const resume = lastSeq.current !== null ? `?since=${lastSeq.current}` : '';
+      webSocket.current = new WebSocket(`ws://${ip}/${resume}`);
+      webSocket.current.binaryType = 'arraybuffer';
       webSocket.current.onmessage = (message) => receiveMessage(message);
       webSocket.current.onopen = () => handleOpen();
       webSocket.current.onclose = () => setStatus(3);